@@ -1,9 +1,9 @@
 import os
 import secrets
+import tempfile
 from flask import Flask, send_from_directory
 from flask_cors import CORS
 from flask_socketio import SocketIO
-from flask_bcrypt import Bcrypt
 from models import db
 from dotenv import load_dotenv
 
@@ -21,11 +21,66 @@ def create_app():
     # Configuration
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', secrets.token_hex(32))
     
-    # Database config (SQLite default)
-    db_path = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'notes.db')
-    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', f'sqlite:///{db_path}')
+    # Database config (SQLite default); pragmas and pool sizes come from the storage profile
+    import storage
+    storage.configure(app)
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+    # Seconds between write-behind flushes of collaborative edits
+    app.config['WRITE_BEHIND_INTERVAL'] = float(os.environ.get('WRITE_BEHIND_INTERVAL', 2))
+
+    # Password hashing: werkzeug method string (e.g. scrypt:32768:8:1, pbkdf2:sha256:600000),
+    # native threads hashing concurrently, and in-flight hashes allowed before answering 429
+    app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+    app.config['PASSWORD_SALT_LENGTH'] = int(os.environ.get('PASSWORD_SALT_LENGTH', 16))
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', 4))
+    app.config['PASSWORD_HASH_QUEUE'] = int(os.environ.get('PASSWORD_HASH_QUEUE', 16))
+
+    # Cached note access levels per worker; TTL bounds how long other workers may serve a revoked share
+    app.config['PERMISSION_CACHE_SIZE'] = int(os.environ.get('PERMISSION_CACHE_SIZE', 10000))
+    app.config['PERMISSION_CACHE_TTL'] = float(os.environ.get('PERMISSION_CACHE_TTL', 30))
+
+    # Note history: seconds an autosave burst folds into one revision, revisions per snapshot,
+    # and seconds between thinning passes (0 disables the background pass)
+    app.config['REVISION_INTERVAL'] = float(os.environ.get('REVISION_INTERVAL', 60))
+    app.config['REVISION_SNAPSHOT_EVERY'] = int(os.environ.get('REVISION_SNAPSHOT_EVERY', 20))
+    app.config['REVISION_THIN_INTERVAL'] = float(os.environ.get('REVISION_THIN_INTERVAL', 3600))
+
+    # Document rooms: outbound coalescing window, per-connection edit rate (events/s and burst),
+    # and the engine.io queue depth past which a slow client stops receiving deltas
+    app.config['SOCKET_COALESCE_MS'] = float(os.environ.get('SOCKET_COALESCE_MS', 40))
+    app.config['SOCKET_EDIT_RATE'] = float(os.environ.get('SOCKET_EDIT_RATE', 30))
+    app.config['SOCKET_EDIT_BURST'] = int(os.environ.get('SOCKET_EDIT_BURST', 60))
+    app.config['SOCKET_MAX_QUEUE'] = int(os.environ.get('SOCKET_MAX_QUEUE', 100))
+
+    # Most operations one POST /api/batch request may carry
+    app.config['BATCH_MAX_OPERATIONS'] = int(os.environ.get('BATCH_MAX_OPERATIONS', 500))
+
+    # Records per transaction and per fetch when importing or exporting an account archive
+    app.config['ARCHIVE_CHUNK_SIZE'] = int(os.environ.get('ARCHIVE_CHUNK_SIZE', 500))
+
+    # Uploaded attachment files: storage directory, largest file accepted, seconds before an idle
+    # upload expires, and seconds between garbage-collection passes (0 disables the background pass)
+    app.config['ATTACHMENT_DIR'] = os.environ.get(
+        'ATTACHMENT_DIR', os.path.join(os.path.abspath(os.path.dirname(__file__)), 'attachments'))
+    app.config['ATTACHMENT_MAX_BYTES'] = int(os.environ.get('ATTACHMENT_MAX_BYTES', 100 * 1024 * 1024))
+    app.config['ATTACHMENT_UPLOAD_TTL'] = float(os.environ.get('ATTACHMENT_UPLOAD_TTL', 86400))
+    app.config['ATTACHMENT_GC_INTERVAL'] = float(os.environ.get('ATTACHMENT_GC_INTERVAL', 3600))
+
+    # Frontend assets served from memory; ASSET_PIPELINE=0 serves the files from disk as they are
+    app.config['ASSET_PIPELINE'] = os.environ.get('ASSET_PIPELINE', '1') != '0'
+    app.config['ASSET_MINIFY'] = os.environ.get('ASSET_MINIFY', '1') != '0'
+
+    # /metrics: bearer token required on scrapes when set
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN') or None
+
+    # Sampling profiler, off unless PROFILE_SLOW_MS > 0: requests slower than that are dumped
+    # as folded stacks into PROFILE_DIR, keeping the newest PROFILE_KEEP files
+    app.config['PROFILE_SLOW_MS'] = float(os.environ.get('PROFILE_SLOW_MS', 0))
+    app.config['PROFILE_INTERVAL_MS'] = float(os.environ.get('PROFILE_INTERVAL_MS', 5))
+    app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'bee-keeps-profiles'))
+    app.config['PROFILE_KEEP'] = int(os.environ.get('PROFILE_KEEP', 50))
+
     # Session cookies — auto-detect production (RENDER env var set by Render)
     is_production = os.environ.get('RENDER', False)
     app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
@@ -35,8 +90,20 @@ def create_app():
     # Initialize extensions
     CORS(app, supports_credentials=True)
     db.init_app(app)
-    bcrypt = Bcrypt(app)
-    socketio.init_app(app, cors_allowed_origins="*")
+    from passwords import hasher
+    hasher.init_app(app)
+    from permissions import permissions
+    permissions.init_app(app)
+    # Scale-out: with a message queue (redis://, amqp://, kafka://) several workers share rooms.
+    # Websocket-only transport avoids long-polling, so no sticky sessions are needed.
+    message_queue = os.environ.get('SOCKETIO_MESSAGE_QUEUE') or None
+    transports = [t.strip() for t in os.environ.get('SOCKETIO_TRANSPORTS', 'polling,websocket').split(',') if t.strip()]
+    socketio.init_app(app, cors_allowed_origins="*", message_queue=message_queue,
+                      channel=os.environ.get('SOCKETIO_CHANNEL', 'bee-keeps'), transports=transports)
+
+    # Room document state lives in Redis whenever the queue does, so every worker shares it
+    import documents
+    documents.configure(os.environ.get('DOCUMENT_STORE_URL', message_queue))
     
     # Register Blueprints
     from auth import auth_bp
@@ -47,18 +114,48 @@ def create_app():
     from sockets import register_socket_events
     register_socket_events(socketio)
 
+    from fanout import fanout
+    fanout.init_app(app, socketio)
+
+    from writebehind import write_behind
+    write_behind.init_app(app, socketio)
+
+    import revisions
+    revisions.init_app(app, socketio)
+
+    from blobs import blobs
+    blobs.init_app(app, socketio)
+
     # ── Serve Frontend Files ──
+    # Built once into memory: minified, precompressed and fingerprinted (see assets.py)
+    from assets import assets
+    if app.config['ASSET_PIPELINE']:
+        assets.build(FRONTEND_DIR, minify=app.config['ASSET_MINIFY'])
+
     @app.route('/')
     def serve_index():
-        return send_from_directory(FRONTEND_DIR, 'index.html')
+        return assets.serve('index.html') or send_from_directory(FRONTEND_DIR, 'index.html')
 
     @app.route('/<path:filename>')
     def serve_frontend(filename):
-        return send_from_directory(FRONTEND_DIR, filename)
+        return assets.serve(filename) or send_from_directory(FRONTEND_DIR, filename)
 
     with app.app_context():
-        # Create all tables
+        storage.init_app(app, db.engine)
+
+        from metrics import metrics
+        metrics.init_app(app, db.engine, socketio)
+        from profiler import profiler
+        profiler.init_app(app)
+
+        # Create all tables, then bring older databases up to the current schema
         db.create_all()
+        import migrations
+        migrations.upgrade(db.engine)
+
+        # Full-text search index (SQLite FTS5), built on first run
+        import search
+        search.init_app(app)
         
     return app
 
@@ -0,0 +1,381 @@
+"""Account export and import as an NDJSON archive, streamed in both directions.
+
+An archive has one JSON object per line, in this order:
+
+- a header: `{"type": "bee-keeps-export", "version": 1, ...}`
+- the account's labels, then its folders
+- its notes, each carrying content, label ids and attachments
+- its tasks
+- a closing `{"type": "end", "counts": {...}}`
+
+Ids in an archive are the exporting database's ids; they only link records
+within the file. Notes shared with the user belong to someone else and are not
+exported, and share lists are not exported either. Uploaded attachment files
+are referenced by checksum rather than embedded, so they only come back when
+the importing user still has the same file attached to a note of their own.
+
+Export reads through `yield_per` cursors and encodes chunk by chunk, so only
+one chunk of rows is held in memory at a time. Import reads the upload line by
+line. It writes each chunk of up to `ARCHIVE_CHUNK_SIZE` records in its own
+transaction, as set-based inserts. Bulk inserts bypass ORM events, so each
+chunk also updates the search index, change feed and workspace counters.
+Only the label and folder id maps grow with the archive.
+"""
+import gzip
+import io
+import json
+import zlib
+from datetime import date, datetime, time
+from itertools import islice
+from sqlalchemy import bindparam, insert, update
+from models import db, Folder, Note, NoteBody, Task, Label, FileAttachment, note_label, task_label
+
+FORMAT = 'bee-keeps-export'
+VERSION = 1
+CHUNK_SIZE = 500
+KINDS = ('label', 'folder', 'note', 'task')
+
+# Accepted types per record field; any field may also be missing or null
+_ID = (int, str)
+FIELDS = {
+    'label': {'id': _ID, 'name': str, 'color': str},
+    'folder': {'id': _ID, 'parent_id': _ID, 'name': str, 'created_at': str, 'updated_at': str},
+    'note': {'id': _ID, 'folder_id': _ID, 'title': str, 'content': str, 'note_type': str, 'link_url': str,
+             'labels': list, 'attachments': list, 'created_at': str, 'updated_at': str},
+    'task': {'id': _ID, 'title': str, 'description': str, 'category': str, 'due_date': str, 'due_time': str,
+             'status': str, 'is_completed': bool, 'labels': list, 'created_at': str, 'updated_at': str},
+}
+ATTACHMENT_FIELDS = {'name': str, 'url': str, 'type': str, 'blob': str, 'size': int}
+
+
+class ArchiveError(ValueError):
+    """A malformed archive; `line` is where reading stopped and `counts` what was already imported."""
+
+    def __init__(self, message, line=None, counts=None):
+        super().__init__(message)
+        self.line = line
+        self.counts = counts or {}
+
+
+def _iso(value):
+    return value.isoformat() if value is not None else None
+
+
+def _chunks(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _grouped(rows):
+    grouped = {}
+    for key, value in rows:
+        grouped.setdefault(key, []).append(value)
+    return grouped
+
+
+# --- Export ---
+def export_records(user_id, chunk_size=CHUNK_SIZE):
+    """Yield the archive's records for `user_id`, one chunk of rows in memory at a time."""
+    counts = dict.fromkeys(KINDS, 0)
+    yield {'type': FORMAT, 'version': VERSION, 'exported_at': datetime.utcnow().isoformat()}
+
+    labels = db.session.query(Label.id, Label.name, Label.color) \
+        .filter(Label.user_id == user_id).order_by(Label.id).yield_per(chunk_size)
+    for row in labels:
+        counts['label'] += 1
+        yield {'type': 'label', 'id': row.id, 'name': row.name, 'color': row.color}
+
+    folders = db.session.query(Folder.id, Folder.name, Folder.parent_id, Folder.created_at, Folder.updated_at) \
+        .filter(Folder.user_id == user_id).order_by(Folder.id).yield_per(chunk_size)
+    for row in folders:
+        counts['folder'] += 1
+        yield {'type': 'folder', 'id': row.id, 'name': row.name, 'parent_id': row.parent_id,
+               'created_at': _iso(row.created_at), 'updated_at': _iso(row.updated_at)}
+
+    notes = db.session.query(Note.id, Note.title, Note.note_type, Note.link_url, Note.folder_id,
+                             Note.created_at, Note.updated_at, NoteBody.data, NoteBody.compressed) \
+        .outerjoin(NoteBody, NoteBody.checksum == Note.body_hash) \
+        .filter(Note.user_id == user_id).order_by(Note.id).yield_per(chunk_size)
+    for batch in _chunks(notes, chunk_size):
+        ids = [row.id for row in batch]
+        labels_of = _grouped(db.session.query(note_label.c.note_id, note_label.c.label_id)
+                             .filter(note_label.c.note_id.in_(ids)))
+        attachments_of = _grouped(
+            (a.note_id, {'name': a.name, 'url': a.url, 'type': a.type, 'blob': a.blob_hash, 'size': a.size})
+            for a in db.session.query(FileAttachment.note_id, FileAttachment.name, FileAttachment.url,
+                                      FileAttachment.type, FileAttachment.blob_hash, FileAttachment.size)
+            .filter(FileAttachment.note_id.in_(ids))
+        )
+        for row in batch:
+            counts['note'] += 1
+            yield {'type': 'note', 'id': row.id, 'title': row.title, 'note_type': row.note_type,
+                   'link_url': row.link_url, 'folder_id': row.folder_id,
+                   'content': NoteBody.unpack(row.data, row.compressed) if row.data is not None else '',
+                   'labels': labels_of.get(row.id, []), 'attachments': attachments_of.get(row.id, []),
+                   'created_at': _iso(row.created_at), 'updated_at': _iso(row.updated_at)}
+
+    tasks = db.session.query(Task.id, Task.title, Task.description, Task.category, Task.due_date, Task.due_time,
+                             Task.status, Task.is_completed, Task.created_at, Task.updated_at) \
+        .filter(Task.user_id == user_id).order_by(Task.id).yield_per(chunk_size)
+    for batch in _chunks(tasks, chunk_size):
+        labels_of = _grouped(db.session.query(task_label.c.task_id, task_label.c.label_id)
+                             .filter(task_label.c.task_id.in_([row.id for row in batch])))
+        for row in batch:
+            counts['task'] += 1
+            yield {'type': 'task', 'id': row.id, 'title': row.title, 'description': row.description,
+                   'category': row.category, 'due_date': _iso(row.due_date), 'due_time': _iso(row.due_time),
+                   'status': row.status, 'is_completed': row.is_completed, 'labels': labels_of.get(row.id, []),
+                   'created_at': _iso(row.created_at), 'updated_at': _iso(row.updated_at)}
+
+    yield {'type': 'end', 'counts': counts}
+
+
+def export_stream(user_id, compress=False, chunk_size=CHUNK_SIZE, buffer_size=64 * 1024):
+    """Encoded archive bytes for a streamed response, gzipped when `compress` is set."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    buffer, size = [], 0
+    for record in export_records(user_id, chunk_size):
+        line = json.dumps(record, separators=(',', ':'), ensure_ascii=False).encode() + b'\n'
+        buffer.append(line)
+        size += len(line)
+        if size >= buffer_size:
+            data = b''.join(buffer)
+            buffer, size = [], 0
+            data = compressor.compress(data) if compressor else data
+            if data:
+                yield data
+    data = b''.join(buffer)
+    if compressor:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
+
+
+# --- Import ---
+class _Prefixed(io.RawIOBase):
+    """Puts bytes already read back in front of a stream."""
+
+    def __init__(self, prefix, stream):
+        self.prefix, self.stream = prefix, stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self.prefix:
+            n = min(len(buffer), len(self.prefix))
+            buffer[:n], self.prefix = self.prefix[:n], self.prefix[n:]
+            return n
+        data = self.stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def _check_fields(record, fields, what):
+    for name, types in fields.items():
+        value = record.get(name)
+        if value is not None and not isinstance(value, types):
+            raise ValueError(f'{what}: {name} has the wrong type')
+
+
+def check_record(record):
+    """Raise ValueError unless every known field of a label, folder, note or task record is usable."""
+    kind = record.get('type')
+    if kind not in KINDS:
+        raise ValueError(f'Unknown record type: {kind!r}')
+    _check_fields(record, FIELDS[kind], kind)
+    if not all(isinstance(label, _ID) for label in record.get('labels') or ()):
+        raise ValueError(f'{kind}: labels must be a list of ids')
+    for attachment in record.get('attachments') or ():
+        if not isinstance(attachment, dict):
+            raise ValueError('note: attachments must be a list of objects')
+        _check_fields(attachment, ATTACHMENT_FIELDS, 'attachment')
+
+
+def read_lines(stream):
+    """Line iterator over an uploaded archive, gunzipping it when it starts with the gzip magic."""
+    head = stream.read(2)
+    raw = io.BufferedReader(_Prefixed(head, stream))
+    return gzip.GzipFile(fileobj=raw) if head == b'\x1f\x8b' else raw
+
+
+def _datetime(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+def _date(value):
+    return date.fromisoformat(value) if value else None
+
+
+def _time(value):
+    return time.fromisoformat(value) if value else None
+
+
+class Importer:
+    def __init__(self, user_id, chunk_size=CHUNK_SIZE):
+        self.user_id = user_id
+        self.chunk_size = chunk_size
+        self.labels = {}  # archive id -> new id
+        self.folders = {}
+        self.parents = {}  # new folder id -> new parent id, to keep imported trees acyclic
+        self.orphans = []  # (new folder id, archive parent id) whose parent was not inserted yet
+        self.counts = dict.fromkeys(KINDS, 0)
+        self._pending, self._kind = [], None
+
+    def feed(self, record):
+        # Checked on arrival, so a bad record fails at its own line and before its chunk is written
+        check_record(record)
+        kind = record['type']
+        if kind != self._kind:
+            self.flush()
+            self._kind = kind
+        self._pending.append(record)
+        if len(self._pending) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        import changes
+        import workspace
+        records, self._pending = self._pending, []
+        new_ids = getattr(self, f'_insert_{self._kind}s')(records)
+        changes.record_many(self._kind, new_ids, [self.user_id])
+        workspace.bump(db.session.connection(), [self.user_id])
+        db.session.commit()
+        self.counts[self._kind] += len(new_ids)
+
+    def _insert(self, table, rows):
+        result = db.session.execute(insert(table).returning(table.c.id, sort_by_parameter_order=True), rows)
+        return [row.id for row in result]
+
+    def _insert_labels(self, records):
+        ids = self._insert(Label.__table__, [
+            {'name': (r.get('name') or 'Label')[:50], 'color': r.get('color'), 'user_id': self.user_id}
+            for r in records])
+        self.labels.update(zip((r.get('id') for r in records), ids))
+        return ids
+
+    def _insert_folders(self, records):
+        now = datetime.utcnow()
+        parents = [self.folders.get(r.get('parent_id')) for r in records]
+        ids = self._insert(Folder.__table__, [
+            {'name': (r.get('name') or 'Folder')[:120], 'user_id': self.user_id, 'parent_id': parent,
+             'created_at': _datetime(r.get('created_at')) or now, 'updated_at': _datetime(r.get('updated_at')) or now}
+            for r, parent in zip(records, parents)])
+        for record, new_id, parent in zip(records, ids, parents):
+            self.folders[record.get('id')] = new_id
+            self.parents[new_id] = parent
+            if record.get('parent_id') is not None and parent is None:
+                self.orphans.append((new_id, record['parent_id']))
+        self._adopt_orphans()
+        return ids
+
+    def _adopt_orphans(self):
+        # Children listed before their parent, resolved once the parent has an id
+        waiting = [(f, p) for f, p in self.orphans if p in self.folders]
+        self.orphans = [(f, p) for f, p in self.orphans if p not in self.folders]
+        moves = []
+        for folder_id, old_parent in waiting:
+            parent = self.folders[old_parent]
+            ancestor = parent
+            while ancestor is not None and ancestor != folder_id:
+                ancestor = self.parents.get(ancestor)
+            if ancestor is None:  # a cyclic archive leaves the folder at the root
+                self.parents[folder_id] = parent
+                moves.append({'folder_id': folder_id, 'new_parent': parent})
+        if moves:
+            table = Folder.__table__
+            db.session.execute(update(table).where(table.c.id == bindparam('folder_id'))
+                               .values(parent_id=bindparam('new_parent')), moves)
+
+    def _insert_notes(self, records):
+        import bodies
+        from blobs import blobs
+        import search
+        now = datetime.utcnow()
+        checksums = bodies.store(db.session.connection(), [r.get('content') or '' for r in records])
+        ids = self._insert(Note.__table__, [
+            {'title': r.get('title') or 'Untitled', 'body_hash': checksums[r.get('content') or ''],
+             'note_type': r.get('note_type') or 'text', 'link_url': r.get('link_url'),
+             'folder_id': self.folders.get(r.get('folder_id')), 'user_id': self.user_id, 'is_shared': False,
+             'created_at': _datetime(r.get('created_at')) or now, 'updated_at': _datetime(r.get('updated_at')) or now}
+            for r in records])
+        labels = [{'note_id': new_id, 'label_id': self.labels[label]}
+                  for r, new_id in zip(records, ids) for label in set(r.get('labels') or ()) if label in self.labels]
+        if labels:
+            db.session.execute(insert(note_label), labels)
+        # The archive has no file bytes, and a checksum alone must not grant access to someone else's
+        # file: a blob is only linked when the importing user already has it attached to a note they own
+        wanted = {a.get('blob') for r in records for a in r.get('attachments') or () if isinstance(a.get('blob'), str)}
+        owned = {h for (h,) in db.session.query(FileAttachment.blob_hash).join(Note, Note.id == FileAttachment.note_id)
+                 .filter(Note.user_id == self.user_id, FileAttachment.blob_hash.in_(wanted)).distinct()} \
+            if wanted else set()
+        owned = {h for h in owned if blobs.exists(h)}
+        attachments = [{'note_id': new_id, 'name': a.get('name') or 'Attachment', 'url': a.get('url') or '',
+                        'type': a.get('type'), 'blob_hash': a.get('blob') if a.get('blob') in owned else None,
+                        'size': a.get('size'), 'created_at': now}
+                       for r, new_id in zip(records, ids) for a in r.get('attachments') or ()
+                       if a.get('url') or a.get('blob') in owned]
+        if attachments:
+            db.session.execute(insert(FileAttachment.__table__), attachments)
+        search.index_notes(db.session, ids)
+        return ids
+
+    def _insert_tasks(self, records):
+        import search
+        now = datetime.utcnow()
+        rows = []
+        for r in records:
+            status = r.get('status') or ('completed' if r.get('is_completed') else 'pending')
+            rows.append({'title': r.get('title') or 'Untitled', 'description': r.get('description'),
+                         'category': r.get('category') or 'General', 'due_date': _date(r.get('due_date')),
+                         'due_time': _time(r.get('due_time')), 'status': status,
+                         'is_completed': status == 'completed', 'user_id': self.user_id,
+                         'created_at': _datetime(r.get('created_at')) or now,
+                         'updated_at': _datetime(r.get('updated_at')) or now})
+        ids = self._insert(Task.__table__, rows)
+        labels = [{'task_id': new_id, 'label_id': self.labels[label]}
+                  for r, new_id in zip(records, ids) for label in set(r.get('labels') or ()) if label in self.labels]
+        if labels:
+            db.session.execute(insert(task_label), labels)
+        search.index_tasks(db.session, ids)
+        return ids
+
+
+def import_stream(user_id, stream, chunk_size=CHUNK_SIZE):
+    """Import an archive from a byte stream into `user_id`'s account; returns counts per kind.
+
+    Chunks already committed stay imported when a later line turns out to be malformed.
+    """
+    importer = Importer(user_id, chunk_size)
+    line_number, header, ended = 0, None, False
+    try:
+        for line_number, line in enumerate(read_lines(stream), 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError('Each line must be a JSON object')
+            if header is None:
+                header = record
+                if header.get('type') != FORMAT or header.get('version') != VERSION:
+                    raise ValueError(f'Not a {FORMAT} version {VERSION} archive')
+                continue
+            if record.get('type') == 'end':
+                ended = True
+                break
+            importer.feed(record)
+        importer.flush()
+    except (ValueError, TypeError, OSError, EOFError) as e:
+        db.session.rollback()
+        raise ArchiveError(str(e), line_number, importer.counts)
+    if header is None:
+        raise ArchiveError('Empty archive', line_number, importer.counts)
+    if not ended:
+        raise ArchiveError('Archive is truncated: no end record', line_number, importer.counts)
+    return importer.counts
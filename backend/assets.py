@@ -0,0 +1,289 @@
+"""Frontend asset pipeline: minified, precompressed, fingerprinted, served from memory.
+
+`build` runs once at startup. For each file in the frontend directory it:
+
+- minifies scripts, stylesheets and HTML
+- names each script and stylesheet after a hash of its content
+- rewrites the references in `index.html` to those names
+- keeps gzip and, when the `brotli` package is installed, brotli variants that
+  come out smaller than the original
+
+Requests are then served from the in-memory manifest, choosing the encoding
+from `Accept-Encoding`. Fingerprinted files are cached as immutable for a year.
+`index.html` and any unfingerprinted name are revalidated by ETag.
+
+The minifiers are deliberately conservative. They drop comments and
+indentation and keep line breaks, so automatic semicolon insertion and
+template literals are unaffected.
+"""
+import copy
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:  # optional; gzip alone is used without it
+    brotli = None
+
+FINGERPRINTED = ('.js', '.css')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+
+# --- Minifiers ---
+def _skip_quoted(source, i):
+    quote, i = source[i], i + 1
+    while i < len(source) and source[i] != quote:
+        i += 2 if source[i] == '\\' else 1
+    return i + 1
+
+
+def _skip_template(source, i):
+    """End of the template literal opening at `i`, `${...}` expressions and nested templates included."""
+    i += 1
+    while i < len(source):
+        c = source[i]
+        if c == '\\':
+            i += 2
+        elif c == '`':
+            return i + 1
+        elif source.startswith('${', i):
+            i, depth = i + 2, 0
+            while i < len(source):
+                c = source[i]
+                if c in '\'"':
+                    i = _skip_quoted(source, i)
+                    continue
+                if c == '`':
+                    i = _skip_template(source, i)
+                    continue
+                if c == '{':
+                    depth += 1
+                elif c == '}':
+                    if depth == 0:
+                        break
+                    depth -= 1
+                i += 1
+            i += 1
+        else:
+            i += 1
+    return i
+
+
+# A `/` after one of these characters or keywords starts a regex literal, not a division
+_REGEX_PRECEDERS = set('(,=:[!&|?{};+-*%<>~^')
+_REGEX_KEYWORDS = {'return', 'typeof', 'instanceof', 'in', 'of', 'new', 'delete', 'void',
+                   'throw', 'case', 'do', 'else', 'yield', 'await'}
+
+
+def _regex_allowed(source, i):
+    j = i - 1
+    while j >= 0 and source[j] in ' \t\r\n':
+        j -= 1
+    if j < 0 or source[j] in _REGEX_PRECEDERS:
+        return True
+    word = re.search(r'[\w$]+$', source[:j + 1])
+    return word is not None and word.group(0) in _REGEX_KEYWORDS
+
+
+def _skip_regex(source, i):
+    """End of the regex literal opening at `i`, flags included."""
+    i, in_class = i + 1, False
+    while i < len(source) and source[i] != '\n':
+        c = source[i]
+        if c == '\\':
+            i += 2
+            continue
+        if c == '[':
+            in_class = True
+        elif c == ']':
+            in_class = False
+        elif c == '/' and not in_class:
+            i += 1
+            break
+        i += 1
+    while i < len(source) and (source[i].isalnum() or source[i] in '_$'):
+        i += 1
+    return i
+
+
+def _scan(source, line_comments, regex_literals=False):
+    """Yield (kind, text) runs: 'code', 'string' (quoted, template or regex) and 'comment'."""
+    i, n, start = 0, len(source), 0
+    while i < n:
+        c = source[i]
+        if c in '\'"`':
+            if i > start:
+                yield 'code', source[start:i]
+            end = _skip_template(source, i) if c == '`' else _skip_quoted(source, i)
+            yield 'string', source[i:end]
+            i = start = end
+        elif source.startswith('/*', i) or (line_comments and source.startswith('//', i)):
+            if i > start:
+                yield 'code', source[start:i]
+            end = source.find('*/', i + 2) + 2 if source[i + 1] == '*' else source.find('\n', i)
+            if end < 2 or end == -1:
+                end = n
+            yield 'comment', source[i:end]
+            i = start = end
+        elif regex_literals and c == '/' and _regex_allowed(source, i):
+            if i > start:
+                yield 'code', source[start:i]
+            end = _skip_regex(source, i)
+            yield 'string', source[i:end]
+            i = start = end
+        else:
+            i += 1
+    if start < n:
+        yield 'code', source[start:]
+
+
+def _strip_comments(source, line_comments, regex_literals=False):
+    # A comment between two tokens still separates them
+    return ''.join(' ' if kind == 'comment' else text
+                   for kind, text in _scan(source, line_comments, regex_literals))
+
+
+def minify_js(source):
+    # Template and regex literals are kept whole, `${...}` included; nothing inside them changes
+    out = []
+    stripped = _strip_comments(source, line_comments=True, regex_literals=True)
+    for kind, text in _scan(stripped, line_comments=True, regex_literals=True):
+        if kind == 'code':
+            text = re.sub(r'[ \t]*\n[ \t\n]*', '\n', text)
+            text = re.sub(r'[ \t]+', ' ', text)
+        out.append(text)
+    return ''.join(out).strip() + '\n'
+
+
+def minify_css(source):
+    out = []
+    for kind, text in _scan(_strip_comments(source, line_comments=False), line_comments=False):
+        if kind == 'code':
+            text = re.sub(r'\s+', ' ', text)
+            text = re.sub(r'\s*([{};,])\s*', r'\1', text)
+        out.append(text)
+    return ''.join(out).replace(';}', '}').strip() + '\n'
+
+
+def minify_html(source):
+    source = re.sub(r'<!--(?!\[if).*?-->', '', source, flags=re.S)
+    return re.sub(r'\n\s+', '\n', source).strip() + '\n'
+
+
+MINIFIERS = {'.js': minify_js, '.css': minify_css, '.html': minify_html}
+
+
+# --- Build ---
+class Asset:
+    def __init__(self, name, url, data, content_type, immutable):
+        self.name = name
+        self.url = url
+        self.content_type = content_type
+        self.immutable = immutable
+        self.digest = hashlib.sha256(data).hexdigest()[:16]
+        self.variants = {'identity': data}
+        compressed = gzip.compress(data, 9, mtime=0)
+        if len(compressed) < len(data):
+            self.variants['gzip'] = compressed
+        if brotli is not None:
+            compressed = brotli.compress(data, quality=11)
+            if len(compressed) < len(data):
+                self.variants['br'] = compressed
+
+    def etag(self, encoding):
+        return f'"{self.digest}-{encoding}"'
+
+
+class AssetManifest:
+    def __init__(self):
+        self.directory = None
+        self.by_url = {}  # url path without the leading slash -> Asset
+        self.urls = {}  # source name -> fingerprinted url path
+
+    def build(self, directory, minify=True):
+        self.directory = directory
+        by_url, urls, sources = {}, {}, {}
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if not os.path.isfile(path):
+                continue
+            with open(path, 'rb') as f:
+                sources[name] = f.read()
+
+        def add(name, data):
+            ext = os.path.splitext(name)[1]
+            if minify and ext in MINIFIERS:
+                data = MINIFIERS[ext](data.decode()).encode()
+            content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+            if content_type.startswith('text/') or ext == '.js':
+                content_type += '; charset=utf-8'
+            asset = Asset(name, name, data, content_type, immutable=False)
+            by_url[name] = asset
+            if ext in FINGERPRINTED:
+                stem = name[:-len(ext)]
+                url = f'{stem}.{asset.digest[:10]}{ext}'
+                fingerprinted = copy.copy(asset)
+                fingerprinted.url, fingerprinted.immutable = url, True
+                by_url[url] = fingerprinted
+                urls[name] = url
+
+        for name, data in sources.items():
+            if not name.endswith('.html'):
+                add(name, data)
+        # Pages are built last so they can point at the fingerprinted names
+        for name, data in sources.items():
+            if name.endswith('.html'):
+                add(name, self._rewrite(data.decode(), urls).encode())
+        self.by_url, self.urls = by_url, urls
+        return self
+
+    @staticmethod
+    def _rewrite(html, urls):
+        def replace(match):
+            url = urls.get(match.group(2))
+            return f'{match.group(1)}="{url}"' if url else match.group(0)
+        return re.sub(r'\b(src|href)="([^"/:?#]+)"', replace, html)
+
+    # --- Serving ---
+    def _encoding(self, asset):
+        accepted = {}
+        for part in request.headers.get('Accept-Encoding', '').split(','):
+            token, _, params = part.strip().partition(';')
+            q = 1.0
+            if params.strip().startswith('q='):
+                try:
+                    q = float(params.strip()[2:])
+                except ValueError:
+                    q = 0.0
+            accepted[token.strip().lower()] = q
+        for encoding in ('br', 'gzip'):
+            q = accepted.get(encoding, accepted.get('*', 0.0))
+            if encoding in asset.variants and q > 0:
+                return encoding
+        return 'identity'
+
+    def serve(self, path):
+        """Response for `path`, or None when the manifest does not know it."""
+        asset = self.by_url.get(path)
+        if asset is None:
+            return None
+        encoding = self._encoding(asset)
+        etag = asset.etag(encoding)
+        headers = {
+            'Cache-Control': IMMUTABLE if asset.immutable else REVALIDATE,
+            'ETag': etag,
+            'Vary': 'Accept-Encoding',
+        }
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        if etag in [t.strip() for t in request.headers.get('If-None-Match', '').split(',')]:
+            return Response(status=304, headers=headers)
+        return Response(asset.variants[encoding], headers=headers, content_type=asset.content_type)
+
+
+assets = AssetManifest()
@@ -1,10 +1,17 @@
 import os
 from flask import Blueprint, request, jsonify, session
 from models import db, User
-from passlib.hash import pbkdf2_sha256
+from passwords import HashingBusy
 
 auth_bp = Blueprint('auth', __name__)
 
+@auth_bp.errorhandler(HashingBusy)
+def handle_hashing_busy(error):
+    # Every hashing slot is busy; shed load instead of stalling the worker
+    response = jsonify({'error': 'Too many sign-in attempts in progress, try again shortly'})
+    response.headers['Retry-After'] = '1'
+    return response, 429
+
 @auth_bp.route('/register', methods=['POST'])
 def register():
     data = request.get_json()
@@ -16,7 +23,7 @@ def register():
         return jsonify({'error': 'Email already exists'}), 400
 
     new_user = User(username=username, email=email)
-    new_user.set_password(password) # use werkzeug hash from models or passlib here? We used werkzeug generate_password_hash in models.
+    new_user.set_password(password)
 
     db.session.add(new_user)
     db.session.commit()
@@ -31,6 +38,10 @@ def login():
 
     user = User.query.filter_by(email=email).first()
     if user and user.check_password(password):
+        # Upgrade hashes made with older parameters while the plaintext is at hand
+        if user.password_needs_rehash():
+            user.set_password(password)
+            db.session.commit()
         session['user_id'] = user.id
         return jsonify({'message': 'Logged in successfully', 'user': {'id': user.id, 'username': user.username}}), 200
 
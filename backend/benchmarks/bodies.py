@@ -0,0 +1,159 @@
+"""Compare inline note bodies with compressed, deduplicated out-of-row bodies.
+
+Builds two throwaway SQLite databases holding the same account: one with the
+HTML inline in `note.content` (the old layout) and one with `note_body` rows
+written through `bodies.store`. It reports file size and the latency of listing
+the account's notes, which used to load whole rows, and of opening a single note.
+
+    cd backend && python -m benchmarks.bodies --notes 10000 --size 50000
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import Column, Integer, MetaData, String, Table, Text, create_engine, event, insert, select  # noqa: E402
+from models import db, Note, NoteBody  # noqa: E402
+import bodies  # noqa: E402
+import storage  # noqa: E402
+
+WORDS = ('note', 'task', 'meeting', 'project', 'draft', 'review', 'idea', 'plan', 'release', 'bee', 'hive',
+         'honey', 'garden', 'budget', 'travel', 'recipe', 'follow', 'up', 'with', 'the', 'team', 'on', 'Monday')
+
+legacy = MetaData()
+legacy_note = Table(
+    'note', legacy,
+    Column('id', Integer, primary_key=True),
+    Column('title', String(255)),
+    Column('content', Text),
+    Column('user_id', Integer, index=True),
+)
+
+
+def make_body(rng, size):
+    parts, length = [], 0
+    while length < size:
+        paragraph = '<p>' + ' '.join(rng.choice(WORDS) for _ in range(rng.randint(20, 80))) + '</p>'
+        parts.append(paragraph)
+        length += len(paragraph)
+    return ''.join(parts)[:size]
+
+
+def generate(notes, size, duplicate_ratio, seed):
+    rng = random.Random(seed)
+    contents = []
+    for _ in range(notes):
+        if contents and rng.random() < duplicate_ratio:
+            contents.append(rng.choice(contents))
+        else:
+            contents.append(make_body(rng, size))
+    return contents
+
+
+def engine_for(path):
+    engine = create_engine(f'sqlite:///{path}')
+    pragmas = storage.sqlite_pragmas()
+    event.listen(engine, 'connect', lambda dbapi_connection, record: storage.apply_pragmas(dbapi_connection, pragmas))
+    return engine
+
+
+def build_inline(path, contents, batch=500):
+    engine = engine_for(path)
+    legacy.create_all(engine)
+    with engine.begin() as connection:
+        for start in range(0, len(contents), batch):
+            connection.execute(insert(legacy_note), [
+                {'id': start + i + 1, 'title': f'Note {start + i + 1}', 'content': c, 'user_id': 1}
+                for i, c in enumerate(contents[start:start + batch])
+            ])
+    return engine
+
+
+def build_out_of_row(path, contents, batch=500):
+    engine = engine_for(path)
+    db.metadata.create_all(engine, tables=[NoteBody.__table__, Note.__table__])
+    with engine.begin() as connection:
+        for start in range(0, len(contents), batch):
+            chunk = contents[start:start + batch]
+            checksums = bodies.store(connection, chunk)
+            connection.execute(insert(Note.__table__), [
+                {'id': start + i + 1, 'title': f'Note {start + i + 1}', 'body_hash': checksums[c], 'user_id': 1}
+                for i, c in enumerate(chunk)
+            ])
+    return engine
+
+
+def timed(engine, query_for, repeat):
+    samples = []
+    with engine.connect() as connection:
+        for i in range(repeat):
+            start = time.perf_counter()
+            connection.execute(query_for(i)).all()
+            samples.append(time.perf_counter() - start)
+    return {'p50_ms': round(statistics.median(samples) * 1000, 3), 'max_ms': round(max(samples) * 1000, 3)}
+
+
+def file_size(path):
+    return sum(os.path.getsize(p) for p in (path, path + '-wal') if os.path.exists(p))
+
+
+def run(args):
+    contents = generate(args.notes, args.size, args.duplicate_ratio, args.seed)
+    rng = random.Random(args.seed)
+    pick = [rng.randint(1, args.notes) for _ in range(args.repeat)]
+    results = {'notes': args.notes, 'body_bytes': args.size, 'distinct_bodies': len(set(contents))}
+    with tempfile.TemporaryDirectory() as tmp:
+        inline_path, out_path = os.path.join(tmp, 'inline.db'), os.path.join(tmp, 'out_of_row.db')
+
+        engine = build_inline(inline_path, contents)
+        results['inline'] = {
+            'db_bytes': file_size(inline_path),
+            # The old listing loaded whole Note rows, body included
+            'list_notes': timed(engine, lambda i: select(legacy_note).where(legacy_note.c.user_id == 1), args.repeat),
+            'open_note': timed(engine, lambda i: select(legacy_note.c.content).where(legacy_note.c.id == pick[i]),
+                               args.repeat),
+        }
+        engine.dispose()
+
+        engine = build_out_of_row(out_path, contents)
+        note = Note.__table__
+        results['out_of_row'] = {
+            'db_bytes': file_size(out_path),
+            'list_notes': timed(engine, lambda i: select(note).where(note.c.user_id == 1), args.repeat),
+            'open_note': timed(engine, lambda i: select(NoteBody.data, NoteBody.compressed)
+                               .join(note, note.c.body_hash == NoteBody.checksum).where(note.c.id == pick[i]),
+                               args.repeat),
+        }
+        engine.dispose()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--notes', type=int, default=10000)
+    parser.add_argument('--size', type=int, default=50000, help='bytes of HTML per note')
+    parser.add_argument('--duplicate-ratio', type=float, default=0.05, help='share of notes copying another body')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help='print raw JSON results')
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    inline, out = results['inline'], results['out_of_row']
+    print(f"{args.notes} notes x {args.size} bytes, {results['distinct_bodies']} distinct bodies")
+    print(f"{'db size':<12} {inline['db_bytes'] / 2 ** 20:>9.1f} MB -> {out['db_bytes'] / 2 ** 20:>9.1f} MB")
+    for name in ('list_notes', 'open_note'):
+        print(f"{name:<12} p50 {inline[name]['p50_ms']:>8.3f} ms -> {out[name]['p50_ms']:>8.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,552 @@
+"""Load-test the REST API and Socket.IO document rooms against a seeded database.
+
+Seeds a throwaway SQLite database with synthetic users, folders, notes, tasks
+and collaborators, then starts the app in a subprocess under eventlet, as
+gunicorn's eventlet worker runs it. Worker threads, each logged in as a seeded
+user, drive the `/auth/*` and `/api/*` scenarios concurrently. Groups of
+editors then join note rooms over websockets and exchange edits. The run
+reports, as one JSON document:
+
+- p50/p95/p99 latency, throughput and errors per scenario
+- SQL statements per request, measured in a separate sequential pass so
+  concurrent requests and streamed bodies do not blur the count
+- edit fan-out latency: an edit's emit to its `document_updated` at the other
+  editors, which includes the coalescing window
+- edit ack latency
+
+Save a run with `--out` and compare later runs with `--compare`. The process
+exits non-zero when a latency or query count grows by more than
+`--max-regression` percent.
+
+    cd backend && python -m benchmarks.load --users 20 --notes 50 --out baseline.json
+    cd backend && python -m benchmarks.load --users 20 --notes 50 --compare baseline.json
+
+Needs `requests` and `websocket-client` (the Socket.IO client transports)
+besides the app's own requirements.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, BACKEND_DIR)
+
+PASSWORD = 'bench-password'
+WORDS = ('note', 'task', 'meeting', 'project', 'draft', 'review', 'idea', 'plan', 'release', 'bee', 'hive',
+         'honey', 'garden', 'budget', 'travel', 'recipe', 'follow', 'up', 'with', 'the', 'team', 'on', 'Monday')
+STATUSES = ('pending', 'working', 'completed')
+CATEGORIES = ('General', 'Work', 'Home', 'Errands')
+
+# Server settings for a run; anything already in the environment wins
+SERVER_ENV = {
+    'REVISION_THIN_INTERVAL': '0',
+    'SOCKETIO_TRANSPORTS': 'websocket',
+    # The limiter is not what is being measured; rejected edits would break ack accounting
+    'SOCKET_EDIT_RATE': '1000',
+    'SOCKET_EDIT_BURST': '1000',
+}
+
+
+# --- Seeding ---
+def sentence(rng, low, high):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+
+def seed(path, args):
+    """Fill a fresh database at `path`; returns the ids the scenarios draw from."""
+    from sqlalchemy import create_engine, event, insert
+    from models import db, User, Folder, Note, Task, Collaborator
+    from passwords import PasswordHasher
+    import bodies
+    import storage
+
+    rng = random.Random(args.seed)
+    engine = create_engine(f'sqlite:///{path}')
+    pragmas = storage.sqlite_pragmas()
+    event.listen(engine, 'connect', lambda dbapi_connection, record: storage.apply_pragmas(dbapi_connection, pragmas))
+    db.metadata.create_all(engine)
+
+    # One real hash shared by every account keeps seeding fast while logins still verify
+    password_hash = PasswordHasher(max_pending=1).hash(PASSWORD)
+    now = datetime.utcnow()
+    today = date.today()
+    plan = {'users': [], 'notes': {}, 'shared': {}, 'tasks': {}, 'roots': {}}
+
+    with engine.begin() as connection:
+        connection.execute(insert(User.__table__), [
+            {'id': u, 'username': f'bench{u}', 'email': f'bench{u}@example.test',
+             'password_hash': password_hash, 'created_at': now}
+            for u in range(1, args.users + 1)
+        ])
+        plan['users'] = list(range(1, args.users + 1))
+
+        folder_id, note_id, task_id = 0, 0, 0
+        for user_id in plan['users']:
+            folders = []
+            for i in range(args.folders):
+                folder_id += 1
+                # Every third folder nests under an earlier one, so trees have some depth
+                parent = folders[rng.randrange(len(folders))] if folders and i % 3 else None
+                folders.append(folder_id)
+                connection.execute(insert(Folder.__table__), {
+                    'id': folder_id, 'name': f'Folder {i}', 'user_id': user_id, 'parent_id': parent,
+                    'created_at': now, 'updated_at': now})
+            plan['roots'][user_id] = folders[0] if folders else None
+
+            contents = [f'<p>{sentence(rng, args.note_words // 2, args.note_words)}</p>' for _ in range(args.notes)]
+            checksums = bodies.store(connection, contents)
+            rows = []
+            for content in contents:
+                note_id += 1
+                updated = now - timedelta(minutes=rng.randint(0, 60 * 24 * 30))
+                rows.append({'id': note_id, 'title': sentence(rng, 2, 5).title(), 'body_hash': checksums[content],
+                             'note_type': 'text', 'user_id': user_id, 'is_shared': False,
+                             'folder_id': rng.choice(folders) if folders and rng.random() < 0.7 else None,
+                             'created_at': updated, 'updated_at': updated})
+            if rows:
+                connection.execute(insert(Note.__table__), rows)
+            plan['notes'][user_id] = [row['id'] for row in rows]
+
+            rows = []
+            for _ in range(args.tasks):
+                task_id += 1
+                status = rng.choice(STATUSES)
+                rows.append({'id': task_id, 'title': sentence(rng, 2, 6), 'category': rng.choice(CATEGORIES),
+                             'status': status, 'is_completed': status == 'completed',
+                             'due_date': today + timedelta(days=rng.randint(-30, 60)) if rng.random() < 0.8 else None,
+                             'user_id': user_id, 'created_at': now, 'updated_at': now})
+            if rows:
+                connection.execute(insert(Task.__table__), rows)
+            plan['tasks'][user_id] = [row['id'] for row in rows]
+
+        shares = []
+        for user_id in plan['users']:
+            others = [u for u in plan['users'] if u != user_id]
+            for note in plan['notes'][user_id]:
+                if others and rng.random() < args.shared_ratio:
+                    for collaborator in rng.sample(others, min(args.collaborators, len(others))):
+                        shares.append({'note_id': note, 'user_id': collaborator,
+                                       'permission': rng.choice(('read', 'write'))})
+                        plan['shared'].setdefault(collaborator, []).append(note)
+        if shares:
+            connection.execute(insert(Collaborator.__table__), shares)
+            connection.execute(Note.__table__.update().where(
+                Note.__table__.c.id.in_({s['note_id'] for s in shares})), {'is_shared': True})
+    engine.dispose()
+    return plan
+
+
+# --- Server ---
+def serve(args):
+    """Run the app on `args.port` with a SQL statement counter; used as the subprocess."""
+    import eventlet
+    eventlet.monkey_patch()
+    os.environ['DATABASE_URL'] = f'sqlite:///{args.db}'
+    from flask import jsonify
+    from sqlalchemy import event
+    from app import create_app, socketio
+    from models import db
+
+    app = create_app()
+    counter = {'statements': 0}
+    with app.app_context():
+        @event.listens_for(db.engine, 'before_cursor_execute')
+        def _count(*_):
+            counter['statements'] += 1
+
+    @app.route('/__bench__/statements')
+    def bench_statements():
+        return jsonify(counter)
+
+    socketio.run(app, host='127.0.0.1', port=args.port, log_output=False)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(db_path, port, timeout=60):
+    import requests
+    env = {**SERVER_ENV, **os.environ}
+    process = subprocess.Popen([sys.executable, '-m', 'benchmarks.load', '--serve', '--db', db_path, '--port', str(port)],
+                               cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('Server exited during startup:\n' + process.stderr.read().decode(errors='replace'))
+        try:
+            requests.get(f'http://127.0.0.1:{port}/__bench__/statements', timeout=1)
+            return process
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError('Server did not start in time')
+
+
+# --- HTTP scenarios ---
+def login(base, user_id):
+    import requests
+    session = requests.Session()
+    response = session.post(f'{base}/auth/login', json={'email': f'bench{user_id}@example.test', 'password': PASSWORD})
+    response.raise_for_status()
+    return session
+
+
+def scenarios(plan, rng):
+    """name -> callable(session, user_id) returning (method, path, json body or None)."""
+    today = date.today()
+
+    def any_note(user_id):
+        notes = plan['notes'][user_id] + plan['shared'].get(user_id, [])
+        return rng.choice(notes) if notes else 0
+
+    def own_note(user_id):
+        return rng.choice(plan['notes'][user_id]) if plan['notes'][user_id] else 0
+
+    def tasks(user_id, n):
+        return rng.sample(plan['tasks'][user_id], min(n, len(plan['tasks'][user_id])))
+
+    return {
+        'auth_login': lambda u: ('POST', '/auth/login', {'email': f'bench{u}@example.test', 'password': PASSWORD}),
+        'auth_me': lambda u: ('GET', '/auth/me', None),
+        'workspace': lambda u: ('GET', '/api/workspace?notes_limit=60', None),
+        'notes_page': lambda u: ('GET', '/api/notes?limit=50&order=desc', None),
+        'note_get': lambda u: ('GET', f'/api/notes/{any_note(u)}', None),
+        'note_update': lambda u: ('PUT', f'/api/notes/{own_note(u)}',
+                                  {'content': f'<p>{sentence(rng, 40, 80)}</p>'}),
+        'tasks_range': lambda u: ('GET', f'/api/tasks?from={today}&to={today + timedelta(days=14)}', None),
+        'task_summary': lambda u: ('GET', '/api/tasks/summary', None),
+        'task_update': lambda u: ('PUT', f'/api/tasks/{(tasks(u, 1) or [0])[0]}', {'status': rng.choice(STATUSES)}),
+        'batch_tasks': lambda u: ('POST', '/api/batch', {'operations': [
+            {'op': 'update', 'type': 'task', 'id': t, 'data': {'status': rng.choice(STATUSES)}} for t in tasks(u, 20)]}),
+        'search': lambda u: ('GET', f'/api/search?q={rng.choice(WORDS)}', None),
+        'changes': lambda u: ('GET', '/api/changes?since=0', None),
+        'folder_tree': lambda u: ('GET', f"/api/folders/{plan['roots'][u] or 0}/tree", None),
+    }
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def summarize(samples):
+    if not samples:
+        return {'count': 0}
+    ms = [s * 1000 for s in samples]
+    return {
+        'count': len(ms),
+        'p50_ms': round(percentile(ms, 50), 3),
+        'p95_ms': round(percentile(ms, 95), 3),
+        'p99_ms': round(percentile(ms, 99), 3),
+        'max_ms': round(max(ms), 3),
+        'mean_ms': round(statistics.fmean(ms), 3),
+    }
+
+
+def run_http(base, plan, args, sessions):
+    rng = random.Random(args.seed + 1)
+    results = {}
+    local = threading.local()
+    users = list(sessions)
+
+    def one(request_for):
+        # Each worker thread sticks to one logged-in user, like a browser tab
+        if not hasattr(local, 'user'):
+            local.user = users[threading.get_ident() % len(users)]
+        method, path, body = request_for(local.user)
+        start = time.perf_counter()
+        response = sessions[local.user].request(method, base + path, json=body)
+        response.content  # streamed listings count until the last byte
+        return time.perf_counter() - start, response.status_code
+
+    for name, request_for in scenarios(plan, rng).items():
+        if args.only and name not in args.only:
+            continue
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            outcomes = list(pool.map(lambda _: one(request_for), range(args.requests)))
+        elapsed = time.perf_counter() - start
+        errors = {}
+        for _, status in outcomes:
+            if status >= 400:
+                errors[str(status)] = errors.get(str(status), 0) + 1
+        results[name] = {
+            **summarize([latency for latency, _ in outcomes]),
+            'throughput_rps': round(len(outcomes) / elapsed, 1),
+            'errors': errors,
+        }
+
+    # Statement counts come from a sequential pass so nothing else runs in between
+    user_id = users[0]
+    counter = f'{base}/__bench__/statements'
+    for name, request_for in scenarios(plan, rng).items():
+        if name not in results:
+            continue
+        counts = []
+        for _ in range(args.query_samples):
+            before = sessions[user_id].get(counter).json()['statements']
+            method, path, body = request_for(user_id)
+            sessions[user_id].request(method, base + path, json=body).content
+            counts.append(sessions[user_id].get(counter).json()['statements'] - before)
+        results[name]['queries_per_request'] = round(statistics.fmean(counts), 2)
+    return results
+
+
+# --- Socket.IO rooms ---
+class Editor:
+    """One websocket client in a room, timing its edits and the updates it receives."""
+
+    def __init__(self, url, cookies, note_id):
+        import socketio
+        self.note_id = note_id
+        self.version = None
+        self.ready = threading.Event()
+        self.unacked = []  # send times of edits not acknowledged yet, oldest first
+        self.sent_at = {}  # version -> send time of the edit that produced it
+        self.acks = []
+        self.received = []  # (base_version, version, receive time)
+        self.resynced = False
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+        self.client = socketio.Client(reconnection=False)
+        self.client.on('document_snapshot', self._on_snapshot)
+        self.client.on('document_updated', self._on_updated)
+        self.client.on('edit_ack', self._on_ack)
+        self.client.on('edit_rejected', self._on_rejected)
+        self.client.connect(url, headers={'Cookie': cookies}, transports=['websocket'])
+
+    def _on_snapshot(self, data):
+        with self._lock:
+            if self.version is not None:
+                # An edit was too stale to rebase; its ack will never come
+                self.resynced = True
+            self.version = data['version']
+        self.ready.set()
+
+    def _on_updated(self, data):
+        now = time.perf_counter()
+        with self._lock:
+            self.received.append((data['base_version'], data['version'], now))
+            self.version = max(self.version or 0, data['version'])
+
+    def _on_ack(self, data):
+        now = time.perf_counter()
+        with self._lock:
+            for version in range(data['base_version'] + 1, data['version'] + 1):
+                if self.unacked:
+                    sent = self.unacked.pop(0)
+                    self.sent_at[version] = sent
+                    self.acks.append(now - sent)
+            self.version = max(self.version or 0, data['version'])
+
+    def _on_rejected(self, data):
+        with self._lock:
+            self.rejected += 1
+
+    def join(self):
+        self.client.emit('join_document', {'document_id': self.note_id, 'contents': [{'insert': '\n'}]})
+        return self.ready.wait(10)
+
+    def edit(self, rng):
+        with self._lock:
+            version = self.version
+            self.unacked.append(time.perf_counter())
+        self.client.emit('edit_document', {'document_id': self.note_id, 'version': version,
+                                           'delta': [{'insert': rng.choice(WORDS) + ' '}]})
+
+    def close(self):
+        try:
+            self.client.emit('leave_document', {'document_id': self.note_id})
+            self.client.disconnect()
+        except Exception:
+            pass
+
+
+def run_rooms(base, plan, args, sessions):
+    rng = random.Random(args.seed + 2)
+    owners = [u for u in plan['users'] if plan['notes'][u]][:args.rooms]
+    editors = []
+    for user_id in owners:
+        cookies = '; '.join(f'{k}={v}' for k, v in sessions[user_id].cookies.items())
+        note_id = plan['notes'][user_id][0]
+        # The owner opens the note from several connections, as several tabs or devices would
+        editors += [Editor(base, cookies, note_id) for _ in range(args.editors)]
+    joined = sum(editor.join() for editor in editors)
+
+    def drive(editor):
+        local_rng = random.Random(rng.random())
+        for _ in range(args.edits):
+            editor.edit(local_rng)
+            time.sleep(args.edit_interval / 1000.0)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max(1, len(editors))) as pool:
+        list(pool.map(drive, editors))
+    elapsed = time.perf_counter() - start
+    time.sleep(max(0.5, args.edit_interval / 1000.0 * 4))  # let the last coalesced flushes arrive
+
+    # An update's fan-out latency runs from the first edit it carries to its arrival at a peer
+    fanout_samples, by_room = [], {}
+    for editor in editors:
+        by_room.setdefault(editor.note_id, []).append(editor)
+    for room_editors in by_room.values():
+        sent_at = {}
+        for editor in room_editors:
+            if not editor.resynced and not editor.rejected:
+                sent_at.update(editor.sent_at)
+        for editor in room_editors:
+            for base_version, version, received in editor.received:
+                sent = sent_at.get(base_version + 1)
+                if sent is not None:
+                    fanout_samples.append(received - sent)
+
+    edits = args.edits * len(editors)
+    result = {
+        'rooms': len(by_room),
+        'editors': len(editors),
+        'joined': joined,
+        'edits': edits,
+        'edit_throughput_per_s': round(edits / elapsed, 1) if elapsed else None,
+        'ack_latency': summarize([a for editor in editors for a in editor.acks]),
+        'fanout_latency': summarize(fanout_samples),
+        'updates_received': sum(len(editor.received) for editor in editors),
+        'rejected': sum(editor.rejected for editor in editors),
+        'resynced_editors': sum(editor.resynced for editor in editors),
+    }
+    for editor in editors:
+        editor.close()
+    return result
+
+
+# --- Comparison ---
+def compare(baseline, current, max_regression):
+    """Print metric changes against `baseline`; returns the list of regressions."""
+    regressions = []
+
+    def check(label, old, new, higher_is_worse=True):
+        if old in (None, 0) or new is None:
+            return
+        change = (new - old) / old * 100
+        worse = change if higher_is_worse else -change
+        flag = ''
+        if worse > max_regression:
+            regressions.append(label)
+            flag = '  REGRESSION'
+        print(f'{label:<40} {old:>10} -> {new:>10} ({change:+.1f}%){flag}')
+
+    for name, stats in current.get('http', {}).items():
+        old = baseline.get('http', {}).get(name)
+        if not old:
+            continue
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request'):
+            check(f'http.{name}.{metric}', old.get(metric), stats.get(metric))
+        check(f'http.{name}.throughput_rps', old.get('throughput_rps'), stats.get('throughput_rps'), False)
+    old_rooms, new_rooms = baseline.get('sockets') or {}, current.get('sockets') or {}
+    for group in ('ack_latency', 'fanout_latency'):
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms'):
+            check(f'sockets.{group}.{metric}', (old_rooms.get(group) or {}).get(metric),
+                  (new_rooms.get(group) or {}).get(metric))
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        started = time.perf_counter()
+        plan = seed(db_path, args)
+        seeded = time.perf_counter() - started
+
+        port = args.port or free_port()
+        server = start_server(db_path, port)
+        base = f'http://127.0.0.1:{port}'
+        try:
+            sessions = {u: login(base, u) for u in plan['users'][:max(args.concurrency, args.rooms)]}
+            results = {
+                'meta': {
+                    'created_at': datetime.utcnow().isoformat(timespec='seconds'),
+                    'revision': git_revision(),
+                    'python': platform.python_version(),
+                    'sqlite': sqlite3.sqlite_version,
+                    'seed_seconds': round(seeded, 2),
+                    'args': {k: v for k, v in vars(args).items() if k not in ('serve', 'db', 'out', 'compare')},
+                },
+                'http': run_http(base, plan, args, sessions),
+                'sockets': run_rooms(base, plan, args, sessions) if args.rooms and args.editors else None,
+            }
+        finally:
+            server.terminate()
+            server.wait(10)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--folders', type=int, default=10, help='folders per user')
+    parser.add_argument('--notes', type=int, default=50, help='notes per user')
+    parser.add_argument('--note-words', type=int, default=300, help='maximum words per note body')
+    parser.add_argument('--tasks', type=int, default=100, help='tasks per user')
+    parser.add_argument('--shared-ratio', type=float, default=0.2, help='share of notes with collaborators')
+    parser.add_argument('--collaborators', type=int, default=2, help='collaborators per shared note')
+    parser.add_argument('--requests', type=int, default=200, help='requests per HTTP scenario')
+    parser.add_argument('--concurrency', type=int, default=8, help='concurrent HTTP clients')
+    parser.add_argument('--query-samples', type=int, default=5, help='sequential requests per scenario for query counts')
+    parser.add_argument('--only', nargs='*', help='HTTP scenarios to run (default: all)')
+    parser.add_argument('--rooms', type=int, default=4, help='note rooms with simulated editors')
+    parser.add_argument('--editors', type=int, default=5, help='editors per room')
+    parser.add_argument('--edits', type=int, default=50, help='edits per editor')
+    parser.add_argument('--edit-interval', type=float, default=50, help='milliseconds between one editor\'s edits')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument('--out', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON file to compare against')
+    parser.add_argument('--max-regression', type=float, default=25.0, help='percent change treated as a regression')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--db', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        return serve(args)
+
+    results = run(args)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), results, args.max_regression)
+        if regressions:
+            sys.exit(1)
+    elif not args.out:
+        print(json.dumps(results, indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""Compare the SQLite storage profile against SQLAlchemy defaults.
+
+Seeds two throwaway databases with the same synthetic data: one bare (rollback
+journal, `synchronous=FULL`, no secondary indexes) and one with the storage
+profile (WAL pragmas plus the indexes declared in `models.py`). The hot-path
+queries from `routes.py` and a commit-per-row write loop then run against each.
+
+    cd backend && python -m benchmarks.storage --users 50 --notes 200 --json
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import create_engine, event, insert, select, or_  # noqa: E402
+from models import db, User, Folder, Note, Task, Collaborator  # noqa: E402
+import storage  # noqa: E402
+
+DEFAULT_PRAGMAS = {'journal_mode': 'DELETE', 'synchronous': 'FULL'}
+
+
+def make_engine(path, pragmas, indexes):
+    engine = create_engine(f'sqlite:///{path}')
+    event.listen(engine, 'connect', lambda dbapi_connection, record: storage.apply_pragmas(dbapi_connection, pragmas))
+    db.metadata.create_all(engine)
+    if not indexes:
+        with engine.begin() as connection:
+            for table in db.metadata.sorted_tables:
+                for index in table.indexes:
+                    index.drop(connection)
+    return engine
+
+
+def seed(engine, users, notes_per_user, tasks_per_user, share_ratio, seed_value, analyze=False):
+    rng = random.Random(seed_value)
+    now = datetime(2024, 1, 1)
+    with engine.begin() as connection:
+        connection.execute(insert(User.__table__), [
+            {'id': u, 'username': f'user{u}', 'email': f'user{u}@example.com'} for u in range(1, users + 1)
+        ])
+        folders, notes, tasks, collabs = [], [], [], []
+        for u in range(1, users + 1):
+            folder_ids = [len(folders) + i + 1 for i in range(5)]
+            folders += [{'id': f, 'name': f'Folder {f}', 'user_id': u, 'created_at': now, 'updated_at': now}
+                        for f in folder_ids]
+            for _ in range(notes_per_user):
+                note_id = len(notes) + 1
+                stamp = now + timedelta(seconds=rng.randrange(10 ** 7))
+                shared = rng.random() < share_ratio
+                notes.append({'id': note_id, 'title': f'Note {note_id}', 'content': '<p>body</p>', 'user_id': u,
+                              'folder_id': rng.choice(folder_ids), 'is_shared': shared,
+                              'created_at': stamp, 'updated_at': stamp})
+                if shared:
+                    other = rng.randrange(1, users + 1)
+                    if other != u:
+                        collabs.append({'user_id': other, 'note_id': note_id, 'permission': 'write'})
+            for _ in range(tasks_per_user):
+                stamp = now + timedelta(seconds=rng.randrange(10 ** 7))
+                tasks.append({'title': 'Task', 'user_id': u, 'status': 'pending',
+                              'due_date': (stamp + timedelta(days=rng.randrange(60))).date(),
+                              'created_at': stamp, 'updated_at': stamp})
+        connection.execute(insert(Folder.__table__), folders)
+        connection.execute(insert(Note.__table__), notes)
+        connection.execute(insert(Task.__table__), tasks)
+        if collabs:
+            connection.execute(insert(Collaborator.__table__), collabs)
+        if analyze:
+            connection.exec_driver_sql('ANALYZE')
+
+
+def hot_queries(user_id):
+    shared_ids = select(Collaborator.note_id).where(Collaborator.user_id == user_id)
+    return {
+        'list_notes': select(Note.id, Note.title, Note.folder_id, Note.updated_at)
+        .where(or_(Note.user_id == user_id, Note.id.in_(shared_ids)))
+        .order_by(Note.updated_at.desc(), Note.id.desc()).limit(60),
+        'notes_in_folder': select(Note.id).where(Note.folder_id == (user_id - 1) * 5 + 1),
+        'note_audience': select(Collaborator.user_id).where(Collaborator.note_id == user_id * 3),
+        'list_tasks': select(Task.id, Task.title).where(Task.user_id == user_id)
+        .order_by(Task.updated_at, Task.id),
+        'tasks_due_soon': select(Task.id).where(Task.user_id == user_id, Task.due_date <= datetime(2024, 2, 1).date()),
+    }
+
+
+def time_queries(engine, users, repeat):
+    samples = {}
+    with engine.connect() as connection:
+        for _ in range(repeat):
+            for user_id in range(1, users + 1):
+                for name, query in hot_queries(user_id).items():
+                    start = time.perf_counter()
+                    connection.execute(query).all()
+                    samples.setdefault(name, []).append(time.perf_counter() - start)
+    return {name: _summary(values) for name, values in samples.items()}
+
+
+def time_writes(engine, count):
+    # One transaction per row, as the REST handlers commit per request
+    start = time.perf_counter()
+    for i in range(count):
+        with engine.begin() as connection:
+            connection.execute(insert(Task.__table__).values(title=f'write {i}', user_id=1, status='pending'))
+    elapsed = time.perf_counter() - start
+    return {'commits': count, 'seconds': round(elapsed, 4), 'commits_per_sec': round(count / elapsed, 1)}
+
+
+def _summary(values):
+    values = sorted(values)
+    return {
+        'p50_ms': round(statistics.median(values) * 1000, 4),
+        'p95_ms': round(values[int(len(values) * 0.95) - 1] * 1000, 4),
+        'mean_ms': round(statistics.fmean(values) * 1000, 4),
+    }
+
+
+def run(args):
+    results = {}
+    profiles = {
+        'baseline': (DEFAULT_PRAGMAS, False),
+        'tuned': (storage.sqlite_pragmas(), True),
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, (pragmas, indexes) in profiles.items():
+            engine = make_engine(os.path.join(tmp, f'{name}.db'), pragmas, indexes)
+            seed(engine, args.users, args.notes, args.tasks, args.share_ratio, args.seed, analyze=indexes)
+            results[name] = {
+                'queries': time_queries(engine, args.users, args.repeat),
+                'writes': time_writes(engine, args.writes),
+            }
+            engine.dispose()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--notes', type=int, default=200, help='notes per user')
+    parser.add_argument('--tasks', type=int, default=100, help='tasks per user')
+    parser.add_argument('--share-ratio', type=float, default=0.1)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--writes', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help='print raw JSON results')
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for name in results['baseline']['queries']:
+        before = results['baseline']['queries'][name]['p50_ms']
+        after = results['tuned']['queries'][name]['p50_ms']
+        print(f'{name:<18} p50 {before:>9.3f} ms -> {after:>9.3f} ms')
+    before, after = results['baseline']['writes'], results['tuned']['writes']
+    print(f"{'commits/sec':<18}     {before['commits_per_sec']:>9.1f}    -> {after['commits_per_sec']:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+"""Content-addressed local storage for uploaded attachment files.
+
+A stored file lives at `<ATTACHMENT_DIR>/blobs/ab/cd/<sha256>`, so identical
+uploads are kept once. `FileAttachment.blob_hash` refers to it. Bytes are
+copied between the request stream and disk in `BLOCK_SIZE` pieces and are
+never held in memory whole.
+
+Resumable uploads append to `uploads/<id>.part`. Their progress is kept in
+`AttachmentUpload` rows, so any worker can take the next chunk. Once the last
+byte arrives, the part file is hashed and renamed into place, or dropped if
+that blob already exists. Renames stay on one filesystem, so a blob never
+appears half written.
+
+Deleting an attachment or its note only removes rows, apart from the part
+files of uploads into a deleted note, which go once the delete commits. `collect_garbage` runs
+in the background every `ATTACHMENT_GC_INTERVAL` seconds, or as
+`flask gc-attachments`. It deletes blobs that no attachment refers to, and
+uploads left idle for `ATTACHMENT_UPLOAD_TTL` seconds. A blob younger than
+that TTL is left alone, because its attachment row may not be committed yet.
+"""
+import hashlib
+import os
+import re
+import time
+import uuid
+from datetime import datetime, timedelta
+from models import db, FileAttachment, AttachmentUpload
+
+BLOCK_SIZE = 1024 * 1024
+_CHECKSUM_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+class BlobTooLarge(ValueError):
+    pass
+
+
+class BlobStore:
+    def __init__(self):
+        self.directory = None
+        self.max_bytes = 100 * 1024 * 1024
+        self.upload_ttl = 86400
+        self.gc_interval = 3600
+
+    def init_app(self, app, socketio=None):
+        self.directory = app.config['ATTACHMENT_DIR']
+        self.max_bytes = app.config['ATTACHMENT_MAX_BYTES']
+        self.upload_ttl = app.config['ATTACHMENT_UPLOAD_TTL']
+        self.gc_interval = app.config['ATTACHMENT_GC_INTERVAL']
+        os.makedirs(os.path.join(self.directory, 'blobs'), exist_ok=True)
+        os.makedirs(os.path.join(self.directory, 'uploads'), exist_ok=True)
+
+        @app.cli.command('gc-attachments')
+        def gc_attachments_command():
+            """Delete unreferenced attachment blobs and stale uploads now."""
+            print('Removed {blobs} blobs and {uploads} uploads'.format(**self.collect_garbage()))
+
+        if socketio is not None and self.gc_interval > 0:
+            socketio.start_background_task(self._gc_loop, app, socketio)
+
+    # --- Paths ---
+    def path(self, checksum):
+        if not _CHECKSUM_RE.match(checksum or ''):
+            raise ValueError('Invalid blob checksum')
+        return os.path.join(self.directory, 'blobs', checksum[:2], checksum[2:4], checksum)
+
+    def exists(self, checksum):
+        return bool(checksum) and _CHECKSUM_RE.match(checksum) is not None and os.path.isfile(self.path(checksum))
+
+    def part_path(self, upload_id):
+        return os.path.join(self.directory, 'uploads', f'{upload_id}.part')
+
+    # --- Writing ---
+    def _copy(self, stream, f, limit, digest=None):
+        written = 0
+        while True:
+            block = stream.read(BLOCK_SIZE)
+            if not block:
+                return written
+            written += len(block)
+            if written > limit:
+                raise BlobTooLarge(f'Attachments are limited to {self.max_bytes} bytes')
+            if digest is not None:
+                digest.update(block)
+            f.write(block)
+
+    def _place(self, part, checksum):
+        target = self.path(checksum)
+        if os.path.exists(target):
+            os.remove(part)
+            # A fresh mtime keeps a blob just referenced again out of the current GC pass
+            os.utime(target)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(part, target)
+        return checksum
+
+    def store_stream(self, stream):
+        """Store a whole file from `stream`; returns (checksum, size)."""
+        part = self.part_path(uuid.uuid4().hex)
+        digest = hashlib.sha256()
+        try:
+            with open(part, 'wb') as f:
+                size = self._copy(stream, f, self.max_bytes, digest)
+            return self._place(part, digest.hexdigest()), size
+        except BaseException:
+            if os.path.exists(part):
+                os.remove(part)
+            raise
+
+    def write_part(self, upload_id, offset, stream, limit):
+        """Write `stream` into an upload at `offset`, at most `limit` bytes; returns the bytes written."""
+        path = self.part_path(upload_id)
+        with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+            f.seek(offset)
+            # Bytes past `offset` are from an interrupted chunk that was never acknowledged
+            f.truncate()
+            return self._copy(stream, f, limit)
+
+    def finish_part(self, upload_id):
+        """Move a completed upload into the store; returns its checksum."""
+        path = self.part_path(upload_id)
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+                digest.update(block)
+        return self._place(path, digest.hexdigest())
+
+    def discard_part(self, upload_id):
+        try:
+            os.remove(self.part_path(upload_id))
+        except FileNotFoundError:
+            pass
+
+    # --- Garbage collection ---
+    def collect_garbage(self, batch_size=500):
+        """Delete unreferenced blobs and expired uploads; returns how many of each went."""
+        cutoff = time.time() - self.upload_ttl
+        removed = {'blobs': 0, 'uploads': 0}
+
+        expired = db.session.query(AttachmentUpload.id) \
+            .filter(AttachmentUpload.updated_at < datetime.utcnow() - timedelta(seconds=self.upload_ttl)).all()
+        if expired:
+            ids = [row.id for row in expired]
+            AttachmentUpload.query.filter(AttachmentUpload.id.in_(ids)).delete(synchronize_session=False)
+            db.session.commit()
+            for upload_id in ids:
+                self.discard_part(upload_id)
+            removed['uploads'] += len(ids)
+        # Part files of single-shot uploads interrupted by a crash have no row at all
+        uploads = os.path.join(self.directory, 'uploads')
+        for entry in os.scandir(uploads):
+            if entry.name.endswith('.part') and entry.stat().st_mtime < cutoff:
+                upload_id = entry.name[:-len('.part')]
+                if db.session.get(AttachmentUpload, upload_id) is None:
+                    os.remove(entry.path)
+                    removed['uploads'] += 1
+
+        candidates = []
+        for root, _, names in os.walk(os.path.join(self.directory, 'blobs')):
+            for name in names:
+                path = os.path.join(root, name)
+                if _CHECKSUM_RE.match(name) and os.path.getmtime(path) < cutoff:
+                    candidates.append(name)
+                if len(candidates) >= batch_size:
+                    removed['blobs'] += self._remove_unreferenced(candidates, cutoff)
+                    candidates = []
+        if candidates:
+            removed['blobs'] += self._remove_unreferenced(candidates, cutoff)
+        return removed
+
+    def _remove_unreferenced(self, checksums, cutoff):
+        referenced = {row.blob_hash for row in db.session.query(FileAttachment.blob_hash)
+                      .filter(FileAttachment.blob_hash.in_(checksums)).distinct()}
+        removed = 0
+        for checksum in checksums:
+            path = self.path(checksum)
+            # Rechecked in case an upload deduplicated onto it since the scan
+            if checksum in referenced or not os.path.exists(path) or os.path.getmtime(path) >= cutoff:
+                continue
+            os.remove(path)
+            removed += 1
+        return removed
+
+    def _gc_loop(self, app, socketio):
+        while True:
+            socketio.sleep(self.gc_interval)
+            with app.app_context():
+                try:
+                    self.collect_garbage()
+                except Exception:
+                    db.session.rollback()
+                    app.logger.exception('Attachment garbage collection failed')
+                finally:
+                    db.session.remove()
+
+
+blobs = BlobStore()
@@ -0,0 +1,91 @@
+"""Out-of-row, content-addressed storage for note bodies.
+
+`Note.content` is a plain property: assigning it records the SHA-256 of the HTML
+in `Note.body_hash`, and the body itself is written to `note_body` right before
+the flush that needs it. The write uses an insert that ignores conflicts, so
+identical bodies are stored once. Reading `content` lazily loads the body row,
+so listings and other queries over `note` never touch body bytes.
+
+Once a flush leaves a body unreferenced, that body is deleted in the same
+transaction.
+"""
+from sqlalchemy import event, delete, exists, inspect, select
+from sqlalchemy.dialects import postgresql, sqlite
+from models import db, Note, NoteBody
+
+
+def store(connection, contents):
+    """Insert bodies for `contents` that are not stored yet; returns {content: checksum}."""
+    rows, checksums = {}, {}
+    for content in contents:
+        if not content:
+            checksums[content] = None
+            continue
+        row = NoteBody.pack(content)
+        rows[row['checksum']] = row
+        checksums[content] = row['checksum']
+    if not rows:
+        return checksums
+    dialect = connection.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        connection.execute(insert(NoteBody).on_conflict_do_nothing(index_elements=[NoteBody.checksum]),
+                           list(rows.values()))
+    else:
+        present = set(connection.execute(select(NoteBody.checksum).where(NoteBody.checksum.in_(list(rows)))).scalars())
+        missing = [row for checksum, row in rows.items() if checksum not in present]
+        if missing:
+            connection.execute(NoteBody.__table__.insert(), missing)
+    return checksums
+
+
+def load(session, checksums):
+    """{checksum: html} for the given checksums in one query."""
+    checksums = [c for c in set(checksums) if c]
+    if not checksums:
+        return {}
+    rows = session.query(NoteBody.checksum, NoteBody.data, NoteBody.compressed) \
+        .filter(NoteBody.checksum.in_(checksums))
+    return {checksum: NoteBody.unpack(data, compressed) for checksum, data, compressed in rows}
+
+
+def content_of(session, note_id):
+    """Stored content of one note without loading the Note row."""
+    row = session.query(NoteBody.data, NoteBody.compressed) \
+        .join(Note, Note.body_hash == NoteBody.checksum).filter(Note.id == note_id).first()
+    return NoteBody.unpack(*row) if row else ''
+
+
+def collect_garbage(connection, checksums):
+    """Delete the given bodies if no note refers to them any more."""
+    checksums = [c for c in set(checksums) if c]
+    if checksums:
+        connection.execute(delete(NoteBody).where(
+            NoteBody.checksum.in_(checksums),
+            ~exists().where(Note.body_hash == NoteBody.checksum)
+        ))
+
+
+# --- Session events ---
+@event.listens_for(db.session, 'before_flush')
+def _write_pending_bodies(session, flush_context, instances):
+    pending = [n for n in list(session.new) + list(session.dirty)
+               if isinstance(n, Note) and '_content' in n.__dict__]
+    if pending:
+        store(session.connection(), [n.__dict__['_content'] for n in pending])
+
+
+@event.listens_for(db.session, 'after_flush')
+def _drop_orphaned_bodies(session, flush_context):
+    released = []
+    for obj in session.dirty:
+        if isinstance(obj, Note):
+            released += inspect(obj).attrs.body_hash.history.deleted
+            obj.__dict__.pop('_content', None)
+            # The viewonly relationship may still hold the previous body
+            session.expire(obj, ['body'])
+    for obj in session.new:
+        if isinstance(obj, Note):
+            obj.__dict__.pop('_content', None)
+    released += [obj.body_hash for obj in session.deleted if isinstance(obj, Note)]
+    collect_garbage(session.connection(), released)
@@ -0,0 +1,92 @@
+"""Per-user change log behind the incremental sync feed.
+
+Mutation handlers call `record` inside their transaction for every user who can
+see the changed row. Only the latest change per (user, entity) is kept, so the
+log never grows beyond one row per visible item plus tombstones, and the row id
+is a monotonically increasing cursor (AUTOINCREMENT ids are never reused).
+
+A reader must never see id N+1 committed while N is still pending, or it would
+move its cursor past N for good. SQLite gets this for free because writers are
+serialized. On PostgreSQL ids come from a sequence at insert time, so writers
+take a transaction-scoped advisory lock before inserting: ids then commit in the
+order they were handed out. Other databases are not supported by the feed.
+"""
+from datetime import datetime
+from sqlalchemy import delete, func, insert, text
+from models import db, ChangeLog, Collaborator, Note
+
+ENTITIES = ('folder', 'note', 'task', 'label', 'collaborator')
+
+# Advisory lock key held by PostgreSQL transactions that write to the change log
+_LOCK_KEY = 0x6265656c6f67
+
+
+def note_audience(note):
+    """The owner of `note` plus everyone it is shared with."""
+    users = {note.user_id}
+    users.update(uid for (uid,) in db.session.query(Collaborator.user_id).filter(Collaborator.note_id == note.id))
+    return users
+
+
+def note_audiences(note_ids):
+    """{note_id: audience} for many notes, from one collaborator query."""
+    note_ids = list(note_ids)
+    audiences = {note_id: {owner_id} for note_id, owner_id in
+                 db.session.query(Note.id, Note.user_id).filter(Note.id.in_(note_ids))} if note_ids else {}
+    if audiences:
+        for note_id, user_id in db.session.query(Collaborator.note_id, Collaborator.user_id) \
+                .filter(Collaborator.note_id.in_(list(audiences))):
+            audiences[note_id].add(user_id)
+    return audiences
+
+
+def _serialize():
+    # Held until commit or rollback, so a later writer cannot commit a higher id first
+    connection = db.session.connection()
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': _LOCK_KEY})
+
+
+def record(entity, entity_id, user_ids, op='upsert'):
+    """Log an upsert or tombstone of one row for each user in `user_ids`."""
+    user_ids = {u for u in user_ids if u is not None}
+    if not user_ids:
+        return
+    _serialize()
+    db.session.execute(delete(ChangeLog).where(
+        ChangeLog.user_id.in_(user_ids),
+        ChangeLog.entity == entity,
+        ChangeLog.entity_id == entity_id
+    ))
+    db.session.add_all([ChangeLog(user_id=u, entity=entity, entity_id=entity_id, op=op) for u in user_ids])
+
+
+def record_many(entity, entity_ids, user_ids, op='upsert', chunk_size=500):
+    """`record` for many rows of one entity at once, in a few set-based statements."""
+    user_ids = {u for u in user_ids if u is not None}
+    entity_ids = list(dict.fromkeys(entity_ids))
+    if not user_ids or not entity_ids:
+        return
+    _serialize()
+    for start in range(0, len(entity_ids), chunk_size):
+        chunk = entity_ids[start:start + chunk_size]
+        db.session.execute(delete(ChangeLog).where(
+            ChangeLog.user_id.in_(user_ids),
+            ChangeLog.entity == entity,
+            ChangeLog.entity_id.in_(chunk)
+        ))
+        db.session.execute(insert(ChangeLog), [
+            {'user_id': u, 'entity': entity, 'entity_id': i, 'op': op, 'created_at': datetime.utcnow()}
+            for u in user_ids for i in chunk
+        ])
+
+
+def latest_cursor(user_id):
+    return db.session.query(func.max(ChangeLog.id)).filter(ChangeLog.user_id == user_id).scalar() or 0
+
+
+def changes_since(user_id, cursor, limit):
+    """Return (entries, has_more) for changes after `cursor`, oldest first."""
+    rows = ChangeLog.query.filter(ChangeLog.user_id == user_id, ChangeLog.id > cursor) \
+        .order_by(ChangeLog.id).limit(limit + 1).all()
+    return rows[:limit], len(rows) > limit
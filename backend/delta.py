@@ -0,0 +1,403 @@
+"""Minimal port of Quill's Delta format (quill-delta 3.x) used by the collaborative editor.
+
+Only what the server needs is implemented: building deltas, `compose` to apply an
+edit to a document, `transform` to rebase concurrent edits and `to_html` to persist
+a room's contents as the HTML the editor loads. Lengths are counted in UTF-16 code
+units so indexes agree with the browser.
+"""
+import copy
+import html
+
+INFINITY = float('inf')
+
+# Values accepted for the attributes `to_html` renders; None clears an attribute in a retain
+_BOOLEAN_FORMATS = ('bold', 'italic', 'underline', 'strike', 'blockquote', 'code-block')
+_LIST_VALUES = ('ordered', 'bullet', 'checked', 'unchecked')
+_ALIGN_VALUES = ('center', 'right', 'justify')
+MAX_INDENT = 8
+
+
+def _check_attributes(attributes):
+    for name, value in attributes.items():
+        if value is None:
+            continue
+        if name in _BOOLEAN_FORMATS:
+            ok = isinstance(value, bool)
+        elif name == 'header':
+            ok = isinstance(value, int) and not isinstance(value, bool) and 1 <= value <= 6
+        elif name == 'indent':
+            ok = isinstance(value, int) and not isinstance(value, bool) and 1 <= value <= MAX_INDENT
+        elif name == 'list':
+            ok = value in _LIST_VALUES
+        elif name == 'align':
+            ok = value in _ALIGN_VALUES
+        elif name == 'link':
+            ok = isinstance(value, str)
+        else:
+            ok = True
+        if not ok:
+            raise ValueError(f'Invalid value for the {name} attribute')
+
+
+def _utf16_len(text):
+    return len(text.encode('utf-16-le')) // 2
+
+
+def _utf16_slice(text, start, length):
+    raw = text.encode('utf-16-le')
+    return raw[start * 2:(start + length) * 2].decode('utf-16-le', errors='ignore')
+
+
+def op_length(op):
+    if 'delete' in op:
+        return op['delete']
+    if 'retain' in op:
+        return op['retain']
+    return _utf16_len(op['insert']) if isinstance(op['insert'], str) else 1
+
+
+def op_type(op):
+    if op is None:
+        return 'retain'
+    if 'delete' in op:
+        return 'delete'
+    if 'retain' in op:
+        return 'retain'
+    return 'insert'
+
+
+def compose_attributes(a, b, keep_null):
+    a = a or {}
+    b = b or {}
+    attributes = copy.deepcopy(b)
+    if not keep_null:
+        attributes = {k: v for k, v in attributes.items() if v is not None}
+    for key, value in a.items():
+        if key not in b:
+            attributes[key] = value
+    return attributes or None
+
+
+def transform_attributes(a, b, priority):
+    if not isinstance(a, dict):
+        return b
+    if not isinstance(b, dict):
+        return None
+    if not priority:
+        return b
+    attributes = {k: v for k, v in b.items() if k not in a}
+    return attributes or None
+
+
+class _OpIterator:
+    def __init__(self, ops):
+        self.ops = ops
+        self.index = 0
+        self.offset = 0
+
+    def has_next(self):
+        return self.peek_length() < INFINITY
+
+    def peek(self):
+        return self.ops[self.index] if self.index < len(self.ops) else None
+
+    def peek_length(self):
+        op = self.peek()
+        return op_length(op) - self.offset if op else INFINITY
+
+    def peek_type(self):
+        return op_type(self.peek())
+
+    def next(self, length=INFINITY):
+        op = self.peek()
+        if op is None:
+            return {'retain': INFINITY}
+        offset = self.offset
+        remaining = op_length(op) - offset
+        if length >= remaining:
+            length = remaining
+            self.index += 1
+            self.offset = 0
+        else:
+            self.offset += length
+
+        if 'delete' in op:
+            return {'delete': length}
+        result = {}
+        if op.get('attributes'):
+            result['attributes'] = op['attributes']
+        if 'retain' in op:
+            result['retain'] = length
+        elif isinstance(op['insert'], str):
+            result['insert'] = _utf16_slice(op['insert'], offset, length)
+        else:
+            result['insert'] = op['insert']
+        return result
+
+
+class Delta:
+    def __init__(self, ops=None):
+        if isinstance(ops, Delta):
+            ops = ops.ops
+        elif isinstance(ops, dict):
+            ops = ops.get('ops', [])
+        self.ops = []
+        for op in ops or []:
+            self.push(op)
+
+    @classmethod
+    def from_json(cls, data):
+        """Validate a client payload (`{ops: [...]}` or a bare list) and build a Delta."""
+        ops = data.get('ops') if isinstance(data, dict) else data
+        if not isinstance(ops, list):
+            raise ValueError('Delta must be a list of ops')
+        for op in ops:
+            if not isinstance(op, dict):
+                raise ValueError('Delta op must be an object')
+            kinds = [k for k in ('insert', 'retain', 'delete') if k in op]
+            if len(kinds) != 1:
+                raise ValueError('Delta op must have exactly one of insert, retain or delete')
+            kind = kinds[0]
+            if kind == 'insert' and not isinstance(op['insert'], (str, dict)):
+                raise ValueError('Insert must be a string or an embed object')
+            if kind != 'insert' and (not isinstance(op[kind], int) or isinstance(op[kind], bool) or op[kind] < 0):
+                raise ValueError(f'{kind} must be a non-negative integer')
+            if kind == 'insert' and isinstance(op['insert'], dict) and not all(
+                    isinstance(v, str) for v in op['insert'].values()):
+                raise ValueError('Embed values must be strings')
+            if 'attributes' in op and op['attributes'] is not None:
+                if not isinstance(op['attributes'], dict):
+                    raise ValueError('Attributes must be an object')
+                _check_attributes(op['attributes'])
+        return cls(ops)
+
+    def to_json(self):
+        return {'ops': copy.deepcopy(self.ops)}
+
+    def __eq__(self, other):
+        return isinstance(other, Delta) and self.ops == other.ops
+
+    def __repr__(self):
+        return f'Delta({self.ops!r})'
+
+    def length(self):
+        return sum(op_length(op) for op in self.ops)
+
+    def base_length(self):
+        """Length of the document this delta applies to, excluding any implied trailing retain."""
+        return sum(op_length(op) for op in self.ops if 'insert' not in op)
+
+    # --- Builders ---
+    def insert(self, value, attributes=None):
+        if isinstance(value, str) and not value:
+            return self
+        op = {'insert': value}
+        if attributes:
+            op['attributes'] = attributes
+        return self.push(op)
+
+    def retain(self, length, attributes=None):
+        if length <= 0:
+            return self
+        op = {'retain': length}
+        if attributes:
+            op['attributes'] = attributes
+        return self.push(op)
+
+    def delete(self, length):
+        if length <= 0:
+            return self
+        return self.push({'delete': length})
+
+    def push(self, new_op):
+        new_op = copy.deepcopy(new_op)
+        if not new_op.get('attributes'):
+            new_op.pop('attributes', None)
+        index = len(self.ops)
+        last_op = self.ops[index - 1] if index else None
+        if last_op is not None:
+            if 'delete' in new_op and 'delete' in last_op:
+                self.ops[index - 1] = {'delete': last_op['delete'] + new_op['delete']}
+                return self
+            # Inserting before or after a delete at the same index is equivalent; prefer insert first
+            if 'delete' in last_op and 'insert' in new_op:
+                index -= 1
+                last_op = self.ops[index - 1] if index else None
+                if last_op is None:
+                    self.ops.insert(0, new_op)
+                    return self
+            if new_op.get('attributes') == last_op.get('attributes'):
+                merged = None
+                if isinstance(new_op.get('insert'), str) and isinstance(last_op.get('insert'), str):
+                    merged = {'insert': last_op['insert'] + new_op['insert']}
+                elif 'retain' in new_op and 'retain' in last_op:
+                    merged = {'retain': last_op['retain'] + new_op['retain']}
+                if merged is not None:
+                    if new_op.get('attributes'):
+                        merged['attributes'] = new_op['attributes']
+                    self.ops[index - 1] = merged
+                    return self
+        self.ops.insert(index, new_op)
+        return self
+
+    def chop(self):
+        if self.ops and 'retain' in self.ops[-1] and not self.ops[-1].get('attributes'):
+            self.ops.pop()
+        return self
+
+    # --- Operations ---
+    def compose(self, other):
+        """Return the delta equivalent to applying `self` then `other`."""
+        this_iter = _OpIterator(self.ops)
+        other_iter = _OpIterator(other.ops)
+        result = Delta()
+        while this_iter.has_next() or other_iter.has_next():
+            if other_iter.peek_type() == 'insert':
+                result.push(other_iter.next())
+            elif this_iter.peek_type() == 'delete':
+                result.push(this_iter.next())
+            else:
+                length = min(this_iter.peek_length(), other_iter.peek_length())
+                this_op = this_iter.next(length)
+                other_op = other_iter.next(length)
+                if 'retain' in other_op:
+                    new_op = {'retain': length} if 'retain' in this_op else {'insert': this_op['insert']}
+                    attributes = compose_attributes(this_op.get('attributes'), other_op.get('attributes'),
+                                                    'retain' in this_op)
+                    if attributes:
+                        new_op['attributes'] = attributes
+                    result.push(new_op)
+                elif 'delete' in other_op and 'retain' in this_op:
+                    result.push(other_op)
+        return result.chop()
+
+    def transform(self, other, priority=False):
+        """Rebase `other` so it applies after `self`; `priority` means `self` happened first."""
+        this_iter = _OpIterator(self.ops)
+        other_iter = _OpIterator(other.ops)
+        result = Delta()
+        while this_iter.has_next() or other_iter.has_next():
+            if this_iter.peek_type() == 'insert' and (priority or other_iter.peek_type() != 'insert'):
+                result.retain(op_length(this_iter.next()))
+            elif other_iter.peek_type() == 'insert':
+                result.push(other_iter.next())
+            else:
+                length = min(this_iter.peek_length(), other_iter.peek_length())
+                this_op = this_iter.next(length)
+                other_op = other_iter.next(length)
+                if 'delete' in this_op:
+                    continue
+                if 'delete' in other_op:
+                    result.push(other_op)
+                else:
+                    result.retain(length, transform_attributes(this_op.get('attributes'),
+                                                               other_op.get('attributes'), priority))
+        return result.chop()
+
+
+# --- HTML rendering ---
+# Inline formats from outermost to innermost, matching Quill's DOM nesting
+_INLINE_TAGS = [('link', 'a'), ('bold', 'strong'), ('italic', 'em'), ('strike', 's'), ('underline', 'u')]
+_HEADER_TAGS = {1: 'h1', 2: 'h2', 3: 'h3', 4: 'h4', 5: 'h5', 6: 'h6'}
+
+
+def _render_inline(op):
+    attributes = op.get('attributes') or {}
+    value = op['insert']
+    if isinstance(value, dict):
+        if 'image' in value:
+            return f'<img src="{html.escape(str(value["image"]))}">'
+        return ''
+    text = html.escape(value, quote=False)
+    for name, tag in reversed(_INLINE_TAGS):
+        if attributes.get(name):
+            if tag == 'a':
+                text = f'<a href="{html.escape(str(attributes[name]))}" target="_blank">{text}</a>'
+            else:
+                text = f'<{tag}>{text}</{tag}>'
+    return text
+
+
+def _block_classes(attributes):
+    # Values are checked again here: contents stored before validation must still render
+    classes = []
+    indent = attributes.get('indent')
+    if isinstance(indent, int) and 1 <= indent <= MAX_INDENT:
+        classes.append(f'ql-indent-{indent}')
+    if attributes.get('align') in _ALIGN_VALUES:
+        classes.append(f'ql-align-{attributes["align"]}')
+    return f' class="{" ".join(classes)}"' if classes else ''
+
+
+def _lines(delta):
+    """Yield (inline ops, block attributes) for each newline-terminated line of a document delta."""
+    line = []
+    for op in delta.ops:
+        if 'insert' not in op:
+            continue
+        value = op['insert']
+        if not isinstance(value, str):
+            line.append(op)
+            continue
+        parts = value.split('\n')
+        for index, part in enumerate(parts):
+            if part:
+                line.append({'insert': part, 'attributes': op.get('attributes')})
+            if index < len(parts) - 1:
+                yield line, op.get('attributes') or {}
+                line = []
+    if line:
+        yield line, {}
+
+
+# Container opened around runs of list or code lines, by line kind
+_CONTAINERS = {
+    'pre': '<pre class="ql-syntax" spellcheck="false">',
+    'ordered': '<ol>',
+    'bullet': '<ul>',
+    'checked': '<ul data-checked="true">',
+    'unchecked': '<ul data-checked="false">',
+}
+
+
+def _close(container):
+    return '</pre>' if container == 'pre' else '</ol>' if container == 'ordered' else '</ul>'
+
+
+def to_html(delta):
+    """Render a document delta to the HTML Quill 1.3 produces for the editor's formats.
+
+    Only the formats enabled in the editor (see `formats` in editor.js) are rendered.
+    """
+    out = []
+    container = None  # key of `_CONTAINERS` for runs of list or code lines
+    for ops, attributes in _lines(delta):
+        inner = ''.join(_render_inline(op) for op in ops)
+        if attributes.get('code-block'):
+            kind = 'pre'
+        elif attributes.get('list') in _LIST_VALUES:
+            kind = attributes['list']
+        else:
+            kind = None
+
+        if container and container != kind:
+            out.append(_close(container))
+            container = None
+        if kind and container != kind:
+            out.append(_CONTAINERS[kind])
+            container = kind
+
+        classes = _block_classes(attributes)
+        if kind == 'pre':
+            out.append(html.escape(''.join(op['insert'] for op in ops if isinstance(op['insert'], str)), quote=False) + '\n')
+        elif kind:
+            out.append(f'<li{classes}>{inner or "<br>"}</li>')
+        else:
+            header = attributes.get('header')
+            tag = _HEADER_TAGS.get(header if isinstance(header, int) else None,
+                                   'blockquote' if attributes.get('blockquote') else 'p')
+            out.append(f'<{tag}{classes}>{inner or "<br>"}</{tag}>')
+
+    if container:
+        out.append(_close(container))
+    return ''.join(out)
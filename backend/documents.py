@@ -0,0 +1,238 @@
+"""Authoritative state for collaborative editing rooms.
+
+Each open note has one document holding the composed Quill contents, a
+monotonically increasing version and a bounded history of applied deltas. Clients
+submit deltas against the version they last saw; the server rebases them over
+anything applied since, so only small deltas ever cross the wire.
+
+A single process keeps this in memory. When several workers share rooms through
+a message queue, `RedisDocumentRegistry` keeps the same state in Redis so every
+worker rebases against one version sequence.
+"""
+import json
+import threading
+from delta import Delta
+
+# Deltas kept per room for rebasing late edits; older clients must resync from a snapshot
+HISTORY_LIMIT = 500
+
+# How long an emptied room's contents stay readable for late write-behind flushes (seconds)
+IDLE_TTL = 600
+
+
+class StaleVersionError(Exception):
+    """The client's base version is unknown or too old to rebase onto."""
+
+
+def _rebase(history, oldest, version, base_version, delta):
+    if base_version is None or base_version < oldest or base_version > version:
+        raise StaleVersionError(base_version)
+    for applied in history[base_version - oldest:]:
+        delta = applied.transform(delta, True)
+    return delta
+
+
+def _check_fits(contents, delta):
+    # Quill omits the trailing retain, so a delta may cover less of the document but never more
+    if delta.base_length() > contents.length():
+        raise ValueError('Delta does not fit the document')
+
+
+class DocumentState:
+    def __init__(self, contents=None):
+        self.contents = Delta(contents)
+        # Only a joiner allowed to write may seed the contents; a room opened by readers waits for one
+        self.seeded = contents is not None
+        self.version = 0
+        self.history = []
+        self.members = set()
+
+    def snapshot(self):
+        return {'version': self.version, 'delta': self.contents.to_json()}
+
+    def apply(self, base_version, delta):
+        """Rebase `delta` from `base_version` onto the current state and apply it."""
+        delta = _rebase(self.history, self.version - len(self.history), self.version, base_version, delta)
+        _check_fits(self.contents, delta)
+        self.contents = self.contents.compose(delta)
+        self.version += 1
+        self.history.append(delta)
+        if len(self.history) > HISTORY_LIMIT:
+            del self.history[:len(self.history) - HISTORY_LIMIT]
+        return self.version, delta
+
+
+class DocumentRegistry:
+    """In-process registry; correct only while one worker owns every room."""
+
+    def __init__(self):
+        self._docs = {}
+        self._lock = threading.Lock()
+
+    def snapshot(self, room):
+        doc = self._docs.get(room)
+        return doc.snapshot() if doc else None
+
+    def contents(self, room):
+        doc = self._docs.get(room)
+        return doc.contents if doc else None
+
+    def join(self, room, sid, contents=None):
+        """Add `sid` to the room; returns (snapshot, seeded).
+
+        `contents` (None for read-only joiners) seeds a room that has no seeded state yet,
+        and `seeded` says it did. The snapshot is None while nobody has seeded the room.
+        """
+        with self._lock:
+            doc = self._docs.get(room)
+            seeded = False
+            if doc is None:
+                doc = self._docs[room] = DocumentState(contents)
+                seeded = doc.seeded
+            elif contents is not None and not doc.seeded:
+                doc.contents, doc.seeded, seeded = Delta(contents), True, True
+            doc.members.add(sid)
+            return (doc.snapshot() if doc.seeded else None), seeded
+
+    def leave(self, room, sid):
+        """Remove `sid` from the room; returns True when the room became empty and was dropped."""
+        with self._lock:
+            doc = self._docs.get(room)
+            if doc is None:
+                return False
+            doc.members.discard(sid)
+            if not doc.members:
+                del self._docs[room]
+                return True
+            return False
+
+    def rooms_for(self, sid):
+        return [room for room, doc in list(self._docs.items()) if sid in doc.members]
+
+    def apply(self, room, base_version, delta):
+        with self._lock:
+            doc = self._docs.get(room)
+            if doc is None:
+                raise StaleVersionError(base_version)
+            return doc.apply(base_version, delta)
+
+
+class RedisDocumentRegistry:
+    """Registry shared by every worker through Redis; each apply runs under a per-room lock."""
+
+    def __init__(self, url, prefix='bee'):
+        import redis
+        self.redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def _key(self, room, part):
+        return f'{self.prefix}:doc:{room}:{part}'
+
+    def _sid_key(self, sid):
+        return f'{self.prefix}:sid:{sid}'
+
+    def _lock(self, room):
+        return self.redis.lock(self._key(room, 'lock'), timeout=10, blocking_timeout=5)
+
+    def snapshot(self, room):
+        version, contents = self.redis.hmget(self._key(room, 'state'), 'version', 'contents')
+        if version is None:
+            return None
+        return {'version': int(version), 'delta': json.loads(contents)}
+
+    def contents(self, room):
+        snapshot = self.snapshot(room)
+        return Delta(snapshot['delta']) if snapshot else None
+
+    def join(self, room, sid, contents=None):
+        with self._lock(room):
+            members = self._key(room, 'members')
+            # An empty room is reseeded: its lingering state may predate REST edits. Readers
+            # (contents None) leave it unseeded, and the first writer to join seeds it
+            empty = not self.redis.scard(members)
+            state = self._key(room, 'state')
+            seeded = contents is not None and (empty or self.redis.hget(state, 'seeded') == b'0')
+            if empty or seeded:
+                pipe = self.redis.pipeline()
+                pipe.delete(self._key(room, 'history'))
+                pipe.hset(state, mapping={
+                    'version': 0, 'contents': json.dumps(Delta(contents).to_json()), 'seeded': int(seeded)
+                })
+                pipe.persist(state)
+                pipe.execute()
+            pipe = self.redis.pipeline()
+            pipe.sadd(members, sid)
+            pipe.sadd(self._sid_key(sid), str(room))
+            pipe.execute()
+            # States written before the flag existed count as seeded
+            if self.redis.hget(state, 'seeded') == b'0':
+                return None, False
+            return self.snapshot(room), seeded
+
+    def leave(self, room, sid):
+        with self._lock(room):
+            pipe = self.redis.pipeline()
+            pipe.srem(self._key(room, 'members'), sid)
+            pipe.srem(self._sid_key(sid), str(room))
+            pipe.scard(self._key(room, 'members'))
+            remaining = pipe.execute()[-1]
+            if remaining:
+                return False
+            # Keep the contents around briefly so other workers' buffered flushes read the newest state
+            pipe = self.redis.pipeline()
+            pipe.expire(self._key(room, 'state'), IDLE_TTL)
+            pipe.delete(self._key(room, 'history'))
+            pipe.execute()
+            return True
+
+    def rooms_for(self, sid):
+        rooms = []
+        for raw in self.redis.smembers(self._sid_key(sid)):
+            room = raw.decode()
+            rooms.append(int(room) if room.isdigit() else room)
+        return rooms
+
+    def apply(self, room, base_version, delta):
+        with self._lock(room):
+            state_key, history_key = self._key(room, 'state'), self._key(room, 'history')
+            version, contents = self.redis.hmget(state_key, 'version', 'contents')
+            if version is None:
+                raise StaleVersionError(base_version)
+            version = int(version)
+            oldest = version - self.redis.llen(history_key)
+            # Only the deltas newer than the client's base are needed to rebase it
+            start = base_version - oldest if isinstance(base_version, int) and base_version >= oldest else 0
+            history = [Delta(json.loads(raw)) for raw in self.redis.lrange(history_key, start, -1)]
+            delta = _rebase(history, oldest + start, version, base_version, delta)
+
+            contents = Delta(json.loads(contents))
+            _check_fits(contents, delta)
+            contents = contents.compose(delta)
+            pipe = self.redis.pipeline()
+            pipe.hset(state_key, mapping={'version': version + 1, 'contents': json.dumps(contents.to_json())})
+            pipe.rpush(history_key, json.dumps(delta.to_json()))
+            pipe.ltrim(history_key, -HISTORY_LIMIT, -1)
+            pipe.execute()
+            return version + 1, delta
+
+
+class _RegistryProxy:
+    """Module-level handle whose backend is chosen by `configure` at app start."""
+
+    def __init__(self):
+        self.backend = DocumentRegistry()
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+
+documents = _RegistryProxy()
+
+
+def configure(url=None):
+    """Use Redis-backed rooms when `url` is a redis:// URL, otherwise keep them in memory."""
+    if url and url.startswith(('redis://', 'rediss://')):
+        documents.backend = RedisDocumentRegistry(url)
+    else:
+        documents.backend = DocumentRegistry()
+    return documents.backend
@@ -0,0 +1,199 @@
+"""Outbound coalescing, inbound rate limits and backpressure for document rooms.
+
+Applied edits are not broadcast one by one. They collect per room for
+`SOCKET_COALESCE_MS` and go out in version order. Consecutive deltas from the
+same sender are composed into one `document_updated`, and the sender gets a
+single `edit_ack` covering them. Presence changes keep only the newest state
+per user.
+
+Each connection draws edits and snapshot requests from a token bucket. An
+event over the limit is refused with `edit_rejected`, and the client retries.
+A client whose outbound engine.io queue is deeper than `SOCKET_MAX_QUEUE` stops
+receiving deltas. Once its queue drains, it gets a single snapshot in their
+place. Queue depth is only visible for clients connected to this worker.
+"""
+import threading
+import time
+from collections import defaultdict
+
+_COUNTERS = ('edits', 'coalesced', 'emitted', 'dropped', 'collapsed', 'rate_limited', 'presence_coalesced')
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def retry_after(self):
+        return max(0.0, (1 - self.tokens) / self.rate) if self.rate else 1.0
+
+
+class RoomFanout:
+    def __init__(self):
+        self.socketio = None
+        self.window = 0.04
+        self.rate = 30.0
+        self.burst = 60
+        self.max_queue = 100
+        self._rooms = {}  # room -> {'runs': [...], 'presence': {...}, 'scheduled': bool}
+        self._lagging = defaultdict(set)  # room -> sids skipped until their queue drains
+        self._buckets = {}  # sid -> TokenBucket
+        self._stats = defaultdict(lambda: dict.fromkeys(_COUNTERS, 0))
+        self._totals = dict.fromkeys(_COUNTERS, 0)
+        self._lock = threading.Lock()
+
+    def init_app(self, app, socketio):
+        self.socketio = socketio
+        self.window = app.config['SOCKET_COALESCE_MS'] / 1000.0
+        self.rate = app.config['SOCKET_EDIT_RATE']
+        self.burst = app.config['SOCKET_EDIT_BURST']
+        self.max_queue = app.config['SOCKET_MAX_QUEUE']
+
+    def _count(self, room, name, n=1):
+        self._stats[room][name] += n
+        self._totals[name] += n
+
+    # --- Inbound ---
+    def allow(self, sid, room=None):
+        """Take a token for `sid`; returns 0 when allowed, else seconds until a retry can succeed."""
+        with self._lock:
+            bucket = self._buckets.get(sid)
+            if bucket is None:
+                bucket = self._buckets[sid] = TokenBucket(self.rate, self.burst)
+            if bucket.take():
+                return 0
+            self._count(room, 'rate_limited')
+            return bucket.retry_after() or 0.001
+
+    def forget(self, sid):
+        with self._lock:
+            self._buckets.pop(sid, None)
+            for lagging in self._lagging.values():
+                lagging.discard(sid)
+
+    # --- Outbound ---
+    def edit(self, room, sid, user_id, version, delta):
+        """Queue an applied delta (producing `version`) for the room's next flush."""
+        with self._lock:
+            state = self._rooms.setdefault(room, {'runs': [], 'presence': {}, 'scheduled': False})
+            self._count(room, 'edits')
+            runs = state['runs']
+            tail = runs[-1] if runs else None
+            # Only deltas with no other edit in between can be composed into one message
+            if tail and tail['sid'] == sid and tail['version'] == version - 1:
+                tail['delta'] = tail['delta'].compose(delta)
+                tail['version'] = version
+                self._count(room, 'coalesced')
+            else:
+                runs.append({'sid': sid, 'user_id': user_id, 'base_version': version - 1,
+                             'version': version, 'delta': delta})
+        self._schedule(room)
+
+    def presence(self, room, sid, user_id, state_name):
+        """Queue a presence change ('joined' or 'left'); only the newest per user is sent."""
+        with self._lock:
+            state = self._rooms.setdefault(room, {'runs': [], 'presence': {}, 'scheduled': False})
+            if user_id in state['presence']:
+                self._count(room, 'presence_coalesced')
+            state['presence'][user_id] = (state_name, sid)
+        self._schedule(room)
+
+    def _schedule(self, room):
+        if self.window <= 0 or self.socketio is None:
+            return self.flush(room)
+        with self._lock:
+            state = self._rooms.get(room)
+            if state is None or state['scheduled']:
+                return
+            state['scheduled'] = True
+        self.socketio.start_background_task(self._flush_later, room)
+
+    def _flush_later(self, room):
+        self.socketio.sleep(self.window)
+        self.flush(room)
+
+    def _queue_depths(self, room):
+        server = self.socketio.server
+        for sid, eio_sid in server.manager.get_participants('/', room):
+            socket = server.eio.sockets.get(eio_sid)
+            if socket is not None:
+                yield sid, socket.queue.qsize()
+
+    def flush(self, room):
+        """Send everything queued for `room`, in version order."""
+        from documents import documents
+        with self._lock:
+            state = self._rooms.pop(room, None)
+        if not state or self.socketio is None:
+            return
+
+        lagging = self._lagging[room]
+        recovered = []
+        for sid, depth in self._queue_depths(room):
+            if depth > self.max_queue:
+                lagging.add(sid)
+            elif sid in lagging and depth <= self.max_queue // 4:
+                lagging.discard(sid)
+                recovered.append(sid)
+
+        for run in state['runs']:
+            skip = {run['sid']} | lagging | set(recovered)
+            self.socketio.emit('document_updated', {
+                'document_id': room,
+                'base_version': run['base_version'],
+                'version': run['version'],
+                'delta': run['delta'].to_json(),
+                'user_id': run['user_id']
+            }, room=room, skip_sid=list(skip))
+            # Acks are tiny and keep the sender's pipeline moving, so they are never dropped
+            self.socketio.emit('edit_ack', {
+                'document_id': room, 'base_version': run['base_version'], 'version': run['version']
+            }, to=run['sid'])
+        for user_id, (state_name, sid) in state['presence'].items():
+            self.socketio.emit(f'user_{state_name}', {'user_id': user_id}, room=room,
+                               skip_sid=list({sid} | lagging))
+
+        # One snapshot replaces every delta a slow client missed
+        snapshot = documents.snapshot(room) if recovered else None
+        for sid in recovered:
+            if snapshot:
+                self.socketio.emit('document_snapshot', {'document_id': room, **snapshot}, to=sid)
+
+        with self._lock:
+            self._count(room, 'emitted', len(state['runs']))
+            self._count(room, 'dropped', len(state['runs']) * len(lagging))
+            self._count(room, 'collapsed', len(recovered))
+            if not lagging:
+                self._lagging.pop(room, None)
+
+    def close(self, room):
+        """Flush and forget a room whose last member left; its counters stay in the totals."""
+        self.flush(room)
+        with self._lock:
+            self._stats.pop(room, None)
+            self._lagging.pop(room, None)
+
+    def metrics(self, rooms=None):
+        with self._lock:
+            selected = {room: dict(counters) for room, counters in self._stats.items()
+                        if room is not None and (rooms is None or room in rooms)}
+            return {
+                'totals': dict(self._totals),
+                'rooms': selected,
+                'lagging_clients': sum(len(s) for s in self._lagging.values()),
+                'window_ms': round(self.window * 1000, 1),
+            }
+
+
+fanout = RoomFanout()
@@ -0,0 +1,129 @@
+"""Folder hierarchy operations as recursive CTEs over the parent_id adjacency list.
+
+Subtree reads, cycle checks on move and cascading deletes each walk the tree
+inside the database with a `WITH RECURSIVE` query, so their cost does not
+depend on loading folders into Python one level at a time. A cascading delete
+removes the folders, their notes and everything hanging off those notes in a
+fixed number of set-based statements, and keeps the side indexes (search,
+change feed, workspace counters, permission cache) in step by hand, because
+bulk statements bypass ORM events.
+"""
+from sqlalchemy import delete, select, literal, update
+from models import (db, Folder, Note, NoteRevision, FileAttachment, AttachmentUpload, Collaborator,
+                    note_label)
+
+# Guards against runaway recursion should a cycle ever reach the table
+MAX_DEPTH = 100000
+
+
+class FolderError(ValueError):
+    """An invalid folder operation, e.g. moving a folder into its own subtree."""
+
+
+def subtree_cte(user_id, root_id):
+    """CTE of (id, depth) for `root_id` and every folder below it."""
+    tree = select(Folder.id, literal(0).label('depth')) \
+        .where(Folder.id == root_id, Folder.user_id == user_id) \
+        .cte('subtree', recursive=True)
+    tree = tree.union_all(
+        select(Folder.id, (tree.c.depth + 1).label('depth'))
+        .where(Folder.parent_id == tree.c.id, Folder.user_id == user_id, tree.c.depth < MAX_DEPTH)
+    )
+    return tree
+
+
+def ancestors_cte(user_id, folder_id):
+    """CTE of (id, parent_id, depth) walking up from `folder_id` to its root."""
+    path = select(Folder.id, Folder.parent_id, literal(0).label('depth')) \
+        .where(Folder.id == folder_id, Folder.user_id == user_id) \
+        .cte('ancestors', recursive=True)
+    path = path.union_all(
+        select(Folder.id, Folder.parent_id, (path.c.depth + 1).label('depth'))
+        .where(Folder.id == path.c.parent_id, Folder.user_id == user_id, path.c.depth < MAX_DEPTH)
+    )
+    return path
+
+
+def subtree(user_id, root_id):
+    """[(id, name, parent_id, depth)] of the subtree, parents before children."""
+    tree = subtree_cte(user_id, root_id)
+    return db.session.query(Folder.id, Folder.name, Folder.parent_id, tree.c.depth) \
+        .join(tree, tree.c.id == Folder.id).order_by(tree.c.depth, Folder.id).all()
+
+
+def move(user_id, folder_id, parent_id):
+    """Re-parent a folder and its subtree; `parent_id` None moves it to the top level."""
+    if parent_id is not None:
+        path = ancestors_cte(user_id, parent_id)
+        ids = {i for (i,) in db.session.query(path.c.id)}
+        if not ids:
+            raise FolderError('Target folder not found')
+        if folder_id in ids:
+            raise FolderError('Cannot move a folder into its own subtree')
+    db.session.query(Folder).filter_by(id=folder_id, user_id=user_id) \
+        .update({'parent_id': parent_id}, synchronize_session='fetch')
+
+
+def delete_subtree(user_id, root_id):
+    """Delete a folder, its subfolders and all their notes; returns (folder_ids, note_ids, upload_ids).
+
+    `changes` audiences are computed before the rows disappear and recorded here. The
+    part files of the returned uploads are the caller's to discard once it commits.
+    """
+    import changes
+    import search
+    import workspace
+    from bodies import collect_garbage
+    from permissions import permissions
+
+    tree = subtree_cte(user_id, root_id)
+    folder_ids = [i for (i,) in db.session.query(tree.c.id)]
+    if not folder_ids:
+        return [], [], []
+    folders_sq = select(tree.c.id)
+    # Only the folder owner's notes go; anyone else's note filed here is moved to their root below
+    in_subtree = (Note.folder_id.in_(folders_sq), Note.user_id == user_id)
+    notes_sq = select(Note.id).where(*in_subtree)
+
+    note_rows = db.session.query(Note.id, Note.user_id, Note.body_hash).filter(*in_subtree).all()
+    foreign = db.session.query(Note.id, Note.user_id) \
+        .filter(Note.folder_id.in_(folders_sq), Note.user_id != user_id).all()
+    note_ids = [row.id for row in note_rows]
+    upload_ids = [i for (i,) in db.session.query(AttachmentUpload.id).filter(AttachmentUpload.note_id.in_(notes_sq))]
+    audience = {}  # user_id -> note ids that disappear for that user
+    for row in note_rows:
+        audience.setdefault(row.user_id, []).append(row.id)
+    for note_id, collaborator_id in db.session.query(Collaborator.note_id, Collaborator.user_id) \
+            .filter(Collaborator.note_id.in_(notes_sq)):
+        audience.setdefault(collaborator_id, []).append(note_id)
+
+    connection = db.session.connection()
+    for statement in (
+        delete(Collaborator).where(Collaborator.note_id.in_(notes_sq)),
+        delete(FileAttachment).where(FileAttachment.note_id.in_(notes_sq)),
+        delete(AttachmentUpload).where(AttachmentUpload.note_id.in_(notes_sq)),
+        delete(note_label).where(note_label.c.note_id.in_(notes_sq)),
+        delete(NoteRevision).where(NoteRevision.note_id.in_(notes_sq)),
+    ):
+        connection.execute(statement)
+    search.remove_notes(connection, notes_sq)
+    connection.execute(delete(Note).where(*in_subtree))
+    if foreign:
+        connection.execute(update(Note).where(Note.id.in_([row.id for row in foreign])).values(folder_id=None))
+    # The whole subtree goes in one statement, so no child-first ordering is needed
+    connection.execute(delete(Folder).where(Folder.id.in_(folders_sq)))
+
+    collect_garbage(connection, [row.body_hash for row in note_rows])
+    changes.record_many('folder', folder_ids, [user_id], op='delete')
+    for uid, ids in audience.items():
+        changes.record_many('note', ids, [uid], op='delete')
+    moved = {}
+    for note_id, users in changes.note_audiences([row.id for row in foreign]).items():
+        moved.setdefault(frozenset(users), []).append(note_id)
+    for users, ids in moved.items():
+        changes.record_many('note', ids, users)
+    workspace.bump(connection, audience.keys() | {u for users in moved for u in users} | {user_id})
+    permissions.invalidate_on_commit(db.session, note_ids)
+    # ORM copies of the deleted rows are stale now
+    db.session.expire_all()
+    return folder_ids, note_ids, upload_ids
@@ -0,0 +1,235 @@
+"""Request, query and socket instrumentation, exported as Prometheus text at /metrics.
+
+`init_app` registers request hooks that time every request by endpoint name,
+and SQLAlchemy engine events that count statements and their time for the
+request or socket event running them. Socket handlers are wrapped with
+`timed_event` in `sockets.py`, which also records room sizes on join. Nothing
+here talks to a metrics backend: counters live in this worker and Prometheus
+scrapes each worker's `/metrics`. Those counters include the write-behind,
+fan-out, permission cache and password hashing stats.
+
+Set `METRICS_TOKEN` to require `Authorization: Bearer <token>` on scrapes.
+"""
+import functools
+import threading
+import time
+from flask import Response, g, has_request_context, request
+
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+PREFIX = 'bee_'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.label_names = PREFIX + name, help, tuple(labels)
+        self.values = {}
+
+    def inc(self, labels=(), amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in sorted(self.values.items()):
+            yield f'{self.name}{_labels(self.label_names, labels)} {_number(value)}'
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=TIME_BUCKETS):
+        self.name, self.help, self.label_names = PREFIX + name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self.values = {}  # labels -> [per-bucket counts..., +Inf count, sum]
+
+    def observe(self, value, labels=()):
+        row = self.values.get(labels)
+        if row is None:
+            row = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                row[i] += 1
+                break
+        else:
+            row[len(self.buckets)] += 1
+        row[-1] += value
+
+    def samples(self):
+        for labels, row in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), row[:-1]):
+                cumulative += count
+                le = 'le="+Inf"' if bound == '+Inf' else f'le="{bound}"'
+                yield f'{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}'
+            yield f'{self.name}_sum{_labels(self.label_names, labels)} {_number(row[-1])}'
+            yield f'{self.name}_count{_labels(self.label_names, labels)} {cumulative}'
+
+
+class Metrics:
+    def __init__(self):
+        self.socketio = None
+        self.token = None
+        self._lock = threading.Lock()
+        self.requests = Counter('http_requests_total', 'HTTP requests by endpoint, method and status.',
+                                ('endpoint', 'method', 'status'))
+        self.request_seconds = Histogram('http_request_duration_seconds',
+                                         'Request time including streamed bodies.', ('endpoint',))
+        self.request_queries = Histogram('http_request_queries', 'SQL statements per request.', ('endpoint',),
+                                         COUNT_BUCKETS)
+        self.query_seconds = Counter('db_query_seconds_total', 'Time spent in SQL statements.', ('source',))
+        self.queries = Counter('db_queries_total', 'SQL statements executed.', ('source',))
+        self.query_latency = Histogram('db_query_duration_seconds', 'Time per SQL statement.')
+        self.events = Counter('socket_events_total', 'Socket.IO events handled.', ('event',))
+        self.event_seconds = Histogram('socket_event_duration_seconds', 'Socket.IO handler time.', ('event',))
+        self.room_size = Histogram('socket_room_size', 'Room members right after a join.', buckets=SIZE_BUCKETS)
+        self._metrics = (self.requests, self.request_seconds, self.request_queries, self.queries,
+                         self.query_seconds, self.query_latency, self.events, self.event_seconds, self.room_size)
+
+    def init_app(self, app, engine, socketio=None):
+        from sqlalchemy import event
+        self.socketio = socketio
+        self.token = app.config['METRICS_TOKEN']
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        # Teardown runs once a streamed body has been sent, so list endpoints are timed in full
+        app.teardown_request(self._teardown_request)
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        app.add_url_rule('/metrics', 'metrics', self.export)
+
+    # --- Requests ---
+    def _before_request(self):
+        g.metrics_start = time.perf_counter()
+        g.metrics_queries = 0
+
+    def _after_request(self, response):
+        g.metrics_status = response.status_code
+        return response
+
+    def _teardown_request(self, exc):
+        start = g.pop('metrics_start', None)
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        endpoint = request.endpoint or 'unmatched'
+        status = g.pop('metrics_status', 500 if exc is not None else 200)
+        with self._lock:
+            self.requests.inc((endpoint, request.method, str(status)))
+            self.request_seconds.observe(elapsed, (endpoint,))
+            self.request_queries.observe(g.pop('metrics_queries', 0), (endpoint,))
+        g.metrics_elapsed = elapsed
+
+    # --- Queries ---
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._metrics_start = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, '_metrics_start', None)
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        source = 'background'
+        if has_request_context():
+            if 'metrics_queries' in g:
+                g.metrics_queries += 1
+            source = g.get('metrics_source', 'http')
+        with self._lock:
+            self.queries.inc((source,))
+            self.query_seconds.inc((source,), elapsed)
+            self.query_latency.observe(elapsed)
+
+    # --- Sockets ---
+    def timed_event(self, name):
+        """Decorate a Socket.IO handler to count it and time it."""
+        def decorator(handler):
+            @functools.wraps(handler)
+            def wrapper(*args, **kwargs):
+                g.metrics_source = 'socket'
+                start = time.perf_counter()
+                try:
+                    return handler(*args, **kwargs)
+                finally:
+                    elapsed = time.perf_counter() - start
+                    with self._lock:
+                        self.events.inc((name,))
+                        self.event_seconds.observe(elapsed, (name,))
+            return wrapper
+        return decorator
+
+    def observe_room(self, room):
+        if self.socketio is None:
+            return
+        size = sum(1 for _ in self.socketio.server.manager.get_participants('/', room))
+        with self._lock:
+            self.room_size.observe(size)
+
+    def _room_gauges(self):
+        if self.socketio is None or getattr(self.socketio, 'server', None) is None:
+            return []
+        rooms = self.socketio.server.manager.rooms.get('/', {})
+        # Every connection also sits in a room named after its sid and in the None room
+        sizes = [len(members) for room, members in rooms.items()
+                 if room is not None and not (len(members) == 1 and room in members)]
+        connections = len(rooms.get(None, {}))
+        return [
+            ('socket_connections', 'Connected Socket.IO clients on this worker.', connections),
+            ('socket_rooms', 'Open document rooms on this worker.', len(sizes)),
+            ('socket_room_members_max', 'Members in the largest room.', max(sizes, default=0)),
+        ]
+
+    # --- Export ---
+    def _component_gauges(self):
+        from fanout import fanout
+        from passwords import hasher
+        from permissions import permissions
+        from writebehind import write_behind
+        gauges = []
+        for component, stats in (('write_behind', write_behind.metrics()), ('fanout', fanout.metrics()['totals']),
+                                 ('permission_cache', permissions.metrics()), ('password_hasher', hasher.metrics())):
+            for key, value in stats.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    gauges.append((f'{component}_{key}', f'{component} {key}.', value))
+        return gauges
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for metric in self._metrics:
+                lines.append(f'# HELP {metric.name} {metric.help}')
+                lines.append(f'# TYPE {metric.name} {metric.kind}')
+                lines.extend(metric.samples())
+        for name, help, value in self._room_gauges() + self._component_gauges():
+            lines.append(f'# HELP {PREFIX}{name} {help}')
+            lines.append(f'# TYPE {PREFIX}{name} gauge')
+            lines.append(f'{PREFIX}{name} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def export(self):
+        if self.token and request.headers.get('Authorization') != f'Bearer {self.token}':
+            return Response('Unauthorized\n', status=401, mimetype='text/plain')
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+
+metrics = Metrics()
@@ -0,0 +1,80 @@
+"""Idempotent schema upgrades for databases created by older versions.
+
+`db.create_all()` only creates missing tables, so columns added to existing
+models are applied here at startup. Every step checks the live schema first
+and is safe to run on each boot.
+"""
+from sqlalchemy import inspect, text
+from models import db
+
+
+def _add_column(connection, table, column, ddl, backfill=None):
+    columns = {c['name'] for c in inspect(connection).get_columns(table)}
+    if column in columns:
+        return False
+    connection.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+    if backfill:
+        connection.execute(text(f'UPDATE {table} SET {column} = {backfill} WHERE {column} IS NULL'))
+    return True
+
+
+def _create_missing_indexes(connection):
+    inspector = inspect(connection)
+    tables = set(inspector.get_table_names())
+    created = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(connection)
+                created.append(index.name)
+    return created
+
+
+def _move_note_bodies(connection, batch_size=500):
+    # Bodies used to live inline in note.content; move them to note_body and clear the column
+    from bodies import store
+    if 'content' not in {c['name'] for c in inspect(connection).get_columns('note')}:
+        return 0
+    moved = 0
+    while True:
+        rows = connection.execute(text(
+            'SELECT id, content FROM note WHERE body_hash IS NULL AND content IS NOT NULL LIMIT :n'
+        ), {'n': batch_size}).all()
+        if not rows:
+            return moved
+        checksums = store(connection, [content for _, content in rows])
+        connection.execute(text('UPDATE note SET body_hash = :hash, content = NULL WHERE id = :id'),
+                           [{'id': note_id, 'hash': checksums[content]} for note_id, content in rows])
+        moved += len(rows)
+
+
+def upgrade(engine):
+    with engine.begin() as connection:
+        # Keyset pagination orders every list endpoint by (updated_at, id)
+        _add_column(connection, 'folder', 'updated_at', 'DATETIME', backfill='created_at')
+        _add_column(connection, 'task', 'updated_at', 'DATETIME', backfill='created_at')
+        _add_column(connection, 'note', 'body_hash', 'VARCHAR(64) REFERENCES note_body (checksum)')
+        _move_note_bodies(connection)
+        # Uploaded files point into the blob store; links keep using url
+        _add_column(connection, 'file_attachment', 'blob_hash', 'VARCHAR(64)')
+        _add_column(connection, 'file_attachment', 'size', 'INTEGER')
+        for table in ('folder', 'note', 'task'):
+            connection.execute(text(f'UPDATE {table} SET updated_at = CURRENT_TIMESTAMP WHERE updated_at IS NULL'))
+        # Status filters match the column directly, so tasks predating it get an explicit value
+        connection.execute(text(
+            "UPDATE task SET status = CASE WHEN is_completed THEN 'completed' ELSE 'pending' END WHERE status IS NULL"
+        ))
+
+        # scrypt hashes outgrew the original 128-character column; SQLite does not enforce lengths
+        if connection.dialect.name == 'postgresql':
+            password_hash = next(c for c in inspect(connection).get_columns('user') if c['name'] == 'password_hash')
+            if (password_hash['type'].length or 0) < 256:
+                connection.execute(text('ALTER TABLE "user" ALTER COLUMN password_hash TYPE VARCHAR(256)'))
+
+        # Indexes declared after a table was first created are missing from older databases
+        if _create_missing_indexes(connection) and connection.dialect.name == 'sqlite':
+            # Refresh planner statistics so the new indexes are picked up straight away
+            connection.execute(text('ANALYZE'))
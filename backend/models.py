@@ -1,6 +1,8 @@
+import hashlib
+import zlib
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
+from passwords import hasher
 
 db = SQLAlchemy()
 
@@ -12,14 +14,16 @@ note_label = db.Table('note_label',
 
 task_label = db.Table('task_label',
     db.Column('task_id', db.Integer, db.ForeignKey('task.id'), primary_key=True),
-    db.Column('label_id', db.Integer, db.ForeignKey('label.id'), primary_key=True)
+    db.Column('label_id', db.Integer, db.ForeignKey('label.id'), primary_key=True),
+    # The primary key serves task -> labels; label filters go the other way
+    db.Index('ix_task_label_label', 'label_id', 'task_id')
 )
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(128), nullable=True) # Null if OAuth only
+    password_hash = db.Column(db.String(256), nullable=True) # Null if OAuth only
     oauth_id = db.Column(db.String(256), unique=True, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
@@ -27,13 +31,15 @@ class User(db.Model):
     notes = db.relationship('Note', backref='owner', lazy=True)
     tasks = db.relationship('Task', backref='owner', lazy=True)
 
+    # Hashing runs in the bounded pool from passwords.py and may raise HashingBusy
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hasher.hash(password)
 
     def check_password(self, password):
-        if not self.password_hash:
-            return False
-        return check_password_hash(self.password_hash, password)
+        return hasher.verify(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        return hasher.needs_rehash(self.password_hash)
 
 class Folder(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -41,15 +47,54 @@ class Folder(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     parent_id = db.Column(db.Integer, db.ForeignKey('folder.id'), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Self-referential relationship for sub-folders
     subfolders = db.relationship('Folder', backref=db.backref('parent', remote_side=[id]), lazy=True)
     notes = db.relationship('Note', backref='folder', lazy=True)
 
+    __table_args__ = (
+        db.Index('ix_folder_user_updated', 'user_id', 'updated_at', 'id'),
+        db.Index('ix_folder_parent', 'parent_id'),
+    )
+
+class NoteBody(db.Model):
+    # Content-addressed note HTML, shared by every note with identical content;
+    # bodies of COMPRESS_MIN bytes and up are stored zlib-compressed
+    COMPRESS_MIN = 1024
+
+    checksum = db.Column(db.String(64), primary_key=True)
+    data = db.Column(db.LargeBinary, nullable=False)
+    compressed = db.Column(db.Boolean, nullable=False, default=False)
+    size = db.Column(db.Integer, nullable=False) # Uncompressed bytes
+
+    @staticmethod
+    def checksum_for(content):
+        return hashlib.sha256(content.encode()).hexdigest() if content else None
+
+    @classmethod
+    def pack(cls, content):
+        """Row values for `content`."""
+        raw = content.encode()
+        compressed = len(raw) >= cls.COMPRESS_MIN
+        return {'checksum': cls.checksum_for(content), 'data': zlib.compress(raw, 6) if compressed else raw,
+                'compressed': compressed, 'size': len(raw)}
+
+    @staticmethod
+    def unpack(data, compressed):
+        if data is None:
+            return ''
+        return (zlib.decompress(data) if compressed else bytes(data)).decode()
+
+    @property
+    def text(self):
+        return self.unpack(self.data, self.compressed)
+
 class Note(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(255), nullable=False, default="Untitled Note")
-    content = db.Column(db.Text, nullable=True)
+    # Body lives out of row in note_body and is only read when .content is accessed (see bodies.py)
+    body_hash = db.Column(db.String(64), db.ForeignKey('note_body.checksum'), nullable=True, index=True)
     note_type = db.Column(db.String(50), default='text') # 'text' or 'link'
     link_url = db.Column(db.String(1024), nullable=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -59,8 +104,28 @@ class Note(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     labels = db.relationship('Label', secondary=note_label, lazy='subquery', backref=db.backref('notes', lazy=True))
-    attachments = db.relationship('FileAttachment', backref='note', lazy=True)
-    collaborators = db.relationship('Collaborator', backref='note', lazy=True)
+    attachments = db.relationship('FileAttachment', backref='note', lazy=True, cascade='all, delete-orphan')
+    collaborators = db.relationship('Collaborator', backref='note', lazy=True, cascade='all, delete-orphan')
+    uploads = db.relationship('AttachmentUpload', backref='note', lazy=True, cascade='all, delete-orphan')
+    body = db.relationship('NoteBody', lazy='select', viewonly=True)
+
+    @property
+    def content(self):
+        # A value set in this unit of work wins until bodies.py has written it out
+        if '_content' in self.__dict__:
+            return self.__dict__['_content']
+        return self.body.text if self.body is not None else ''
+
+    @content.setter
+    def content(self, value):
+        self.__dict__['_content'] = value or ''
+        self.body_hash = NoteBody.checksum_for(value)
+
+    __table_args__ = (
+        # Owner listings filter on user_id and page by (updated_at, id)
+        db.Index('ix_note_user_updated', 'user_id', 'updated_at', 'id'),
+        db.Index('ix_note_folder', 'folder_id'),
+    )
 
 class Task(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -73,23 +138,50 @@ class Task(db.Model):
     is_completed = db.Column(db.Boolean, default=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    labels = db.relationship('Label', secondary=task_label, lazy='subquery', backref=db.backref('tasks', lazy=True))
+    # Loaded on access only; listings fetch labels for a whole batch at once
+    labels = db.relationship('Label', secondary=task_label, lazy='select', backref=db.backref('tasks', lazy=True))
+
+    __table_args__ = (
+        db.Index('ix_task_user_updated', 'user_id', 'updated_at', 'id'),
+        db.Index('ix_task_user_due', 'user_id', 'due_date'),
+        db.Index('ix_task_user_status', 'user_id', 'status'),
+    )
 
 class Label(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), nullable=False)
     color = db.Column(db.String(20), nullable=True) # Hex code or class
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
 
 class FileAttachment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(255), nullable=False)
     url = db.Column(db.String(1024), nullable=False) # Cloud URL, local path, or Google Doc link
-    type = db.Column(db.String(50), nullable=True) # google_doc, image, etc.
-    note_id = db.Column(db.Integer, db.ForeignKey('note.id'), nullable=False)
+    type = db.Column(db.String(50), nullable=True) # google_doc, image, etc.; the MIME type of uploaded files
+    note_id = db.Column(db.Integer, db.ForeignKey('note.id'), nullable=False, index=True)
     is_shared = db.Column(db.Boolean, default=False)
+    blob_hash = db.Column(db.String(64), nullable=True, index=True) # SHA-256 in the blob store for uploaded files
+    size = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @property
+    def href(self):
+        # Uploaded files are served by the API; links are used as they are
+        return f'/api/attachments/{self.id}/content' if self.blob_hash else self.url
+
+class AttachmentUpload(db.Model):
+    # A resumable upload in progress; its bytes so far live in the blob store's uploads directory
+    id = db.Column(db.String(32), primary_key=True)
+    note_id = db.Column(db.Integer, db.ForeignKey('note.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    name = db.Column(db.String(255), nullable=False)
+    type = db.Column(db.String(50), nullable=True)
+    size = db.Column(db.Integer, nullable=False) # Declared total
+    received = db.Column(db.Integer, nullable=False, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class Collaborator(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -98,3 +190,46 @@ class Collaborator(db.Model):
     permission = db.Column(db.String(20), default='read') # 'read', 'write'
     
     user = db.relationship('User', backref='collaborations')
+
+    __table_args__ = (
+        # Shared-with-me lookups go user -> note, audience and share lists go note -> user
+        db.Index('ix_collaborator_user_note', 'user_id', 'note_id'),
+        db.Index('ix_collaborator_note_user', 'note_id', 'user_id'),
+    )
+
+class NoteRevision(db.Model):
+    # zlib-compressed full content ('snapshot') or a token diff against base_id's snapshot ('diff')
+    id = db.Column(db.Integer, primary_key=True)
+    note_id = db.Column(db.Integer, db.ForeignKey('note.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True) # Null for buffered live edits
+    kind = db.Column(db.String(10), nullable=False)
+    base_id = db.Column(db.Integer, db.ForeignKey('note_revision.id'), nullable=True)
+    payload = db.Column(db.LargeBinary, nullable=False)
+    checksum = db.Column(db.String(40), nullable=False)
+    size = db.Column(db.Integer, nullable=False) # Uncompressed content length
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_note_revision_note', 'note_id', 'id'),
+    )
+
+class WorkspaceVersion(db.Model):
+    # Bumped whenever anything in a user's workspace listing changes; backs the workspace ETag
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class ChangeLog(db.Model):
+    # Latest change per (user, entity); the autoincrement id doubles as the sync cursor
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    entity = db.Column(db.String(20), nullable=False) # 'folder', 'note', 'task', 'label', 'collaborator'
+    entity_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(10), nullable=False) # 'upsert' or 'delete'
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_change_log_user_cursor', 'user_id', 'id'),
+        db.Index('ix_change_log_user_entity', 'user_id', 'entity', 'entity_id'),
+        {'sqlite_autoincrement': True},
+    )
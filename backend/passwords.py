@@ -0,0 +1,83 @@
+"""Password hashing off the event loop.
+
+scrypt/PBKDF2 are deliberately slow and hold the CPU for the whole hash, which
+under eventlet stalls every other greenlet (and every websocket) in the worker.
+Hashes run in eventlet's native thread pool instead. At most
+`PASSWORD_HASH_QUEUE` hashes may be in flight per worker; past that, callers
+get `HashingBusy` straight away so the endpoint can answer 429 rather than
+queue unboundedly.
+
+Hashes use werkzeug's format, so the method and cost factors are stored with each
+hash; stored hashes whose parameters differ from `PASSWORD_HASH_METHOD` are
+upgraded on the next successful login.
+"""
+import threading
+from werkzeug.security import generate_password_hash, check_password_hash
+
+try:
+    from eventlet import tpool
+except ImportError:  # pragma: no cover - eventlet is always installed in deployment
+    tpool = None
+
+
+class HashingBusy(Exception):
+    """Every hashing slot is taken; retry shortly."""
+
+
+class PasswordHasher:
+    def __init__(self, method='scrypt', salt_length=16, max_pending=16):
+        self.method = method
+        self.salt_length = salt_length
+        self.max_pending = max_pending
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._prefix = None
+        self.stats = {'hashed': 0, 'verified': 0, 'rejected_busy': 0}
+
+    def init_app(self, app):
+        self.method = app.config['PASSWORD_HASH_METHOD']
+        self.salt_length = app.config['PASSWORD_SALT_LENGTH']
+        self.max_pending = app.config['PASSWORD_HASH_QUEUE']
+        self._prefix = None
+        if tpool is not None:
+            tpool.set_num_threads(app.config['PASSWORD_HASH_WORKERS'])
+
+    def _run(self, func, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.stats['rejected_busy'] += 1
+                raise HashingBusy()
+            self._pending += 1
+        try:
+            # tpool.execute parks only the calling greenlet while a native thread hashes
+            return tpool.execute(func, *args) if tpool is not None else func(*args)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def hash(self, password):
+        self.stats['hashed'] += 1
+        return self._run(generate_password_hash, password, self.method, self.salt_length)
+
+    def verify(self, password_hash, password):
+        if not password_hash or password is None:
+            return False
+        self.stats['verified'] += 1
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        if not password_hash:
+            return False
+        if self._prefix is None:
+            # werkzeug fills in default cost factors, so derive the full prefix once from a real hash
+            try:
+                self._prefix = self._run(generate_password_hash, '', self.method, 1).split('$', 1)[0]
+            except HashingBusy:
+                return False
+        return password_hash.split('$', 1)[0] != self._prefix
+
+    def metrics(self):
+        return {**self.stats, 'pending': self._pending, 'max_pending': self.max_pending}
+
+
+hasher = PasswordHasher()
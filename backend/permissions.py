@@ -0,0 +1,180 @@
+"""Note access resolution with a per-process LRU/TTL cache.
+
+Every note read, autosave and socket event needs the caller's access level,
+which otherwise costs a Note plus a Collaborator lookup each time. Levels are
+cached per `(user_id, note_id)`. Mapper events drop a note's entries as soon as
+one of its share rows changes or the note is deleted, and again once that change
+commits: until then other requests still read the old grant and may cache it.
+So this worker never serves a revoked grant past the commit. Other workers see
+the change within `PERMISSION_CACHE_TTL` seconds.
+"""
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import and_, event
+from sqlalchemy.orm import Session, object_session
+from models import db, Note, Collaborator
+
+OWNER, WRITE, READ = 'owner', 'write', 'read'
+
+# Returned by `resolve` when the note does not exist (as opposed to None: no access)
+MISSING = 'missing'
+
+
+class PermissionResolver:
+    def __init__(self, maxsize=10000, ttl=30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # (user_id, note_id) -> (level, expires_at)
+        self._by_note = {}  # note_id -> {user_id, ...}
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    def init_app(self, app):
+        self.maxsize = app.config['PERMISSION_CACHE_SIZE']
+        self.ttl = app.config['PERMISSION_CACHE_TTL']
+        self.clear()
+
+    def resolve(self, user_id, note_id):
+        """The access `user_id` has to `note_id`: OWNER, WRITE, READ, None or MISSING."""
+        if user_id is None or note_id is None:
+            return None
+        key = (user_id, note_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return entry[0]
+            self.stats['misses'] += 1
+
+        # Owner and this user's share row in one query
+        row = db.session.query(Note.user_id, Collaborator.permission) \
+            .outerjoin(Collaborator, and_(Collaborator.note_id == Note.id, Collaborator.user_id == user_id)) \
+            .filter(Note.id == note_id).first()
+        if row is None:
+            # Not cached: SQLite may hand this id to the next note created
+            return MISSING
+        owner_id, permission = row
+        if owner_id == user_id:
+            level = OWNER
+        elif permission is not None:
+            level = WRITE if permission == 'write' else READ
+        else:
+            level = None
+        self._store(key, level)
+        return level
+
+    def resolve_many(self, user_id, note_ids):
+        """{note_id: level} for many notes, with one query covering every cache miss."""
+        levels, misses = {}, []
+        now = time.monotonic()
+        with self._lock:
+            for note_id in set(note_ids):
+                entry = self._entries.get((user_id, note_id))
+                if entry and entry[1] > now:
+                    self._entries.move_to_end((user_id, note_id))
+                    self.stats['hits'] += 1
+                    levels[note_id] = entry[0]
+                else:
+                    misses.append(note_id)
+            self.stats['misses'] += len(misses)
+        if not misses or user_id is None:
+            return levels
+
+        rows = db.session.query(Note.id, Note.user_id, Collaborator.permission) \
+            .outerjoin(Collaborator, and_(Collaborator.note_id == Note.id, Collaborator.user_id == user_id)) \
+            .filter(Note.id.in_(misses)).all()
+        for note_id, owner_id, permission in rows:
+            if owner_id == user_id:
+                level = OWNER
+            elif permission is not None:
+                level = WRITE if permission == 'write' else READ
+            else:
+                level = None
+            self._store((user_id, note_id), level)
+            levels[note_id] = level
+        for note_id in misses:
+            levels.setdefault(note_id, MISSING)
+        return levels
+
+    def can_read(self, user_id, note_id):
+        return self.resolve(user_id, note_id) in (OWNER, WRITE, READ)
+
+    def can_write(self, user_id, note_id):
+        return self.resolve(user_id, note_id) in (OWNER, WRITE)
+
+    def _store(self, key, level):
+        with self._lock:
+            self._entries[key] = (level, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            self._by_note.setdefault(key[1], set()).add(key[0])
+            while len(self._entries) > self.maxsize:
+                (user_id, note_id), _ = self._entries.popitem(last=False)
+                self._forget(user_id, note_id)
+                self.stats['evictions'] += 1
+
+    def _forget(self, user_id, note_id):
+        users = self._by_note.get(note_id)
+        if users:
+            users.discard(user_id)
+            if not users:
+                del self._by_note[note_id]
+
+    def invalidate_note(self, note_id):
+        """Drop every cached level for `note_id`."""
+        with self._lock:
+            for user_id in self._by_note.pop(note_id, ()):
+                self._entries.pop((user_id, note_id), None)
+            self.stats['invalidations'] += 1
+
+    def invalidate_on_commit(self, session, note_ids):
+        """`invalidate_note` now and again after `session` commits its change to them."""
+        note_ids = set(note_ids)
+        session.info.setdefault('permission_invalidations', set()).update(note_ids)
+        for note_id in note_ids:
+            self.invalidate_note(note_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_note.clear()
+
+    def metrics(self):
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return {
+                **self.stats,
+                'hit_ratio': round(self.stats['hits'] / lookups, 4) if lookups else 0.0,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl_s': self.ttl,
+            }
+
+
+permissions = PermissionResolver()
+
+
+# --- ORM events ---
+@event.listens_for(Collaborator, 'after_insert')
+@event.listens_for(Collaborator, 'after_update')
+@event.listens_for(Collaborator, 'after_delete')
+def _collaborator_changed(mapper, connection, collab):
+    permissions.invalidate_on_commit(object_session(collab), [collab.note_id])
+
+
+@event.listens_for(Note, 'after_delete')
+def _note_deleted(mapper, connection, note):
+    permissions.invalidate_on_commit(object_session(note), [note.id])
+
+
+@event.listens_for(Session, 'after_commit')
+def _session_committed(session):
+    for note_id in session.info.pop('permission_invalidations', ()):
+        permissions.invalidate_note(note_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _session_rolled_back(session):
+    # Nothing changed; whatever was cached since the flush is still right
+    session.info.pop('permission_invalidations', None)
@@ -0,0 +1,105 @@
+"""Opt-in sampling profiler that keeps stacks of slow requests.
+
+With `PROFILE_SLOW_MS` set, a `SIGPROF` interval timer fires every
+`PROFILE_INTERVAL_MS` of CPU time. The handler records the interrupted stack
+against the request running at that moment: the current greenlet under
+eventlet, or the calling thread otherwise. A request that takes longer than
+`PROFILE_SLOW_MS` has its samples written to `PROFILE_DIR` in folded-stack
+format (`frame;frame;frame count`). That format is what flamegraph.pl,
+speedscope and inferno read. Faster requests are discarded, and only the
+newest `PROFILE_KEEP` files are kept.
+
+Samples are CPU time, so waits on I/O do not show up. Time blocked inside a
+C call, like a SQLite lock wait, lands on the frame that made the call.
+Signals only reach the main thread, so this does nothing under servers that
+run requests on other threads.
+"""
+import os
+import signal
+import threading
+import time
+from flask import g, request
+
+try:
+    from greenlet import getcurrent
+except ImportError:  # pragma: no cover - installed with eventlet
+    getcurrent = None
+
+
+class SamplingProfiler:
+    def __init__(self):
+        self.slow = 0.0
+        self.interval = 0.005
+        self.directory = None
+        self.keep = 50
+        self.enabled = False
+        self._active = {}  # greenlet or thread id -> list of stacks
+        self.stats = {'samples': 0, 'dumps': 0}
+
+    def init_app(self, app):
+        self.slow = app.config['PROFILE_SLOW_MS'] / 1000.0
+        self.interval = app.config['PROFILE_INTERVAL_MS'] / 1000.0
+        self.directory = app.config['PROFILE_DIR']
+        self.keep = app.config['PROFILE_KEEP']
+        if self.slow <= 0:
+            return
+        if threading.current_thread() is not threading.main_thread() or not hasattr(signal, 'setitimer'):
+            app.logger.warning('Sampling profiler disabled: needs SIGPROF on the main thread')
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        self.enabled = True
+        app.before_request(self._start)
+        app.teardown_request(self._finish)
+
+    def _key(self):
+        return getcurrent() if getcurrent is not None else threading.get_ident()
+
+    def _start(self):
+        self._active[self._key()] = []
+        g.profile_started = time.perf_counter()
+
+    def _sample(self, signum, frame):
+        samples = self._active.get(self._key())
+        if samples is None:
+            return
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+            frame = frame.f_back
+        samples.append(';'.join(reversed(stack)))
+        self.stats['samples'] += 1
+
+    def _finish(self, exc):
+        samples = self._active.pop(self._key(), None)
+        started = g.pop('profile_started', None)
+        if not samples or started is None:
+            return
+        elapsed = time.perf_counter() - started
+        if elapsed >= self.slow:
+            self._dump(request.endpoint or 'unmatched', elapsed, samples)
+
+    def _dump(self, endpoint, elapsed, samples):
+        folded = {}
+        for stack in samples:
+            folded[stack] = folded.get(stack, 0) + 1
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{endpoint}-{round(elapsed * 1000)}ms-{os.getpid()}.folded"
+        with open(os.path.join(self.directory, name), 'w') as f:
+            for stack, count in sorted(folded.items()):
+                f.write(f'{stack} {count}\n')
+        self.stats['dumps'] += 1
+        self._prune()
+
+    def _prune(self):
+        files = sorted((os.path.join(self.directory, n) for n in os.listdir(self.directory) if n.endswith('.folded')),
+                       key=os.path.getmtime)
+        for path in files[:-self.keep] if self.keep > 0 else []:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,274 @@
+"""Note revision history as compressed diffs against periodic snapshots.
+
+Every content write (REST autosave and buffered live edits) records a revision.
+A revision is either a zlib-compressed snapshot of the full HTML or a token
+diff against the most recent snapshot, so any version is rebuilt from exactly
+one snapshot plus one diff. A new snapshot is taken every
+`REVISION_SNAPSHOT_EVERY` revisions, or sooner once a diff would be more than
+half the size of a fresh snapshot.
+
+Autosave fires about once a second, so writes by the same user within
+`REVISION_INTERVAL` seconds are folded into the latest revision. Nothing
+depends on the latest revision, which makes that safe. A background task thins
+old history to one revision per hour after a day and one per day after a week.
+"""
+import hashlib
+import json
+import re
+import zlib
+from datetime import datetime, timedelta
+from difflib import SequenceMatcher
+from sqlalchemy import event, func, text
+from models import db, Note, NoteRevision
+from bodies import content_of
+
+REVISION_INTERVAL = 60
+REVISION_SNAPSHOT_EVERY = 20
+REVISION_THIN_INTERVAL = 3600
+
+SNAPSHOT, DIFF = 'snapshot', 'diff'
+
+# A `<` that never closes into a tag falls through to the last alternative, so every character is a token
+_TOKEN_RE = re.compile(r'<[^>]*>|[^<\s]+|\s+|<')
+
+
+class CorruptRevisionError(Exception):
+    """A rebuilt revision does not match the checksum recorded with it."""
+
+
+def init_app(app, socketio=None):
+    global REVISION_INTERVAL, REVISION_SNAPSHOT_EVERY, REVISION_THIN_INTERVAL
+    REVISION_INTERVAL = app.config['REVISION_INTERVAL']
+    REVISION_SNAPSHOT_EVERY = app.config['REVISION_SNAPSHOT_EVERY']
+    REVISION_THIN_INTERVAL = app.config['REVISION_THIN_INTERVAL']
+
+    @app.cli.command('thin-revisions')
+    def thin_revisions_command():
+        """Thin old note revisions now."""
+        print(f'Removed {thin()} revisions')
+
+    if socketio is not None and REVISION_THIN_INTERVAL > 0:
+        socketio.start_background_task(_thin_loop, app, socketio)
+
+
+# --- Encoding ---
+def _tokens(content):
+    return _TOKEN_RE.findall(content or '')
+
+
+def _checksum(content):
+    return hashlib.sha1((content or '').encode()).hexdigest()
+
+
+def make_diff(base, content):
+    """Ops turning `base` into `content`: n copies n tokens, -n skips n, a string is inserted."""
+    a, b = _tokens(base), _tokens(content)
+    ops = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        if tag == 'equal':
+            ops.append(i2 - i1)
+            continue
+        if i2 > i1:
+            ops.append(i1 - i2)
+        if j2 > j1:
+            ops.append(''.join(b[j1:j2]))
+    return ops
+
+
+def apply_diff(base, ops):
+    tokens, position, parts = _tokens(base), 0, []
+    for op in ops:
+        if isinstance(op, str):
+            parts.append(op)
+        elif op >= 0:
+            parts.append(''.join(tokens[position:position + op]))
+            position += op
+        else:
+            position -= op
+    return ''.join(parts)
+
+
+def _pack(value):
+    return zlib.compress(value.encode() if isinstance(value, str) else json.dumps(value, separators=(',', ':')).encode(), 6)
+
+
+def _unpack_snapshot(payload):
+    return zlib.decompress(payload).decode()
+
+
+def _unpack_diff(payload):
+    return json.loads(zlib.decompress(payload))
+
+
+# --- Writing ---
+def _latest(session, note_id):
+    return session.query(NoteRevision).filter(NoteRevision.note_id == note_id) \
+        .order_by(NoteRevision.id.desc()).first()
+
+
+def _snapshot_for(session, revision):
+    if revision.kind == SNAPSHOT:
+        return revision
+    return session.get(NoteRevision, revision.base_id)
+
+
+def _encode(snapshot, content, since_snapshot):
+    """(kind, base_id, payload) for `content`, diffed against `snapshot` when worthwhile."""
+    full = _pack(content)
+    if snapshot is not None and since_snapshot < REVISION_SNAPSHOT_EVERY:
+        base = _unpack_snapshot(snapshot.payload)
+        diff = make_diff(base, content)
+        payload = _pack(diff)
+        # A diff that would not rebuild `content` exactly is never stored
+        if len(payload) * 2 <= len(full) and apply_diff(base, diff) == content:
+            return DIFF, snapshot.id, payload
+    return SNAPSHOT, None, full
+
+
+def record(session, note_id, content, user_id=None, now=None):
+    """Record `content` as the newest revision of `note_id`.
+
+    Call before the new content is written: a note without history is first seeded
+    with its current content so the change itself is never lost.
+    """
+    content = content or ''
+    now = now or datetime.utcnow()
+    checksum = _checksum(content)
+    latest = _latest(session, note_id)
+    seeded = False
+
+    if latest is None:
+        previous = content_of(session, note_id)
+        if previous and previous != content:
+            created = session.query(Note.updated_at).filter(Note.id == note_id).scalar() or now
+            latest = NoteRevision(note_id=note_id, kind=SNAPSHOT, payload=_pack(previous),
+                                  checksum=_checksum(previous), size=len(previous),
+                                  created_at=created, updated_at=created)
+            session.add(latest)
+            session.flush()
+            seeded = True
+    elif latest.checksum == checksum:
+        return latest
+
+    snapshot = _snapshot_for(session, latest) if latest is not None else None
+    fold = (latest is not None and not seeded and latest.user_id == user_id and latest.created_at
+            and now - latest.created_at < timedelta(seconds=REVISION_INTERVAL))
+    if fold and latest.kind == SNAPSHOT:
+        # The folded-into snapshot has no dependants yet, so it is simply rewritten
+        latest.payload, latest.checksum, latest.size, latest.updated_at = _pack(content), checksum, len(content), now
+        return latest
+
+    since_snapshot = 0
+    if snapshot is not None:
+        since_snapshot = session.query(func.count(NoteRevision.id)) \
+            .filter(NoteRevision.note_id == note_id, NoteRevision.id > snapshot.id).scalar()
+    kind, base_id, payload = _encode(snapshot, content, since_snapshot)
+
+    if fold:
+        latest.kind, latest.base_id, latest.payload = kind, base_id, payload
+        latest.checksum, latest.size, latest.updated_at = checksum, len(content), now
+        return latest
+    revision = NoteRevision(note_id=note_id, user_id=user_id, kind=kind, base_id=base_id, payload=payload,
+                            checksum=checksum, size=len(content), created_at=now, updated_at=now)
+    session.add(revision)
+    return revision
+
+
+# --- Reading ---
+def list_revisions(note_id, limit=50, before=None):
+    """Newest first, without payloads; returns (items, has_more)."""
+    query = db.session.query(NoteRevision.id, NoteRevision.user_id, NoteRevision.kind, NoteRevision.size,
+                             NoteRevision.created_at, NoteRevision.updated_at) \
+        .filter(NoteRevision.note_id == note_id)
+    if before is not None:
+        query = query.filter(NoteRevision.id < before)
+    rows = query.order_by(NoteRevision.id.desc()).limit(limit + 1).all()
+    items = [{
+        'id': r.id,
+        'user_id': r.user_id,
+        'kind': r.kind,
+        'size': r.size,
+        'created_at': r.created_at.isoformat() if r.created_at else None,
+        'updated_at': r.updated_at.isoformat() if r.updated_at else None,
+    } for r in rows[:limit]]
+    return items, len(rows) > limit
+
+
+def content_at(note_id, revision_id):
+    """(revision, content) rebuilt from a snapshot plus at most one diff; (None, None) if unknown.
+
+    Raises CorruptRevisionError when the result does not match the revision's checksum.
+    """
+    revision = db.session.query(NoteRevision).filter_by(id=revision_id, note_id=note_id).first()
+    if revision is None:
+        return None, None
+    if revision.kind == SNAPSHOT:
+        content = _unpack_snapshot(revision.payload)
+    else:
+        snapshot = db.session.get(NoteRevision, revision.base_id)
+        content = apply_diff(_unpack_snapshot(snapshot.payload), _unpack_diff(revision.payload))
+    if _checksum(content) != revision.checksum:
+        raise CorruptRevisionError(revision.id)
+    return revision, content
+
+
+# --- Thinning ---
+def _bucket(created_at, now):
+    age = now - created_at
+    if age < timedelta(days=1):
+        return None  # kept as is
+    if age < timedelta(days=7):
+        return created_at.strftime('%Y%m%d%H')
+    return created_at.strftime('%Y%m%d')
+
+
+def thin_note(session, note_id, now):
+    rows = session.query(NoteRevision.id, NoteRevision.kind, NoteRevision.base_id, NoteRevision.created_at) \
+        .filter(NoteRevision.note_id == note_id).order_by(NoteRevision.id).all()
+    keep, newest_in_bucket = set(), {}
+    for row in rows:
+        bucket = _bucket(row.created_at, now) if row.created_at else None
+        if bucket is None:
+            keep.add(row.id)
+        else:
+            newest_in_bucket[bucket] = row.id
+    keep.update(newest_in_bucket.values())
+    if rows:
+        keep.add(rows[-1].id)
+    # Snapshots stay while any kept diff is based on them
+    keep.update(row.base_id for row in rows if row.id in keep and row.kind == DIFF)
+    doomed = [row.id for row in rows if row.id not in keep]
+    if doomed:
+        session.query(NoteRevision).filter(NoteRevision.id.in_(doomed)).delete(synchronize_session=False)
+    return len(doomed)
+
+
+def thin(now=None):
+    """Thin the history of every note with revisions older than a day; returns rows removed."""
+    now = now or datetime.utcnow()
+    note_ids = [note_id for (note_id,) in db.session.query(NoteRevision.note_id)
+                .filter(NoteRevision.created_at < now - timedelta(days=1)).distinct()]
+    removed = 0
+    for note_id in note_ids:
+        removed += thin_note(db.session, note_id, now)
+        db.session.commit()
+    return removed
+
+
+def _thin_loop(app, socketio):
+    while True:
+        socketio.sleep(REVISION_THIN_INTERVAL)
+        with app.app_context():
+            try:
+                thin()
+            except Exception:
+                db.session.rollback()
+                app.logger.exception('Revision thinning failed')
+            finally:
+                db.session.remove()
+
+
+# --- ORM events ---
+@event.listens_for(Note, 'before_delete')
+def _note_deleting(mapper, connection, note):
+    connection.execute(text('DELETE FROM note_revision WHERE note_id = :id'), {'id': note.id})
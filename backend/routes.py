@@ -1,6 +1,25 @@
-from flask import Blueprint, request, jsonify, session
-from models import db, Folder, Note, Task, Label, FileAttachment, User, Collaborator
-from datetime import datetime
+from flask import (Blueprint, Response, current_app, request, jsonify, session, make_response, send_file,
+                   stream_with_context)
+from models import (db, Folder, Note, NoteBody, Task, Label, FileAttachment, AttachmentUpload, User, Collaborator,
+                    task_label)
+import search
+import workspace
+import changes
+import listing
+import revisions
+import folders
+import archive
+from blobs import blobs, BlobTooLarge
+from permissions import permissions, OWNER, WRITE, MISSING
+from datetime import date, datetime, timedelta
+import hashlib
+import hmac
+import mimetypes
+import os
+import re
+import uuid
+from sqlalchemy import and_, case, func, or_, select
+from sqlalchemy.orm import raiseload
 
 api_bp = Blueprint('api', __name__)
 
@@ -13,12 +32,38 @@ def require_auth(f):
     return wrap
 
 # --- FOLDERS ---
+# Listing fields: name -> (columns to load, getter(row, context))
+FOLDER_FIELDS = {
+    'id': ((Folder.id,), lambda f, ctx: f.id),
+    'name': ((Folder.name,), lambda f, ctx: f.name),
+    'parent_id': ((Folder.parent_id,), lambda f, ctx: f.parent_id),
+    'updated_at': ((Folder.updated_at,), lambda f, ctx: f.updated_at.isoformat() if f.updated_at else None),
+}
+
+def folders_query(user_id, fields):
+    return listing.select_columns(Folder.query.filter_by(user_id=user_id), Folder, FOLDER_FIELDS, fields)
+
+def serialize_folders(folders, user_id, fields):
+    return [listing.serialize(f, FOLDER_FIELDS, fields) for f in folders]
+
 @api_bp.route('/folders', methods=['GET'])
 @require_auth
 def get_folders():
-    folders = Folder.query.filter_by(user_id=session['user_id']).all()
-    result = [{'id': f.id, 'name': f.name, 'parent_id': f.parent_id} for f in folders]
-    return jsonify(result), 200
+    user_id = session['user_id']
+    try:
+        fields = listing.parse_fields(FOLDER_FIELDS)
+        rows, next_cursor = listing.paginate(folders_query(user_id, fields), Folder, *listing.page_args())
+    except listing.ListingError as e:
+        return jsonify({'error': str(e)}), 400
+    items = listing.serialize_in_batches(rows, lambda batch: serialize_folders(batch, user_id, fields))
+    return listing.stream_json(items, next_cursor)
+
+def list_folders(user_id, ids=None):
+    fields = listing.default_fields(FOLDER_FIELDS)
+    query = folders_query(user_id, fields)
+    if ids is not None:
+        query = query.filter(Folder.id.in_(ids))
+    return serialize_folders(query.order_by(Folder.id).all(), user_id, fields)
 
 @api_bp.route('/folders', methods=['POST'])
 @require_auth
@@ -26,114 +71,199 @@ def create_folder():
     data = request.get_json()
     name = data.get('name')
     parent_id = data.get('parent_id')
+    if parent_id is not None and not Folder.query.filter_by(id=parent_id, user_id=session['user_id']).first():
+        return jsonify({'error': 'Parent folder not found'}), 404
     
     folder = Folder(name=name, user_id=session['user_id'], parent_id=parent_id)
     db.session.add(folder)
+    db.session.flush()
+    changes.record('folder', folder.id, [folder.user_id])
     db.session.commit()
     return jsonify({'id': folder.id, 'name': folder.name, 'parent_id': folder.parent_id}), 201
 
-@api_bp.route('/folders/<int:folder_id>', methods=['DELETE'])
+@api_bp.route('/folders/<int:folder_id>', methods=['PUT'])
 @require_auth
-def delete_folder(folder_id):
+def update_folder(folder_id):
     folder = Folder.query.filter_by(id=folder_id, user_id=session['user_id']).first()
     if not folder:
         return jsonify({'error': 'Folder not found'}), 404
-    db.session.delete(folder)
+
+    data = request.get_json()
+    if 'name' in data: folder.name = data['name']
+    if 'parent_id' in data and data['parent_id'] != folder.parent_id:
+        # Moving a folder carries its whole subtree; only the one parent_id changes
+        try:
+            folders.move(session['user_id'], folder.id, data['parent_id'])
+        except folders.FolderError as e:
+            return jsonify({'error': str(e)}), 400
+        folder.updated_at = datetime.utcnow()
+
+    changes.record('folder', folder.id, [folder.user_id])
     db.session.commit()
-    return jsonify({'message': 'Deleted'}), 200
+    return jsonify({'id': folder.id, 'name': folder.name, 'parent_id': folder.parent_id}), 200
+
+@api_bp.route('/folders/<int:folder_id>/tree', methods=['GET'])
+@require_auth
+def get_folder_tree(folder_id):
+    user_id = session['user_id']
+    rows = folders.subtree(user_id, folder_id)
+    if not rows:
+        return jsonify({'error': 'Folder not found'}), 404
+
+    result = {'folders': [{'id': r.id, 'name': r.name, 'parent_id': r.parent_id, 'depth': r.depth} for r in rows]}
+    if request.args.get('include') == 'notes':
+        tree = folders.subtree_cte(user_id, folder_id)
+        fields = listing.default_fields(NOTE_FIELDS)
+        query = notes_query(user_id, fields).filter(Note.folder_id.in_(db.select(tree.c.id)))
+        result['notes'] = serialize_notes(query.order_by(Note.id).all(), user_id, fields)
+    return jsonify(result), 200
+
+@api_bp.route('/folders/<int:folder_id>', methods=['DELETE'])
+@require_auth
+def delete_folder(folder_id):
+    # Subfolders, their notes and everything attached to those notes go with it
+    folder_ids, note_ids, upload_ids = folders.delete_subtree(session['user_id'], folder_id)
+    if not folder_ids:
+        return jsonify({'error': 'Folder not found'}), 404
+    db.session.commit()
+    for upload_id in upload_ids:
+        blobs.discard_part(upload_id)
+    return jsonify({'message': 'Deleted', 'folders': len(folder_ids), 'notes': len(note_ids)}), 200
 
 # --- NOTES ---
+NOTE_FIELDS = {
+    'id': ((Note.id,), lambda n, ctx: n.id),
+    'title': ((Note.title,), lambda n, ctx: n.title),
+    'folder_id': ((Note.folder_id,), lambda n, ctx: n.folder_id),
+    'is_shared': ((Note.is_shared,), lambda n, ctx: n.is_shared),
+    'user_id': ((Note.user_id,), lambda n, ctx: n.user_id),
+    'is_owner': ((Note.user_id,), lambda n, ctx: n.user_id == ctx['user_id']),
+    'note_type': ((Note.note_type,), lambda n, ctx: n.note_type),
+    'link_url': ((Note.link_url,), lambda n, ctx: n.link_url),
+    'updated_at': ((Note.updated_at,), lambda n, ctx: n.updated_at.isoformat() if n.updated_at else None),
+    # Only present on shared notes, as before
+    'collaborators': ((Note.is_shared,), lambda n, ctx: ctx['collaborators'].get(n.id, []) if n.is_shared else listing.OMIT),
+}
+
+def notes_query(user_id, fields):
+    # Owned and shared notes in one query; body columns are never loaded for the listing, and labels
+    # come from one query per page (touching the relationship raises rather than loading per row)
+    shared_ids = db.session.query(Collaborator.note_id).filter(Collaborator.user_id == user_id)
+    query = Note.query.options(raiseload(Note.labels)).filter(or_(Note.user_id == user_id, Note.id.in_(shared_ids)))
+    return listing.select_columns(query, Note, NOTE_FIELDS, fields)
+
+def serialize_notes(notes, user_id, fields):
+    # Collaborators of every shared note in the batch, joined to their users in one query
+    collabs_by_note = {}
+    shared_note_ids = [n.id for n in notes if n.is_shared] if 'collaborators' in fields else []
+    if shared_note_ids:
+        rows = db.session.query(Collaborator.note_id, Collaborator.permission, User.email, User.username) \
+            .join(User, User.id == Collaborator.user_id) \
+            .filter(Collaborator.note_id.in_(shared_note_ids)) \
+            .order_by(Collaborator.id).all()
+        for note_id, permission, email, username in rows:
+            collabs_by_note.setdefault(note_id, []).append({'email': email, 'username': username, 'permission': permission})
+
+    context = {'user_id': user_id, 'collaborators': collabs_by_note}
+    return [listing.serialize(n, NOTE_FIELDS, fields, context) for n in notes]
+
 @api_bp.route('/notes', methods=['GET'])
 @require_auth
 def get_notes():
     user_id = session['user_id']
-    owned_notes = Note.query.filter_by(user_id=user_id).all()
-    
-    collaborations = Collaborator.query.filter_by(user_id=user_id).all()
-    shared_note_ids = [c.note_id for c in collaborations]
-    shared_notes = Note.query.filter(Note.id.in_(shared_note_ids)).all() if shared_note_ids else []
-    
-    all_notes = list({n.id: n for n in (owned_notes + shared_notes)}.values())
-    
-    result = []
-    for n in all_notes:
-        note_data = {'id': n.id, 'title': n.title, 'folder_id': n.folder_id, 'is_shared': n.is_shared, 'user_id': n.user_id, 'is_owner': n.user_id == user_id, 'note_type': n.note_type, 'link_url': n.link_url}
-        if n.is_shared:
-            collabs = Collaborator.query.filter_by(note_id=n.id).all()
-            note_data['collaborators'] = []
-            for c in collabs:
-                u = User.query.get(c.user_id)
-                if u:
-                    note_data['collaborators'].append({'email': u.email, 'username': u.username, 'permission': c.permission})
-        result.append(note_data)
-    return jsonify(result), 200
+    try:
+        fields = listing.parse_fields(NOTE_FIELDS)
+        rows, next_cursor = listing.paginate(notes_query(user_id, fields), Note, *listing.page_args())
+    except listing.ListingError as e:
+        return jsonify({'error': str(e)}), 400
+    items = listing.serialize_in_batches(rows, lambda batch: serialize_notes(batch, user_id, fields))
+    return listing.stream_json(items, next_cursor)
 
-@api_bp.route('/notes', methods=['POST'])
-@require_auth
-def create_note():
-    data = request.get_json()
-    note = Note(
+def list_notes(user_id, ids=None):
+    fields = listing.default_fields(NOTE_FIELDS)
+    query = notes_query(user_id, fields)
+    if ids is not None:
+        query = query.filter(Note.id.in_(ids))
+    return serialize_notes(query.order_by(Note.id).all(), user_id, fields)
+
+def folder_owned(folder_id, user_id):
+    # Notes may only be filed into the caller's own folders; None is the root
+    return folder_id is None or Folder.query.filter_by(id=folder_id, user_id=user_id).first() is not None
+
+def new_note(data, user_id):
+    return Note(
         title=data.get('title', 'Untitled'),
         content=data.get('content', ''),
         note_type=data.get('note_type', 'text'),
         link_url=data.get('link_url'),
         folder_id=data.get('folder_id'),
-        user_id=session['user_id']
+        user_id=user_id
     )
+
+def apply_note_data(note, data, is_owner, user_id):
+    if 'title' in data: note.title = data['title']
+    # Compared by checksum so an unchanged autosave never loads the stored body
+    if 'content' in data and NoteBody.checksum_for(data['content']) != note.body_hash:
+        revisions.record(db.session, note.id, data['content'], user_id=user_id)
+        note.content = data['content']
+    if 'note_type' in data: note.note_type = data['note_type']
+    if 'link_url' in data: note.link_url = data['link_url']
+    if 'folder_id' in data and is_owner: note.folder_id = data['folder_id']
+    if 'is_shared' in data and is_owner: note.is_shared = data['is_shared']
+
+@api_bp.route('/notes', methods=['POST'])
+@require_auth
+def create_note():
+    data = request.get_json()
+    if not folder_owned(data.get('folder_id'), session['user_id']):
+        return jsonify({'error': 'Folder not found'}), 404
+    note = new_note(data, session['user_id'])
     db.session.add(note)
+    db.session.flush()
+    changes.record('note', note.id, [note.user_id])
     db.session.commit()
     return jsonify({'id': note.id, 'title': note.title, 'note_type': note.note_type}), 201
 
 @api_bp.route('/notes/<int:note_id>', methods=['GET'])
 @require_auth
 def get_note(note_id):
+    access = permissions.resolve(session['user_id'], note_id)
+    if access == MISSING:
+        return jsonify({'error': 'Not found'}), 404
+    if access is None:
+        return jsonify({'error': 'Unauthorized'}), 403
+
     note = Note.query.get(note_id)
     if not note:
         return jsonify({'error': 'Not found'}), 404
-        
-    is_owner = (note.user_id == session['user_id'])
-    has_access = is_owner
-    if not is_owner:
-        collab = Collaborator.query.filter_by(note_id=note.id, user_id=session['user_id']).first()
-        if collab:
-            has_access = True
-            
-    if not has_access:
-        return jsonify({'error': 'Unauthorized'}), 403
+    is_owner = access == OWNER
         
     return jsonify({
         'id': note.id, 'title': note.title, 'content': note.content,
         'note_type': note.note_type, 'link_url': note.link_url,
         'folder_id': note.folder_id, 'is_shared': note.is_shared,
         'is_owner': is_owner,
-        'attachments': [{'id': a.id, 'url': a.url, 'name': a.name} for a in note.attachments]
+        'attachments': [attachment_json(a) for a in note.attachments]
     }), 200
 
 @api_bp.route('/notes/<int:note_id>', methods=['PUT'])
 @require_auth
 def update_note(note_id):
+    # Autosave hits this about once a second per typist; the access check is served from cache
+    access = permissions.resolve(session['user_id'], note_id)
+    if access == MISSING:
+        return jsonify({'error': 'Not found'}), 404
+    if access not in (OWNER, WRITE):
+        return jsonify({'error': 'Unauthorized to edit'}), 403
+
     note = Note.query.get(note_id)
     if not note:
         return jsonify({'error': 'Not found'}), 404
-        
-    is_owner = (note.user_id == session['user_id'])
-    has_write_access = is_owner
-    if not is_owner:
-        collab = Collaborator.query.filter_by(note_id=note.id, user_id=session['user_id']).first()
-        if collab and collab.permission == 'write':
-            has_write_access = True
-            
-    if not has_write_access:
-        return jsonify({'error': 'Unauthorized to edit'}), 403
-    
     data = request.get_json()
-    if 'title' in data: note.title = data['title']
-    if 'content' in data: note.content = data['content']
-    if 'note_type' in data: note.note_type = data['note_type']
-    if 'link_url' in data: note.link_url = data['link_url']
-    if 'folder_id' in data and is_owner: note.folder_id = data['folder_id']
-    if 'is_shared' in data and is_owner: note.is_shared = data['is_shared']
-    
+    if access == OWNER and 'folder_id' in data and not folder_owned(data['folder_id'], session['user_id']):
+        return jsonify({'error': 'Folder not found'}), 404
+    apply_note_data(note, data, access == OWNER, session['user_id'])
+    changes.record('note', note.id, changes.note_audience(note))
     db.session.commit()
     return jsonify({'message': 'Updated'}), 200
 
@@ -143,8 +273,13 @@ def delete_note(note_id):
     note = Note.query.filter_by(id=note_id, user_id=session['user_id']).first()
     if not note:
         return jsonify({'error': 'Not found'}), 404
+    changes.record('note', note.id, changes.note_audience(note), op='delete')
+    # Uploads in progress go with the note; their part files only once that is committed
+    upload_ids = [upload.id for upload in note.uploads]
     db.session.delete(note)
     db.session.commit()
+    for upload_id in upload_ids:
+        blobs.discard_part(upload_id)
     return jsonify({'message': 'Deleted'}), 200
 
 @api_bp.route('/notes/<int:note_id>/share', methods=['GET', 'POST', 'DELETE'])
@@ -169,6 +304,9 @@ def manage_share(note_id):
         collab = Collaborator.query.filter_by(id=collab_id, note_id=note.id).first()
         if not collab:
             return jsonify({'error': 'Collaborator not found'}), 404
+        # The removed user loses the note entirely; everyone else sees the updated share list
+        changes.record('collaborator', collab.id, changes.note_audience(note), op='delete')
+        changes.record('note', note.id, [collab.user_id], op='delete')
         db.session.delete(collab)
         
         # Check if we should unshare
@@ -176,6 +314,7 @@ def manage_share(note_id):
         if remaining == 0:
             note.is_shared = False
             
+        changes.record('note', note.id, changes.note_audience(note))
         db.session.commit()
         return jsonify({'message': 'Removed collaborator'}), 200
 
@@ -194,44 +333,191 @@ def manage_share(note_id):
     existing = Collaborator.query.filter_by(note_id=note.id, user_id=target_user.id).first()
     if existing:
         existing.permission = permission
+        collab = existing
     else:
         collab = Collaborator(user_id=target_user.id, note_id=note.id, permission=permission)
         db.session.add(collab)
         
     note.is_shared = True
+    db.session.flush()
+    audience = changes.note_audience(note)
+    changes.record('collaborator', collab.id, audience)
+    changes.record('note', note.id, audience)
     db.session.commit()
     return jsonify({'message': 'Shared successfully'}), 200
 
+# --- REVISIONS ---
+@api_bp.route('/notes/<int:note_id>/revisions', methods=['GET'])
+@require_auth
+def get_revisions(note_id):
+    access = permissions.resolve(session['user_id'], note_id)
+    if access == MISSING:
+        return jsonify({'error': 'Not found'}), 404
+    if access is None:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+    items, has_more = revisions.list_revisions(note_id, limit=limit, before=request.args.get('before', type=int))
+    return jsonify({'revisions': items, 'has_more': has_more}), 200
+
+@api_bp.route('/notes/<int:note_id>/revisions/<int:revision_id>', methods=['GET'])
+@require_auth
+def get_revision(note_id, revision_id):
+    access = permissions.resolve(session['user_id'], note_id)
+    if access == MISSING:
+        return jsonify({'error': 'Not found'}), 404
+    if access is None:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    try:
+        revision, content = revisions.content_at(note_id, revision_id)
+    except revisions.CorruptRevisionError:
+        current_app.logger.error('Revision %s of note %s fails its checksum', revision_id, note_id)
+        return jsonify({'error': 'Revision could not be rebuilt'}), 500
+    if revision is None:
+        return jsonify({'error': 'Revision not found'}), 404
+    return jsonify({
+        'id': revision.id, 'note_id': note_id, 'user_id': revision.user_id,
+        'created_at': revision.created_at.isoformat() if revision.created_at else None,
+        'updated_at': revision.updated_at.isoformat() if revision.updated_at else None,
+        'content': content
+    }), 200
+
 # --- TASKS ---
+TASK_FIELDS = {
+    'id': ((Task.id,), lambda t, ctx: t.id),
+    'title': ((Task.title,), lambda t, ctx: t.title),
+    'category': ((Task.category,), lambda t, ctx: t.category),
+    'due_date': ((Task.due_date,), lambda t, ctx: str(t.due_date) if t.due_date else None),
+    'due_time': ((Task.due_time,), lambda t, ctx: str(t.due_time) if t.due_time else None),
+    'status': ((Task.status, Task.is_completed), lambda t, ctx: t.status or ('completed' if t.is_completed else 'pending')),
+    'is_completed': ((Task.is_completed,), lambda t, ctx: t.is_completed),
+    'updated_at': ((Task.updated_at,), lambda t, ctx: t.updated_at.isoformat() if t.updated_at else None),
+    'labels': ((), lambda t, ctx: ctx['labels'].get(t.id, [])),
+}
+
+def tasks_query(user_id, fields):
+    query = Task.query.options(raiseload(Task.labels)).filter_by(user_id=user_id)
+    return listing.select_columns(query, Task, TASK_FIELDS, fields)
+
+def filter_tasks(query):
+    # ?from=&to= bound due_date (inclusive); status, category and label may repeat or be comma-separated
+    args = request.args
+    try:
+        start = date.fromisoformat(args['from']) if args.get('from') else None
+        end = date.fromisoformat(args['to']) if args.get('to') else None
+        label_ids = [int(v) for raw in args.getlist('label') for v in raw.split(',') if v]
+    except ValueError:
+        raise listing.ListingError('from and to must be YYYY-MM-DD and label must be label ids')
+    statuses = [v for raw in args.getlist('status') for v in raw.split(',') if v]
+    categories = args.getlist('category')
+
+    if start: query = query.filter(Task.due_date >= start)
+    if end: query = query.filter(Task.due_date <= end)
+    if statuses: query = query.filter(Task.status.in_(statuses))
+    if categories: query = query.filter(Task.category.in_(categories))
+    if label_ids:
+        query = query.filter(Task.id.in_(select(task_label.c.task_id).where(task_label.c.label_id.in_(label_ids))))
+    return query
+
+def serialize_tasks(tasks, user_id, fields):
+    # Labels of the whole batch come from one query
+    labels_by_task = {}
+    if 'labels' in fields and tasks:
+        rows = db.session.query(task_label.c.task_id, Label.id, Label.name, Label.color) \
+            .join(Label, Label.id == task_label.c.label_id) \
+            .filter(task_label.c.task_id.in_([t.id for t in tasks])).order_by(Label.id)
+        for task_id, label_id, name, color in rows:
+            labels_by_task.setdefault(task_id, []).append({'id': label_id, 'name': name, 'color': color})
+    context = {'labels': labels_by_task}
+    return [listing.serialize(t, TASK_FIELDS, fields, context) for t in tasks]
+
 @api_bp.route('/tasks', methods=['GET'])
 @require_auth
 def get_tasks():
-    tasks = Task.query.filter_by(user_id=session['user_id']).all()
-    result = [{
-        'id': t.id, 'title': t.title, 'category': t.category,
-        'due_date': str(t.due_date) if t.due_date else None,
-        'due_time': str(t.due_time) if t.due_time else None,
-        'status': t.status or ('completed' if t.is_completed else 'pending'),
-        'is_completed': t.is_completed
-    } for t in tasks]
-    return jsonify(result), 200
+    user_id = session['user_id']
+    try:
+        fields = listing.parse_fields(TASK_FIELDS)
+        query = filter_tasks(tasks_query(user_id, fields))
+        rows, next_cursor = listing.paginate(query, Task, *listing.page_args())
+    except listing.ListingError as e:
+        return jsonify({'error': str(e)}), 400
+    items = listing.serialize_in_batches(rows, lambda batch: serialize_tasks(batch, user_id, fields))
+    return listing.stream_json(items, next_cursor)
 
-@api_bp.route('/tasks', methods=['POST'])
+@api_bp.route('/tasks/summary', methods=['GET'])
 @require_auth
-def create_task():
-    data = request.get_json()
+def get_task_summary():
+    # Status, overdue, due-today and upcoming counts in one aggregate query, honouring the list filters
+    try:
+        today = date.fromisoformat(request.args['today']) if request.args.get('today') else date.today()
+        horizon = today + timedelta(days=min(max(request.args.get('days', 7, type=int), 1), 366))
+        query = filter_tasks(db.session.query(Task).filter(Task.user_id == session['user_id']))
+    except listing.ListingError as e:
+        return jsonify({'error': str(e)}), 400
+    except ValueError:
+        return jsonify({'error': 'today must be YYYY-MM-DD'}), 400
+
+    def count_where(*conditions):
+        return func.coalesce(func.sum(case((and_(*conditions), 1), else_=0)), 0)
+    is_open = Task.status != 'completed'
+    row = query.with_entities(
+        func.count(Task.id),
+        count_where(Task.status == 'pending'),
+        count_where(Task.status == 'working'),
+        count_where(Task.status == 'completed'),
+        count_where(is_open, Task.due_date < today),
+        count_where(is_open, Task.due_date == today),
+        count_where(is_open, Task.due_date > today, Task.due_date <= horizon),
+    ).one()
+    total, pending, working, completed, overdue, due_today, upcoming = row
+    return jsonify({
+        'total': total,
+        'by_status': {'pending': pending, 'working': working, 'completed': completed},
+        'overdue': overdue,
+        'due_today': due_today,
+        'upcoming': upcoming,
+        'today': today.isoformat(),
+        'upcoming_until': horizon.isoformat(),
+    }), 200
+
+def list_tasks(user_id, ids=None):
+    fields = listing.default_fields(TASK_FIELDS)
+    query = tasks_query(user_id, fields)
+    if ids is not None:
+        query = query.filter(Task.id.in_(ids))
+    return serialize_tasks(query.order_by(Task.id).all(), user_id, fields)
+
+def new_task(data, user_id):
     due_date = datetime.strptime(data['due_date'], '%Y-%m-%d').date() if data.get('due_date') else None
     due_time = datetime.strptime(data['due_time'], '%H:%M').time() if data.get('due_time') else None
     
-    task = Task(
+    status = data.get('status', 'pending')
+    return Task(
         title=data.get('title'),
         category=data.get('category', 'General'),
-        status=data.get('status', 'pending'),
+        status=status,
+        is_completed=(status == 'completed'),
         due_date=due_date,
         due_time=due_time,
-        user_id=session['user_id']
+        user_id=user_id
     )
+
+def apply_task_data(task, data):
+    if 'is_completed' in data: task.is_completed = data['is_completed']
+    if 'title' in data: task.title = data['title']
+    if 'category' in data: task.category = data['category'] or 'General'
+    if 'status' in data:
+        task.status = data['status']
+        task.is_completed = (data['status'] == 'completed')
+
+@api_bp.route('/tasks', methods=['POST'])
+@require_auth
+def create_task():
+    task = new_task(request.get_json(), session['user_id'])
     db.session.add(task)
+    db.session.flush()
+    changes.record('task', task.id, [task.user_id])
     db.session.commit()
     return jsonify({'id': task.id, 'title': task.title, 'category': task.category}), 201
 
@@ -243,28 +529,194 @@ def manage_task(task_id):
         return jsonify({'error': 'Not found'}), 404
         
     if request.method == 'DELETE':
+        changes.record('task', task.id, [task.user_id], op='delete')
         db.session.delete(task)
         db.session.commit()
         return jsonify({'message': 'Deleted'}), 200
         
-    data = request.get_json()
-    if 'is_completed' in data: task.is_completed = data['is_completed']
-    if 'title' in data: task.title = data['title']
-    if 'status' in data:
-        task.status = data['status']
-        task.is_completed = (data['status'] == 'completed')
-    
+    apply_task_data(task, request.get_json())
+    changes.record('task', task.id, [task.user_id])
     db.session.commit()
     return jsonify({'message': 'Updated'}), 200
 
+# --- BATCH ---
+BATCH_OPS = ('create', 'update', 'delete')
+BATCH_TYPES = ('task', 'note')
+
+@api_bp.route('/batch', methods=['POST'])
+@require_auth
+def run_batch():
+    """Apply many task and note creates, updates and deletes in one transaction.
+
+    Body: {"operations": [{"op": "update", "type": "task", "id": 1, "data": {...}}, ...],
+    "atomic": false}. Results come back per item, in order. Failed items are skipped,
+    unless `atomic` is set, in which case one failure rejects the whole batch.
+    """
+    user_id = session['user_id']
+    body = request.get_json(silent=True) or {}
+    operations = body.get('operations')
+    if not isinstance(operations, list) or not operations:
+        return jsonify({'error': 'operations must be a non-empty list'}), 400
+    if len(operations) > current_app.config['BATCH_MAX_OPERATIONS']:
+        return jsonify({'error': f"At most {current_app.config['BATCH_MAX_OPERATIONS']} operations per batch"}), 400
+
+    results = [None] * len(operations)
+    for i, item in enumerate(operations):
+        if not isinstance(item, dict) or item.get('op') not in BATCH_OPS or item.get('type') not in BATCH_TYPES:
+            results[i] = {'status': 400, 'error': 'Unknown op or type'}
+        elif item['op'] != 'create' and not isinstance(item.get('id'), int):
+            results[i] = {'status': 400, 'error': 'id is required'}
+        elif not isinstance(item.get('data', {}), dict):
+            results[i] = {'status': 400, 'error': 'data must be an object'}
+        elif item['type'] == 'note' and not isinstance((item.get('data') or {}).get('folder_id'), (int, type(None))):
+            results[i] = {'status': 400, 'error': 'folder_id must be an integer or null'}
+
+    # Authorization is resolved once per resource set rather than once per item
+    def ids_of(kind):
+        return {item['id'] for i, item in enumerate(operations)
+                if results[i] is None and item['type'] == kind and item['op'] != 'create'}
+    task_ids, note_ids = ids_of('task'), ids_of('note')
+    tasks = {t.id: t for t in Task.query.filter(Task.id.in_(task_ids), Task.user_id == user_id)} if task_ids else {}
+    levels = permissions.resolve_many(user_id, note_ids)
+    writable = [note_id for note_id, level in levels.items() if level in (OWNER, WRITE)]
+    notes = {n.id: n for n in Note.query.filter(Note.id.in_(writable))} if writable else {}
+    folder_ids = {(item.get('data') or {}).get('folder_id') for i, item in enumerate(operations)
+                  if results[i] is None and item['type'] == 'note'} - {None}
+    own_folders = {f for (f,) in db.session.query(Folder.id).filter(Folder.id.in_(folder_ids), Folder.user_id == user_id)} \
+        if folder_ids else set()
+    # Audiences are read before any delete takes the share rows with it
+    audiences = changes.note_audiences(notes)
+
+    created, updated, deleted = [], set(), set()
+    upload_ids = []  # of deleted notes; part files are discarded after the commit
+    for i, item in enumerate(operations):
+        if results[i] is not None:
+            continue
+        kind, op, data = item['type'], item['op'], item.get('data') or {}
+        if kind == 'note' and data.get('folder_id') not in own_folders | {None}:
+            results[i] = {'status': 404, 'error': 'Folder not found'}
+            continue
+        if op == 'create':
+            try:
+                obj = new_task(data, user_id) if kind == 'task' else new_note(data, user_id)
+            except (TypeError, ValueError) as e:
+                results[i] = {'status': 400, 'error': str(e)}
+                continue
+            db.session.add(obj)
+            created.append((i, kind, obj))
+            results[i] = {'status': 201, 'id': None}
+            continue
+
+        key = (kind, item['id'])
+        obj = tasks.get(item['id']) if kind == 'task' else notes.get(item['id'])
+        if key in deleted or (kind == 'note' and levels.get(item['id']) == MISSING):
+            obj = None
+        if obj is None or (kind == 'note' and op == 'delete' and levels[item['id']] != OWNER):
+            # Deleting a shared note is reported as missing, like DELETE /notes/<id>
+            results[i] = {'status': 404, 'error': 'Not found'}
+            continue
+        if op == 'delete':
+            if kind == 'note':
+                upload_ids += [upload.id for upload in obj.uploads]
+            db.session.delete(obj)
+            deleted.add(key)
+        elif kind == 'task':
+            apply_task_data(obj, data)
+            updated.add(key)
+        else:
+            apply_note_data(obj, data, levels[item['id']] == OWNER, user_id)
+            updated.add(key)
+        results[i] = {'status': 200, 'id': item['id']}
+
+    failed = sum(1 for r in results if r['status'] >= 400)
+    if failed and body.get('atomic'):
+        db.session.rollback()
+        return jsonify({'error': 'Batch rejected', 'results': results}), 400
+
+    db.session.flush()
+    for i, kind, obj in created:
+        results[i]['id'] = obj.id
+        if kind == 'note':
+            audiences[obj.id] = {user_id}
+        updated.add((kind, obj.id))
+
+    # Change-feed rows go out per entity and audience, not per item
+    for op, keys in (('upsert', updated - deleted), ('delete', deleted)):
+        changes.record_many('task', [i for kind, i in keys if kind == 'task'], [user_id], op=op)
+        by_audience = {}
+        for kind, note_id in keys:
+            if kind == 'note':
+                by_audience.setdefault(frozenset(audiences[note_id]), []).append(note_id)
+        for audience, ids in by_audience.items():
+            changes.record_many('note', ids, audience, op=op)
+    db.session.commit()
+    for upload_id in upload_ids:
+        blobs.discard_part(upload_id)
+    return jsonify({'results': results, 'applied': len(results) - failed}), 200
+
+# --- EXPORT / IMPORT ---
+@api_bp.route('/export', methods=['GET'])
+@require_auth
+def export_workspace():
+    compress = request.args.get('compress') == 'gzip'
+    body = archive.export_stream(session['user_id'], compress=compress,
+                                 chunk_size=current_app.config['ARCHIVE_CHUNK_SIZE'])
+    filename = f"bee-keeps-{date.today().isoformat()}.ndjson" + ('.gz' if compress else '')
+    return Response(stream_with_context(body), mimetype='application/gzip' if compress else 'application/x-ndjson',
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+@api_bp.route('/import', methods=['POST'])
+@require_auth
+def import_workspace():
+    upload = request.files.get('file')
+    stream = upload.stream if upload else request.stream
+    try:
+        counts = archive.import_stream(session['user_id'], stream,
+                                       chunk_size=current_app.config['ARCHIVE_CHUNK_SIZE'])
+    except archive.ArchiveError as e:
+        return jsonify({'error': str(e), 'line': e.line, 'imported': e.counts}), 400
+    return jsonify({'imported': counts}), 201
+
 # --- ATTACHMENTS (Google Docs/Sheets/Uploads context) ---
+# Uploaded files of these types open in the browser; anything else downloads
+INLINE_TYPES = ('image/png', 'image/jpeg', 'image/gif', 'image/webp', 'application/pdf', 'text/plain')
+_MIME_RE = re.compile(r'^[\w.+-]+/[\w.+-]+$')
+_CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+|\*)$')
+
+def attachment_etag(att):
+    # Keyed per attachment, so a download never reveals the content hash that the blob store and archives use
+    return hmac.new(current_app.secret_key.encode(), f'{att.id}:{att.blob_hash}'.encode(),
+                    hashlib.sha256).hexdigest()[:32]
+
+def attachment_json(att):
+    return {'id': att.id, 'name': att.name, 'url': att.href, 'type': att.type, 'size': att.size}
+
+def upload_type(name, declared):
+    if declared and len(declared) <= 50 and _MIME_RE.match(declared):
+        return declared.lower()
+    return mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
 @api_bp.route('/notes/<int:note_id>/attachments', methods=['POST'])
 @require_auth
 def add_attachment(note_id):
     note = Note.query.filter_by(id=note_id, user_id=session['user_id']).first()
     if not note:
         return jsonify({'error': 'Note not found'}), 404
-        
+
+    # A multipart file is stored whole; resumable uploads go through /uploads instead
+    upload = request.files.get('file')
+    if upload:
+        name = (upload.filename or 'Attachment')[:255]
+        try:
+            checksum, size = blobs.store_stream(upload.stream)
+        except BlobTooLarge as e:
+            return jsonify({'error': str(e)}), 413
+        att = FileAttachment(name=name, url='', type=upload_type(name, upload.mimetype), note_id=note.id,
+                             blob_hash=checksum, size=size)
+        db.session.add(att)
+        db.session.commit()
+        return jsonify(attachment_json(att)), 201
+
     data = request.get_json()
     att = FileAttachment(
         name=data.get('name', 'Link'),
@@ -274,4 +726,235 @@ def add_attachment(note_id):
     )
     db.session.add(att)
     db.session.commit()
-    return jsonify({'id': att.id, 'name': att.name, 'url': att.url}), 201
+    return jsonify(attachment_json(att)), 201
+
+@api_bp.route('/attachments/<int:attachment_id>', methods=['DELETE'])
+@require_auth
+def delete_attachment(attachment_id):
+    att = FileAttachment.query.join(Note).filter(
+        FileAttachment.id == attachment_id, Note.user_id == session['user_id']).first()
+    if not att:
+        return jsonify({'error': 'Not found'}), 404
+    # The blob itself goes in the next garbage-collection pass once nothing refers to it
+    db.session.delete(att)
+    db.session.commit()
+    return jsonify({'message': 'Deleted'}), 200
+
+@api_bp.route('/attachments/<int:attachment_id>/content', methods=['GET'])
+@require_auth
+def get_attachment_content(attachment_id):
+    att = db.session.get(FileAttachment, attachment_id)
+    if not att or not att.blob_hash:
+        return jsonify({'error': 'Not found'}), 404
+    access = permissions.resolve(session['user_id'], att.note_id)
+    if access in (None, MISSING):
+        return jsonify({'error': 'Not found'}), 404
+    path = blobs.path(att.blob_hash)
+    if not os.path.isfile(path):
+        return jsonify({'error': 'Attachment content is missing'}), 404
+
+    # send_file answers Range and If-None-Match/If-Range itself, and hands the open file to the
+    # server's wsgi.file_wrapper (or X-Sendfile with USE_X_SENDFILE) instead of reading it here
+    inline = att.type in INLINE_TYPES and not request.args.get('download')
+    response = send_file(path, mimetype=att.type or 'application/octet-stream', as_attachment=not inline,
+                         download_name=att.name, conditional=True, etag=attachment_etag(att), max_age=0)
+    # Access can be revoked, so browsers revalidate; a matching ETag costs a 304
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    response.headers['Content-Security-Policy'] = 'sandbox'
+    return response
+
+@api_bp.route('/notes/<int:note_id>/uploads', methods=['POST'])
+@require_auth
+def start_upload(note_id):
+    note = Note.query.filter_by(id=note_id, user_id=session['user_id']).first()
+    if not note:
+        return jsonify({'error': 'Note not found'}), 404
+    data = request.get_json() or {}
+    try:
+        size = int(data.get('size'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'size is required'}), 400
+    if size < 0:
+        return jsonify({'error': 'size is required'}), 400
+    if size > blobs.max_bytes:
+        return jsonify({'error': f'Attachments are limited to {blobs.max_bytes} bytes'}), 413
+    name = (data.get('name') or 'Attachment')[:255]
+    upload = AttachmentUpload(id=uuid.uuid4().hex, note_id=note.id, user_id=session['user_id'], name=name,
+                              type=upload_type(name, data.get('type')), size=size, received=0)
+    db.session.add(upload)
+    db.session.commit()
+    return jsonify({'id': upload.id, 'offset': 0, 'size': size}), 201
+
+@api_bp.route('/uploads/<upload_id>', methods=['GET', 'PUT', 'DELETE'])
+@require_auth
+def manage_upload(upload_id):
+    upload = AttachmentUpload.query.filter_by(id=upload_id, user_id=session['user_id']).first()
+    # The note (and with it this upload) may have been deleted since the lookup
+    if not upload or db.session.get(Note, upload.note_id) is None:
+        return jsonify({'error': 'Upload not found'}), 404
+
+    # GET tells a client where to resume after a dropped connection
+    if request.method == 'GET':
+        return jsonify({'id': upload.id, 'offset': upload.received, 'size': upload.size}), 200
+
+    if request.method == 'DELETE':
+        db.session.delete(upload)
+        db.session.commit()
+        blobs.discard_part(upload.id)
+        return jsonify({'message': 'Deleted'}), 200
+
+    # PUT appends one chunk at the offset given by Content-Range (the whole file without it)
+    start = 0
+    content_range = request.headers.get('Content-Range')
+    if content_range:
+        match = _CONTENT_RANGE_RE.match(content_range.strip())
+        if not match:
+            return jsonify({'error': 'Invalid Content-Range'}), 400
+        start = int(match.group(1))
+        if match.group(3) != '*' and int(match.group(3)) != upload.size:
+            return jsonify({'error': 'Content-Range total does not match the upload size'}), 400
+    if start != upload.received:
+        return jsonify({'error': 'Chunk does not start at the current offset', 'offset': upload.received}), 409
+
+    try:
+        written = blobs.write_part(upload.id, start, request.stream, upload.size - start)
+    except BlobTooLarge:
+        return jsonify({'error': 'Chunk runs past the declared size', 'offset': upload.received}), 413
+    # Only one request may advance the offset from `start`
+    advanced = AttachmentUpload.query.filter_by(id=upload.id, received=start) \
+        .update({'received': start + written, 'updated_at': datetime.utcnow()}, synchronize_session=False)
+    db.session.commit()
+    if not advanced:
+        db.session.refresh(upload)
+        return jsonify({'error': 'Chunk does not start at the current offset', 'offset': upload.received}), 409
+    if start + written < upload.size:
+        return jsonify({'id': upload.id, 'offset': start + written, 'size': upload.size}), 200
+
+    checksum = blobs.finish_part(upload.id)
+    att = FileAttachment(name=upload.name, url='', type=upload.type, note_id=upload.note_id,
+                         blob_hash=checksum, size=upload.size)
+    db.session.add(att)
+    db.session.delete(upload)
+    db.session.commit()
+    return jsonify(attachment_json(att)), 201
+
+# --- WORKSPACE ---
+@api_bp.route('/workspace', methods=['GET'])
+@require_auth
+def get_workspace():
+    user_id = session['user_id']
+
+    # With notes_limit only the most recently updated page of notes is included;
+    # the rest is paged in from /api/notes with the returned notes_next cursor
+    notes_limit = request.args.get('notes_limit', type=int)
+    if notes_limit is not None:
+        notes_limit = min(max(notes_limit, 1), listing.MAX_LIMIT)
+
+    # Taken before reading rows so a concurrent change can only make the tag older, never newer
+    etag = workspace.etag_for(user_id) + (f'-n{notes_limit}' if notes_limit else '')
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        notes_next = None
+        if notes_limit:
+            fields = listing.default_fields(NOTE_FIELDS)
+            rows, notes_next = listing.paginate(notes_query(user_id, fields), Note, notes_limit, descending=True)
+            notes = serialize_notes(rows, user_id, fields)
+        else:
+            notes = list_notes(user_id)
+        response = jsonify({
+            'cursor': changes.latest_cursor(user_id),
+            'folders': list_folders(user_id),
+            'notes': notes,
+            'notes_next': notes_next,
+            'tasks': list_tasks(user_id)
+        })
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+# --- CHANGES ---
+def list_labels(user_id, ids=None):
+    query = Label.query.filter_by(user_id=user_id)
+    if ids is not None:
+        query = query.filter(Label.id.in_(ids))
+    return [{'id': l.id, 'name': l.name, 'color': l.color} for l in query.all()]
+
+def list_collaborators(user_id, ids):
+    # Share entries the user can see: on notes they own, or their own membership
+    rows = db.session.query(Collaborator, User.email, User.username) \
+        .join(User, User.id == Collaborator.user_id) \
+        .join(Note, Note.id == Collaborator.note_id) \
+        .filter(Collaborator.id.in_(ids), or_(Note.user_id == user_id, Collaborator.user_id == user_id)).all()
+    return [{'id': c.id, 'note_id': c.note_id, 'email': email, 'username': username, 'permission': c.permission}
+            for c, email, username in rows]
+
+@api_bp.route('/changes', methods=['GET'])
+@require_auth
+def get_changes():
+    user_id = session['user_id']
+    since = max(request.args.get('since', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', 500, type=int), 1), 1000)
+
+    entries, has_more = changes.changes_since(user_id, since, limit)
+
+    # Load every upserted row with one query per entity type
+    loaders = {'folder': list_folders, 'note': list_notes, 'task': list_tasks,
+               'label': list_labels, 'collaborator': list_collaborators}
+    upserts = {}
+    for e in entries:
+        if e.op == 'upsert':
+            upserts.setdefault(e.entity, set()).add(e.entity_id)
+    rows = {}
+    for entity, ids in upserts.items():
+        rows[entity] = {item['id']: item for item in loaders[entity](user_id, list(ids))}
+
+    result = []
+    for e in entries:
+        data = rows.get(e.entity, {}).get(e.entity_id) if e.op == 'upsert' else None
+        # A row that vanished or is no longer visible is reported as a tombstone
+        item = {'cursor': e.id, 'entity': e.entity, 'id': e.entity_id, 'op': 'upsert' if data else 'delete'}
+        if data:
+            item['data'] = data
+        result.append(item)
+
+    cursor = entries[-1].id if entries else since
+    return jsonify({'changes': result, 'cursor': cursor, 'has_more': has_more}), 200
+
+# --- SEARCH ---
+@api_bp.route('/search', methods=['GET'])
+@require_auth
+def search_workspace():
+    if not search.is_enabled():
+        return jsonify({'error': 'Search is not available'}), 501
+
+    query = request.args.get('q', '').strip()
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+
+    results, has_more = search.search(session['user_id'], query, limit=limit, offset=offset)
+    return jsonify({'results': results, 'limit': limit, 'offset': offset, 'has_more': has_more}), 200
+
+# --- SYNC ---
+@api_bp.route('/sync/metrics', methods=['GET'])
+@require_auth
+def get_sync_metrics():
+    from writebehind import write_behind
+    return jsonify(write_behind.metrics()), 200
+
+@api_bp.route('/sync/rooms', methods=['GET'])
+@require_auth
+def get_room_metrics():
+    from fanout import fanout
+    # Per-room counters only for notes the caller can open
+    metrics = fanout.metrics()
+    metrics['rooms'] = {room: counters for room, counters in metrics['rooms'].items()
+                        if isinstance(room, int) and permissions.can_read(session['user_id'], room)}
+    return jsonify(metrics), 200
+
+@api_bp.route('/permissions/metrics', methods=['GET'])
+@require_auth
+def get_permission_metrics():
+    return jsonify(permissions.metrics()), 200
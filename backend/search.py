@@ -0,0 +1,249 @@
+"""Full-text search over notes and tasks backed by an SQLite FTS5 table.
+
+The index is kept in step with the ORM through mapper events, so every insert,
+update and delete of a Note or Task rewrites its row in the same transaction.
+Rows are keyed by rowid (note id * 2, task id * 2 + 1) so updates never scan.
+"""
+import html
+import re
+from html.parser import HTMLParser
+from sqlalchemy import column, delete, event, inspect, select, table, text
+from sqlalchemy.exc import OperationalError
+from models import db, Note, NoteBody, Task
+
+_enabled = False
+
+_search_table = table('search_index', column('rowid'))
+
+_BLOCK_TAGS = {'p', 'div', 'br', 'li', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'blockquote', 'pre', 'tr'}
+
+# Snippet markers that cannot occur in stripped text; swapped for <mark> after escaping
+_MARK_START, _MARK_END = '\x02', '\x03'
+
+
+class _TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _BLOCK_TAGS:
+            self.parts.append(' ')
+
+    def handle_endtag(self, tag):
+        if tag in _BLOCK_TAGS:
+            self.parts.append(' ')
+
+    def handle_data(self, data):
+        self.parts.append(data)
+
+
+def strip_html(value):
+    if not value:
+        return ''
+    parser = _TextExtractor()
+    parser.feed(value)
+    parser.close()
+    return re.sub(r'\s+', ' ', ''.join(parser.parts)).strip()
+
+
+def _note_rowid(note_id):
+    return note_id * 2
+
+
+def _task_rowid(task_id):
+    return task_id * 2 + 1
+
+
+def init_app(app):
+    """Create the FTS5 table if the database supports it, filling it on first creation."""
+    global _enabled
+
+    @app.cli.command('rebuild-search-index')
+    def rebuild_search_index_command():
+        """Rebuild the full-text search index from all notes and tasks."""
+        if not _enabled:
+            print('Full-text search is not available for this database')
+            return
+        count = rebuild()
+        print(f'Indexed {count} notes and tasks')
+
+    if db.engine.dialect.name != 'sqlite':
+        app.logger.info('Full-text search disabled: requires SQLite FTS5')
+        return
+    exists = db.session.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_index'"
+    )).first()
+    try:
+        db.session.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+            "kind UNINDEXED, ref_id UNINDEXED, note_id UNINDEXED, user_id UNINDEXED, "
+            "title, body, tokenize = 'porter unicode61 remove_diacritics 2')"
+        ))
+        db.session.commit()
+    except OperationalError:
+        db.session.rollback()
+        app.logger.warning('Full-text search disabled: SQLite was built without FTS5')
+        return
+    _enabled = True
+    if not exists:
+        rebuild()
+
+
+def is_enabled():
+    return _enabled
+
+
+def _index_note(connection, note_id, user_id, title, content):
+    connection.execute(text('DELETE FROM search_index WHERE rowid = :rowid'), {'rowid': _note_rowid(note_id)})
+    connection.execute(text(
+        "INSERT INTO search_index (rowid, kind, ref_id, note_id, user_id, title, body) "
+        "VALUES (:rowid, 'note', :id, :id, :user_id, :title, :body)"
+    ), {'rowid': _note_rowid(note_id), 'id': note_id, 'user_id': user_id,
+        'title': title or '', 'body': strip_html(content)})
+
+
+def _index_task(connection, task_id, user_id, title, description):
+    connection.execute(text('DELETE FROM search_index WHERE rowid = :rowid'), {'rowid': _task_rowid(task_id)})
+    connection.execute(text(
+        "INSERT INTO search_index (rowid, kind, ref_id, note_id, user_id, title, body) "
+        "VALUES (:rowid, 'task', :id, NULL, :user_id, :title, :body)"
+    ), {'rowid': _task_rowid(task_id), 'id': task_id, 'user_id': user_id,
+        'title': title or '', 'body': description or ''})
+
+
+def _notes_with_bodies(session):
+    return session.query(Note.id, Note.user_id, Note.title, NoteBody.data, NoteBody.compressed) \
+        .outerjoin(NoteBody, NoteBody.checksum == Note.body_hash)
+
+
+def index_notes(session, note_ids):
+    """Reindex notes written outside the ORM unit of work (e.g. bulk updates)."""
+    if not _enabled or not note_ids:
+        return
+    connection = session.connection()
+    rows = _notes_with_bodies(session).filter(Note.id.in_(list(note_ids)))
+    for note_id, user_id, title, data, compressed in rows:
+        _index_note(connection, note_id, user_id, title, NoteBody.unpack(data, compressed))
+
+
+def index_tasks(session, task_ids):
+    """`index_notes` for tasks inserted or updated in bulk."""
+    if not _enabled or not task_ids:
+        return
+    connection = session.connection()
+    rows = session.query(Task.id, Task.user_id, Task.title, Task.description).filter(Task.id.in_(list(task_ids)))
+    for task_id, user_id, title, description in rows:
+        _index_task(connection, task_id, user_id, title, description)
+
+
+def remove_notes(connection, note_ids):
+    """Drop index rows of notes deleted in bulk; `note_ids` is a list or a select of ids."""
+    if not _enabled:
+        return
+    if not isinstance(note_ids, (list, tuple, set)):
+        note_ids = select(note_ids.subquery().c.id * 2)
+    else:
+        note_ids = [_note_rowid(i) for i in note_ids]
+    connection.execute(delete(_search_table).where(_search_table.c.rowid.in_(note_ids)))
+
+
+def rebuild(batch_size=500):
+    """Repopulate the index from scratch; returns the number of rows indexed."""
+    if not _enabled:
+        return 0
+    connection = db.session.connection()
+    connection.execute(text('DELETE FROM search_index'))
+    count = 0
+    notes = _notes_with_bodies(db.session).yield_per(batch_size)
+    for note_id, user_id, title, data, compressed in notes:
+        _index_note(connection, note_id, user_id, title, NoteBody.unpack(data, compressed))
+        count += 1
+    tasks = db.session.query(Task.id, Task.user_id, Task.title, Task.description).yield_per(batch_size)
+    for task_id, user_id, title, description in tasks:
+        _index_task(connection, task_id, user_id, title, description)
+        count += 1
+    db.session.commit()
+    return count
+
+
+def _changed(target, *fields):
+    state = inspect(target)
+    return any(state.attrs[f].history.has_changes() for f in fields)
+
+
+# --- ORM events ---
+@event.listens_for(Note, 'after_insert')
+def _note_inserted(mapper, connection, note):
+    if _enabled:
+        _index_note(connection, note.id, note.user_id, note.title, note.content)
+
+
+@event.listens_for(Note, 'after_update')
+def _note_updated(mapper, connection, note):
+    if _enabled and _changed(note, 'title', 'body_hash'):
+        _index_note(connection, note.id, note.user_id, note.title, note.content)
+
+
+@event.listens_for(Note, 'after_delete')
+def _note_deleted(mapper, connection, note):
+    if _enabled:
+        connection.execute(text('DELETE FROM search_index WHERE rowid = :rowid'), {'rowid': _note_rowid(note.id)})
+
+
+@event.listens_for(Task, 'after_insert')
+def _task_inserted(mapper, connection, task):
+    if _enabled:
+        _index_task(connection, task.id, task.user_id, task.title, task.description)
+
+
+@event.listens_for(Task, 'after_update')
+def _task_updated(mapper, connection, task):
+    if _enabled and _changed(task, 'title', 'description'):
+        _index_task(connection, task.id, task.user_id, task.title, task.description)
+
+
+@event.listens_for(Task, 'after_delete')
+def _task_deleted(mapper, connection, task):
+    if _enabled:
+        connection.execute(text('DELETE FROM search_index WHERE rowid = :rowid'), {'rowid': _task_rowid(task.id)})
+
+
+# --- Querying ---
+def _match_expression(query):
+    # Quote every term so user input can never be parsed as FTS5 syntax; prefix-match the words
+    terms = re.findall(r'\w+', query, flags=re.UNICODE)
+    return ' '.join('"{}"*'.format(t.replace('"', '""')) for t in terms)
+
+
+def _highlight(snippet):
+    return html.escape(snippet or '', quote=False).replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>')
+
+
+def search(user_id, query, limit=20, offset=0):
+    """Return (results, has_more) ranked by BM25, limited to content the user can open."""
+    match = _match_expression(query)
+    if not match:
+        return [], False
+    rows = db.session.execute(text(
+        "SELECT kind, ref_id, note_id, "
+        "snippet(search_index, 4, :start, :end, '…', 12) AS title, "
+        "snippet(search_index, 5, :start, :end, '…', 24) AS snippet, "
+        "bm25(search_index, 0, 0, 0, 0, 10.0, 1.0) AS rank "
+        "FROM search_index "
+        "WHERE search_index MATCH :match AND ("
+        "  user_id = :user_id OR (kind = 'note' AND note_id IN "
+        "    (SELECT note_id FROM collaborator WHERE user_id = :user_id))"
+        ") ORDER BY rank LIMIT :limit OFFSET :offset"
+    ), {'match': match, 'user_id': user_id, 'limit': limit + 1, 'offset': offset,
+        'start': _MARK_START, 'end': _MARK_END}).all()
+
+    results = [{
+        'type': row.kind,
+        'id': row.ref_id,
+        'note_id': row.note_id,
+        'title': _highlight(row.title),
+        'snippet': _highlight(row.snippet),
+        'rank': row.rank,
+    } for row in rows[:limit]]
+    return results, len(rows) > limit
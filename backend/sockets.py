@@ -1,57 +1,139 @@
+from flask import request, session
 from flask_socketio import emit, join_room, leave_room
-from models import db, Note
+from delta import Delta
+from documents import documents, StaleVersionError
+from fanout import fanout
+from metrics import metrics
+from permissions import permissions
+from writebehind import write_behind
+
+def _note_id(room):
+    try:
+        return int(room)
+    except (TypeError, ValueError):
+        return None
+
+def _deny(room):
+    emit('document_error', {'document_id': room, 'error': 'Unauthorized'})
 
 def register_socket_events(socketio):
     @socketio.on('join_document')
+    @metrics.timed_event('join_document')
     def handle_join_document(data):
         room = data.get('document_id')
-        user_id = data.get('user_id')
+        # The login session travels with the socket; client-sent ids are not trusted
+        user_id = session.get('user_id')
         if not room:
             return
-            
+        if not permissions.can_read(user_id, _note_id(room)):
+            return _deny(room)
+
+        # The first editor in a room seeds the server state with the contents it loaded. Readers
+        # never do, or a read-only collaborator could replace the note for everyone
+        contents = None
+        if permissions.can_write(user_id, _note_id(room)):
+            try:
+                contents = Delta.from_json(data['contents']) if data.get('contents') else Delta()
+            except ValueError:
+                contents = Delta()
+
         join_room(room)
+        snapshot, seeded = documents.join(room, request.sid, contents)
+        if snapshot is not None:
+            # Readers already waiting in an unseeded room get the seed along with the writer
+            emit('document_snapshot', {'document_id': room, **snapshot}, to=room if seeded else None)
+        metrics.observe_room(room)
         # Notify others in room
-        emit('user_joined', {'user_id': user_id}, room=room, include_self=False)
+        fanout.presence(room, request.sid, user_id, 'joined')
 
     @socketio.on('leave_document')
+    @metrics.timed_event('leave_document')
     def handle_leave_document(data):
         room = data.get('document_id')
-        user_id = data.get('user_id')
+        user_id = session.get('user_id')
         if not room:
             return
-            
+
         leave_room(room)
-        # Notify others
-        emit('user_left', {'user_id': user_id}, room=room, include_self=False)
+        # Persist straight away once the last editor has gone
+        if documents.leave(room, request.sid):
+            fanout.close(room)
+            write_behind.flush(room)
+        else:
+            # Notify others
+            fanout.presence(room, request.sid, user_id, 'left')
+
+    @socketio.on('disconnect')
+    @metrics.timed_event('disconnect')
+    def handle_disconnect(*args):
+        user_id = session.get('user_id')
+        for room in documents.rooms_for(request.sid):
+            if documents.leave(room, request.sid):
+                fanout.close(room)
+                write_behind.flush(room)
+            else:
+                fanout.presence(room, request.sid, user_id, 'left')
+        fanout.forget(request.sid)
 
     @socketio.on('edit_document')
+    @metrics.timed_event('edit_document')
     def handle_edit_document(data):
         room = data.get('document_id')
-        content = data.get('content')
-        user_id = data.get('user_id')
-        
-        if not room or content is None:
+        user_id = session.get('user_id')
+        if not room or data.get('delta') is None:
             return
-            
-        # Broadcast changes to others in the room
-        emit('document_updated', {
-            'document_id': room,
-            'content': content,
-            'user_id': user_id
-        }, room=room, include_self=False)
-        
-        # We can also periodically save to the database here if needed.
-        # However, for simplicity and performance, the frontend usually sends a final PUT request or a debounced SAVE.
-        
+        if not permissions.can_write(user_id, _note_id(room)):
+            return _deny(room)
+        retry_after = fanout.allow(request.sid, room)
+        if retry_after:
+            # The client keeps its pending delta and resends it after the delay
+            return emit('edit_rejected', {'document_id': room, 'retry_after_ms': round(retry_after * 1000)})
+
+        try:
+            delta = Delta.from_json(data['delta'])
+        except ValueError:
+            return
+
+        try:
+            version, applied = documents.apply(room, data.get('version'), delta)
+        except StaleVersionError:
+            # The client is too far behind to rebase; resync it from the authoritative state
+            snapshot = documents.snapshot(room)
+            if snapshot:
+                emit('document_snapshot', {'document_id': room, **snapshot})
+            return
+        except ValueError:
+            # Longer than the document it claims to edit; nothing was applied
+            return
+
+        contents = documents.contents(room)
+        if contents is not None:
+            write_behind.put(room, contents, user_id)
+
+        # The ack and the rebased delta for others go out with the room's next coalesced flush
+        fanout.edit(room, request.sid, user_id, version, applied)
+
+    @socketio.on('request_snapshot')
+    @metrics.timed_event('request_snapshot')
+    def handle_request_snapshot(data):
+        room = data.get('document_id')
+        if room and not permissions.can_read(session.get('user_id'), _note_id(room)):
+            return _deny(room)
+        if room and fanout.allow(request.sid, room):
+            return
+        snapshot = documents.snapshot(room) if room else None
+        if snapshot:
+            emit('document_snapshot', {'document_id': room, **snapshot})
+
     @socketio.on('save_document')
+    @metrics.timed_event('save_document')
     def handle_save_document(data):
-        # Optional event for explicitly saving via websockets
+        # Optional event for explicitly saving via websockets; buffered like live edits
         room = data.get('document_id')
         content = data.get('content')
-        
+
         if room and content is not None:
-            note = Note.query.get(room)
-            if note:
-                note.content = content
-                db.session.commit()
-                emit('document_saved', {'document_id': room}, room=room)
+            user_id = session.get('user_id')
+            if not permissions.can_write(user_id, _note_id(room)):
+                return _deny(room)
+            write_behind.put(room, content, user_id)
@@ -0,0 +1,70 @@
+"""Engine settings per database backend.
+
+SQLite files are opened in WAL mode with `synchronous=NORMAL`, memory-mapped
+reads and a busy timeout, so readers never block the writer and concurrent
+writers wait instead of failing with "database is locked". Server databases
+(Postgres via `DATABASE_URL`) get a sized, pre-pinged connection pool instead.
+Every value can be overridden from the environment.
+"""
+import os
+from sqlalchemy import event
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def database_url(default):
+    url = os.environ.get('DATABASE_URL', default)
+    # Render and Heroku still hand out the postgres:// scheme that SQLAlchemy 2 rejects
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def sqlite_pragmas():
+    return {
+        'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'busy_timeout': _env_int('SQLITE_BUSY_TIMEOUT', 5000),  # milliseconds
+        'mmap_size': _env_int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024),  # bytes
+    }
+
+
+def engine_options(url):
+    """SQLALCHEMY_ENGINE_OPTIONS for the database at `url`."""
+    if url.startswith('sqlite'):
+        return {}
+    return {
+        'pool_size': _env_int('DB_POOL_SIZE', 10),
+        'max_overflow': _env_int('DB_MAX_OVERFLOW', 20),
+        'pool_timeout': _env_int('DB_POOL_TIMEOUT', 30),
+        'pool_recycle': _env_int('DB_POOL_RECYCLE', 1800),
+        'pool_pre_ping': True,
+    }
+
+
+def configure(app):
+    """Fill in the database URI and engine options; call before `db.init_app`."""
+    db_path = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'notes.db')
+    url = database_url(f'sqlite:///{db_path}')
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {}).update(engine_options(url))
+    app.config.setdefault('SQLITE_PRAGMAS', sqlite_pragmas())
+
+
+def apply_pragmas(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+    finally:
+        cursor.close()
+
+
+def init_app(app, engine):
+    """Run the configured pragmas on every new connection when `engine` is SQLite."""
+    pragmas = app.config.get('SQLITE_PRAGMAS') or {}
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+    event.listen(engine, 'connect', lambda dbapi_connection, record: apply_pragmas(dbapi_connection, pragmas))
@@ -0,0 +1,66 @@
+"""Per-user change counters for the workspace bootstrap ETag.
+
+Any flush that touches a folder, note, task, label or collaborator bumps the
+counter of every user whose workspace listing shows that row (the owner, plus
+collaborators for shared notes). The ETag is derived from the counter alone, so
+an unchanged workspace is answered with a 304 without loading any rows.
+"""
+from sqlalchemy import event, update
+from sqlalchemy.dialects import postgresql, sqlite
+from models import db, Folder, Note, Task, Label, Collaborator, WorkspaceVersion
+
+_TRACKED = (Folder, Note, Task, Label, Collaborator)
+
+
+def _affected_users(session, obj):
+    if isinstance(obj, Collaborator):
+        owner = session.query(Note.user_id).filter(Note.id == obj.note_id).scalar()
+        return {obj.user_id, owner}
+    users = {obj.user_id}
+    if isinstance(obj, Note) and obj.id is not None:
+        users.update(uid for (uid,) in session.query(Collaborator.user_id).filter(Collaborator.note_id == obj.id))
+    return users
+
+
+def bump(connection, user_ids):
+    """Atomically increment the counters of `user_ids`, creating missing rows."""
+    user_ids = sorted(u for u in user_ids if u is not None)
+    if not user_ids:
+        return
+    dialect = connection.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        stmt = insert(WorkspaceVersion).values([{'user_id': u, 'version': 1} for u in user_ids])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[WorkspaceVersion.user_id],
+            set_={'version': WorkspaceVersion.version + 1}
+        )
+        connection.execute(stmt)
+        return
+    connection.execute(
+        update(WorkspaceVersion)
+        .where(WorkspaceVersion.user_id.in_(user_ids))
+        .values(version=WorkspaceVersion.version + 1)
+    )
+
+
+@event.listens_for(db.session, 'after_flush')
+def _track_workspace_changes(session, flush_context):
+    changed = [o for o in session.new if isinstance(o, _TRACKED)]
+    changed += [o for o in session.deleted if isinstance(o, _TRACKED)]
+    changed += [o for o in session.dirty if isinstance(o, _TRACKED) and session.is_modified(o)]
+    if not changed:
+        return
+    users = set()
+    with session.no_autoflush:
+        for obj in changed:
+            users.update(_affected_users(session, obj))
+    bump(session.connection(), users)
+
+
+def current_version(user_id):
+    return db.session.query(WorkspaceVersion.version).filter_by(user_id=user_id).scalar() or 0
+
+
+def etag_for(user_id):
+    return f'ws-{user_id}-{current_version(user_id)}'
@@ -0,0 +1,172 @@
+"""Server-owned write-behind buffer for collaborative note content.
+
+Edits stream in through the socket handlers and only the newest state per note is
+kept. A background task flushes every dirty note in one transaction each interval,
+and a room is flushed immediately when its last editor leaves.
+"""
+import atexit
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import update
+from models import db, Note
+from delta import Delta, to_html
+from search import index_notes
+from bodies import store, collect_garbage
+import changes
+import revisions
+import workspace
+from documents import documents
+
+
+class WriteBehindBuffer:
+    def __init__(self):
+        self.app = None
+        self.socketio = None
+        self.interval = 2.0
+        self._pending = {}  # note_id -> {'room', 'content', 'user_id', 'dirty_since', 'updates'}
+        self._lock = threading.Lock()
+        self._started = False
+        self.stats = {
+            'flushes': 0,
+            'notes_written': 0,
+            'updates_received': 0,
+            'updates_coalesced': 0,
+            'flush_errors': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+        }
+
+    def init_app(self, app, socketio):
+        self.app = app
+        self.socketio = socketio
+        self.interval = float(app.config.get('WRITE_BEHIND_INTERVAL', 2.0))
+        if not self._started:
+            self._started = True
+            socketio.start_background_task(self._run)
+            atexit.register(self.shutdown)
+
+    def put(self, room, content, user_id=None):
+        """Record the latest content (a Delta or an HTML string) for a note, and who wrote it."""
+        try:
+            note_id = int(room)
+        except (TypeError, ValueError):
+            return
+        with self._lock:
+            self.stats['updates_received'] += 1
+            entry = self._pending.get(note_id)
+            if entry:
+                self.stats['updates_coalesced'] += 1
+                entry['content'] = content
+                entry['user_id'] = user_id
+                entry['updates'] += 1
+            else:
+                self._pending[note_id] = {'room': room, 'content': content, 'user_id': user_id,
+                                          'dirty_since': time.monotonic(), 'updates': 1}
+
+    def metrics(self):
+        with self._lock:
+            now = time.monotonic()
+            oldest = min((e['dirty_since'] for e in self._pending.values()), default=None)
+            return {
+                **self.stats,
+                'pending_notes': len(self._pending),
+                # Edits younger than this are the most that a crash could lose
+                'oldest_pending_ms': round((now - oldest) * 1000, 1) if oldest is not None else 0.0,
+                'interval_s': self.interval,
+            }
+
+    def shutdown(self):
+        """Force out everything still buffered; registered to run at interpreter exit."""
+        return self.flush(notify=False)
+
+    def flush(self, room=None, notify=True):
+        """Write pending content to the database in a single transaction.
+
+        With `room`, only that note is flushed (used when a room empties).
+        """
+        with self._lock:
+            if room is None:
+                batch, self._pending = self._pending, {}
+            else:
+                try:
+                    entry = self._pending.pop(int(room), None)
+                except (TypeError, ValueError):
+                    entry = None
+                batch = {int(room): entry} if entry else {}
+        if not batch or self.app is None:
+            return 0
+
+        started = time.perf_counter()
+        now = datetime.utcnow()
+        rows = []
+        for note_id, entry in batch.items():
+            content = entry['content']
+            if isinstance(content, Delta):
+                # Another worker may have applied newer edits to a shared room; prefer the live state
+                content = to_html(documents.contents(entry['room']) or content)
+            rows.append({'id': note_id, 'content': content, 'updated_at': now})
+
+        with self.app.app_context():
+            try:
+                existing = dict(db.session.query(Note.id, Note.body_hash).filter(Note.id.in_(list(batch))))
+                rows = [r for r in rows if r['id'] in existing]
+                if rows:
+                    # Revisions go first: a note without history is seeded from its stored content
+                    for row in rows:
+                        revisions.record(db.session, row['id'], row['content'],
+                                         user_id=batch[row['id']].get('user_id'), now=now)
+                    connection = db.session.connection()
+                    checksums = store(connection, [r['content'] for r in rows])
+                    db.session.execute(update(Note), [
+                        {'id': r['id'], 'body_hash': checksums[r['content']], 'updated_at': r['updated_at']} for r in rows
+                    ])
+                    collect_garbage(connection, [existing[r['id']] for r in rows])
+                    # Bulk updates bypass ORM events, so keep the search index, change feed
+                    # and workspace counters in step here
+                    index_notes(db.session, [r['id'] for r in rows])
+                    by_audience = {}
+                    for note_id, users in changes.note_audiences([r['id'] for r in rows]).items():
+                        by_audience.setdefault(frozenset(users), []).append(note_id)
+                    for users, ids in by_audience.items():
+                        changes.record_many('note', ids, users)
+                    workspace.bump(connection, {u for users in by_audience for u in users})
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                self._requeue(batch)
+                with self._lock:
+                    self.stats['flush_errors'] += 1
+                self.app.logger.exception('Write-behind flush failed for %d notes', len(batch))
+                return 0
+            finally:
+                db.session.remove()
+
+        elapsed = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self.stats['flushes'] += 1
+            self.stats['notes_written'] += len(rows)
+            self.stats['last_flush_ms'] = round(elapsed, 2)
+            self.stats['max_flush_ms'] = max(self.stats['max_flush_ms'], round(elapsed, 2))
+
+        if notify and self.socketio:
+            for row in rows:
+                self.socketio.emit('document_saved', {'document_id': batch[row['id']]['room']}, room=batch[row['id']]['room'])
+        return len(rows)
+
+    def _requeue(self, batch):
+        # Put failed entries back unless a newer edit already replaced them
+        with self._lock:
+            for note_id, entry in batch.items():
+                self._pending.setdefault(note_id, entry)
+
+    def _run(self):
+        while True:
+            self.socketio.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                self.app.logger.exception('Write-behind flush loop error')
+
+
+write_behind = WriteBehindBuffer()
@@ -258,9 +258,37 @@ function toggleAuthForm(e) {
 
 document.getElementById('logout-btn').addEventListener('click', handleLogout);
 
+// Account archive: export is a plain download, import uploads the file as is
+const importFileInput = document.getElementById('import-file');
+document.getElementById('import-btn').addEventListener('click', () => importFileInput.click());
+importFileInput.addEventListener('change', async () => {
+    const file = importFileInput.files[0];
+    importFileInput.value = '';
+    if (!file) return;
+    const form = new FormData();
+    form.append('file', file);
+    try {
+        const res = await fetch(`${API_BASE}/import`, { method: 'POST', body: form, credentials: 'include' });
+        const data = await res.json();
+        if (!res.ok) {
+            alert(`Import stopped at line ${data.line}: ${data.error}`);
+        } else {
+            const { note, task, folder } = data.imported;
+            alert(`Imported ${note} notes, ${task} tasks and ${folder} folders.`);
+        }
+    } catch (error) {
+        alert('Server connection error.');
+    }
+    // Imported rows arrive through the change feed, including chunks kept before a failure
+    loadWorkspaceData();
+});
+
 async function handleLogout() {
     await fetch(`${AUTH_BASE}/logout`, { method: 'POST', credentials: 'include' });
     currentUser = null;
+    workspaceEtag = null;
+    syncCursor = null;
+    notesNextCursor = null;
     showAuth();
 }
 
@@ -291,25 +319,111 @@ function getGreeting() {
 }
 
 // Data Loading
+// The first load fetches the whole workspace (conditionally, by ETag); after that only
+// the changes since the last sync cursor are pulled and merged into local state
+let workspaceEtag = null;
+let syncCursor = null;
+
+// Notes are paged in as the user scrolls, newest first
+const NOTES_PAGE_SIZE = 60;
+let notesNextCursor = null;
+let loadingMoreNotes = false;
+let showingAllNotes = false;
 async function loadWorkspaceData() {
-    // Load Folders
-    currentFolders = await apiCall('/folders') || [];
-    renderFolders();
+    if (syncCursor !== null) return syncWorkspaceChanges();
 
-    // Load Notes
-    currentNotes = await apiCall('/notes') || [];
-    renderRecentNotes();
+    const headers = {};
+    if (workspaceEtag) headers['If-None-Match'] = workspaceEtag;
 
-    // Load Tasks
-    currentTasks = await apiCall('/tasks') || [];
+    let response;
+    try {
+        response = await fetch(`${API_BASE}/workspace?notes_limit=${NOTES_PAGE_SIZE}`, { headers, credentials: 'include', cache: 'no-store' });
+    } catch (error) {
+        console.error('API Error:', error);
+        return;
+    }
+    if (response.status === 401) return handleLogout();
+    if (response.status === 304) return;
+    if (!response.ok) return;
+
+    const data = await response.json();
+    workspaceEtag = response.headers.get('ETag');
+    syncCursor = data.cursor;
+    notesNextCursor = data.notes_next;
+    currentFolders = data.folders || [];
+    currentNotes = data.notes || [];
+    currentTasks = data.tasks || [];
+
+    renderFolders();
+    renderRecentNotes();
     renderTasks();
 }
 
+async function loadMoreNotes() {
+    if (!notesNextCursor || loadingMoreNotes) return;
+    loadingMoreNotes = true;
+    try {
+        const params = `limit=${NOTES_PAGE_SIZE}&order=desc&after=${encodeURIComponent(notesNextCursor)}`;
+        const response = await fetch(`${API_BASE}/notes?${params}`, { credentials: 'include' });
+        if (!response.ok) return;
+        const page = await response.json();
+        notesNextCursor = response.headers.get('X-Next-Cursor');
+
+        // The change feed may already have delivered some of these
+        const known = new Set(currentNotes.map(n => n.id));
+        const fresh = page.filter(n => !known.has(n.id));
+        currentNotes.push(...fresh);
+        if (showingAllNotes) appendNoteCards(fresh);
+    } catch (error) {
+        console.error('API Error:', error);
+    } finally {
+        loadingMoreNotes = false;
+    }
+}
+
+const notesSentinel = document.getElementById('notes-sentinel');
+if (notesSentinel && 'IntersectionObserver' in window) {
+    new IntersectionObserver(entries => {
+        if (entries.some(e => e.isIntersecting)) loadMoreNotes();
+    }, { rootMargin: '400px' }).observe(notesSentinel);
+}
+
+async function syncWorkspaceChanges() {
+    const collections = { folder: 'folders', note: 'notes', task: 'tasks' };
+    const touched = new Set();
+    let hasMore = true;
+
+    while (hasMore) {
+        const res = await apiCall(`/changes?since=${syncCursor}`);
+        if (!res || res.error) return;
+
+        res.changes.forEach(change => {
+            const key = collections[change.entity];
+            if (!key) return; // labels and share entries arrive embedded in their notes
+            const list = { folders: currentFolders, notes: currentNotes, tasks: currentTasks }[key];
+            const index = list.findIndex(item => item.id === change.id);
+            if (change.op === 'delete') {
+                if (index !== -1) list.splice(index, 1);
+            } else if (index !== -1) {
+                list[index] = change.data;
+            } else {
+                list.push(change.data);
+            }
+            touched.add(key);
+        });
+        syncCursor = res.cursor;
+        hasMore = res.has_more;
+    }
+
+    if (touched.has('folders')) renderFolders();
+    if (touched.has('folders') || touched.has('notes')) renderRecentNotes();
+    if (touched.has('tasks')) renderTasks();
+}
+
 function renderFolders() {
     const list = document.getElementById('sidebar-folders');
     list.innerHTML = '';
 
-    // Helper to render recursively
     function renderFolderNode(folder, depth = 0) {
         const li = document.createElement('li');
         li.className = 'folder-item';
@@ -351,17 +465,28 @@ function renderFolders() {
         });
 
         list.appendChild(li);
-
-        // Render children
-        const children = currentFolders.filter(f => f.parent_id === folder.id);
-        children.forEach(c => renderFolderNode(c, depth + 1));
     }
 
-    const rootFolders = currentFolders.filter(f => !f.parent_id);
-    rootFolders.forEach(f => renderFolderNode(f, 0));
+    // Children grouped once, then walked with an explicit stack so deep trees cannot overflow
+    const known = new Set(currentFolders.map(f => f.id));
+    const childrenOf = new Map();
+    currentFolders.forEach(f => {
+        const parent = known.has(f.parent_id) ? f.parent_id : null;
+        if (!childrenOf.has(parent)) childrenOf.set(parent, []);
+        childrenOf.get(parent).push(f);
+    });
+
+    const stack = (childrenOf.get(null) || []).slice().reverse().map(f => [f, 0]);
+    while (stack.length) {
+        const [folder, depth] = stack.pop();
+        renderFolderNode(folder, depth);
+        const children = childrenOf.get(folder.id) || [];
+        for (let i = children.length - 1; i >= 0; i--) stack.push([children[i], depth + 1]);
+    }
 }
 
 function renderSpecificNotes(notesToRender) {
+    showingAllNotes = false;
     const grid = document.getElementById('recent-notes');
     grid.innerHTML = '';
     if (notesToRender.length === 0) {
@@ -369,6 +494,13 @@ function renderSpecificNotes(notesToRender) {
         return;
     }
 
+    appendNoteCards(notesToRender);
+}
+
+function appendNoteCards(notesToRender) {
+    const grid = document.getElementById('recent-notes');
+    grid.querySelector('.note-card-placeholder')?.remove();
+
     notesToRender.forEach(note => {
         const card = document.createElement('div');
         card.className = 'note-card glass-panel';
@@ -402,6 +534,7 @@ function renderSpecificNotes(notesToRender) {
                 </div>
                 <div>
                     ${note.is_owner ? `
+                    <input type="checkbox" class="note-select" title="Select" ${selectedNoteIds.has(note.id) ? 'checked' : ''}>
                     <button class="icon-btn move-note-btn" title="Move Note" style="padding: 4px;" data-id="${note.id}">
                         <i class="ph ph-arrows-out-line-horizontal"></i>
                     </button>
@@ -414,7 +547,7 @@ function renderSpecificNotes(notesToRender) {
         `;
         card.addEventListener('click', (e) => {
             // Prevent opening editor if clicking action buttons or link
-            if (e.target.closest('.delete-note-btn') || e.target.closest('.move-note-btn') || e.target.tagName.toLowerCase() === 'a') return;
+            if (e.target.closest('.delete-note-btn') || e.target.closest('.move-note-btn') || e.target.closest('.note-select') || e.target.tagName.toLowerCase() === 'a') return;
 
             if (note.note_type === 'link') {
                 window.open(note.link_url, '_blank');
@@ -432,6 +565,14 @@ function renderSpecificNotes(notesToRender) {
             }
         });
 
+        const selectBox = card.querySelector('.note-select');
+        if (selectBox) {
+            selectBox.addEventListener('change', () => {
+                if (selectBox.checked) selectedNoteIds.add(note.id);
+                else selectedNoteIds.delete(note.id);
+            });
+        }
+
         const moveBtn = card.querySelector('.move-note-btn');
         if (moveBtn) {
             moveBtn.addEventListener('click', (e) => {
@@ -446,6 +587,7 @@ function renderSpecificNotes(notesToRender) {
 
 // Move Item Logic
 let movingNoteId = null;
+const selectedNoteIds = new Set();
 function openMoveModal(noteId) {
     movingNoteId = noteId;
     const select = document.getElementById('move-target-folder');
@@ -475,10 +617,13 @@ document.getElementById('confirm-move-item').addEventListener('click', async ()
         folder_id: targetFolderId ? parseInt(targetFolderId) : null
     };
 
-    const res = await apiCall(`/notes/${movingNoteId}`, 'PUT', payload);
+    // Moving one of the selected notes moves the whole selection in one request
+    const ids = selectedNoteIds.has(movingNoteId) ? [...selectedNoteIds] : [movingNoteId];
+    const res = await runBatch(ids.map(id => ({ op: 'update', type: 'note', id, data: payload })));
     if (res && !res.error) {
         document.getElementById('move-item-modal').classList.add('hidden');
         movingNoteId = null;
+        selectedNoteIds.clear();
         await loadWorkspaceData();
     } else {
         alert("Failed to move item.");
@@ -487,14 +632,75 @@ document.getElementById('confirm-move-item').addEventListener('click', async ()
 
 function renderRecentNotes() {
     renderSpecificNotes(currentNotes);
+    showingAllNotes = true;
+}
+
+// Many creates, updates and deletes in one request and one transaction
+async function runBatch(operations) {
+    if (operations.length === 0) return { results: [], applied: 0 };
+    const res = await apiCall('/batch', 'POST', { operations });
+    if (res && res.applied < operations.length) {
+        console.warn('Batch partially applied:', res.results.filter(r => r.status >= 400));
+    }
+    return res;
+}
+
+const selectedTaskIds = new Set();
+
+function renderTaskBulkBar() {
+    const bar = document.getElementById('task-bulk-bar');
+    if (!bar) return;
+    bar.style.display = selectedTaskIds.size ? 'flex' : 'none';
+    bar.querySelector('.task-bulk-count').textContent = `${selectedTaskIds.size} selected`;
+}
+
+async function applyToSelectedTasks(operationFor) {
+    const ops = [...selectedTaskIds].map(operationFor);
+    selectedTaskIds.clear();
+    await runBatch(ops);
+    loadWorkspaceData();
+}
+
+async function moveTasksToCategory(taskId, category) {
+    // Dragging a selected task carries the rest of the selection with it
+    const ids = selectedTaskIds.has(taskId) ? [...selectedTaskIds] : [taskId];
+    const ops = ids
+        .filter(id => (currentTasks.find(t => t.id === id)?.category || 'General') !== category)
+        .map(id => ({ op: 'update', type: 'task', id, data: { category } }));
+    if (ops.length === 0) return;
+    selectedTaskIds.clear();
+    await runBatch(ops);
+    loadWorkspaceData();
 }
 
 function renderTasks() {
     const dashboardContainer = document.getElementById('dashboard-tasks');
     dashboardContainer.innerHTML = '';
 
+    const known = new Set(currentTasks.map(t => t.id));
+    [...selectedTaskIds].forEach(id => { if (!known.has(id)) selectedTaskIds.delete(id); });
+
+    const bar = document.createElement('div');
+    bar.id = 'task-bulk-bar';
+    bar.style.cssText = 'display: none; gap: 8px; align-items: center; margin-bottom: 10px; font-size: 13px;';
+    bar.innerHTML = `
+        <span class="task-bulk-count" style="flex: 1; color: var(--text-secondary);"></span>
+        <button class="icon-btn" data-status="pending" title="Mark pending">⏳</button>
+        <button class="icon-btn" data-status="working" title="Mark working">🔨</button>
+        <button class="icon-btn" data-status="completed" title="Mark completed">✅</button>
+        <button class="icon-btn" data-action="delete" title="Delete selected"><i class="ph ph-trash"></i></button>
+    `;
+    bar.querySelectorAll('[data-status]').forEach(btn => btn.addEventListener('click', () =>
+        applyToSelectedTasks(id => ({ op: 'update', type: 'task', id, data: { status: btn.dataset.status } }))));
+    bar.querySelector('[data-action="delete"]').addEventListener('click', () => {
+        if (confirm(`Delete ${selectedTaskIds.size} tasks?`)) {
+            applyToSelectedTasks(id => ({ op: 'delete', type: 'task', id }));
+        }
+    });
+    dashboardContainer.appendChild(bar);
+
     if (currentTasks.length === 0) {
-        dashboardContainer.innerHTML = '<div class="task-item-placeholder">No tasks found. Create one!</div>';
+        dashboardContainer.insertAdjacentHTML('beforeend', '<div class="task-item-placeholder">No tasks found. Create one!</div>');
         renderTaskChart();
         return;
     }
@@ -514,16 +720,30 @@ function renderTasks() {
     };
 
     for (const [category, tasks] of Object.entries(tasksByCategory)) {
+        // Each category is a drop target; dropping a task files it (and the selection) there
+        const group = document.createElement('div');
+        group.className = 'task-group';
+        group.addEventListener('dragover', (e) => e.preventDefault());
+        group.addEventListener('drop', (e) => {
+            e.preventDefault();
+            const taskId = parseInt(e.dataTransfer.getData('text/plain'));
+            if (taskId) moveTasksToCategory(taskId, category);
+        });
+        dashboardContainer.appendChild(group);
+
         const catHeader = document.createElement('h4');
         catHeader.textContent = category;
         catHeader.style.cssText = 'margin: 15px 0 10px; color: var(--accent-primary); font-size: 13px; letter-spacing: 1px; text-transform: uppercase;';
-        dashboardContainer.appendChild(catHeader);
+        group.appendChild(catHeader);
 
         tasks.forEach(task => {
             const status = task.status || 'pending';
             const el = document.createElement('div');
             el.className = 'task-item glass-panel';
+            el.draggable = true;
+            el.addEventListener('dragstart', (e) => e.dataTransfer.setData('text/plain', String(task.id)));
             el.innerHTML = `
+                <input type="checkbox" class="task-select" title="Select" style="margin-top: 4px;" ${selectedTaskIds.has(task.id) ? 'checked' : ''}>
                 <div class="task-status-btn" onclick="cycleTaskStatus(${task.id}, '${status}')" title="Click to change status" style="cursor:pointer; font-size:18px; min-width:28px; text-align:center;">${statusIcons[status] || '⏳'}</div>
                 <div class="task-info" style="flex:1;">
                     <div class="task-title" style="${status === 'completed' ? 'text-decoration: line-through; color: var(--text-secondary);' : ''}">${task.title}</div>
@@ -535,10 +755,16 @@ function renderTasks() {
                 </div>
                 <button class="icon-btn" onclick="deleteTask(${task.id})"><i class="ph ph-trash"></i></button>
             `;
-            dashboardContainer.appendChild(el);
+            el.querySelector('.task-select').addEventListener('change', (e) => {
+                if (e.target.checked) selectedTaskIds.add(task.id);
+                else selectedTaskIds.delete(task.id);
+                renderTaskBulkBar();
+            });
+            group.appendChild(el);
         });
     }
 
+    renderTaskBulkBar();
     renderTaskChart();
 }
 
@@ -780,13 +1006,13 @@ navItems.forEach(item => {
         if (target === 'dashboard') {
             document.getElementById('tasks-section-title').textContent = 'My Tasks';
             document.getElementById('greeting-msg').textContent = `Good ${getGreeting()}, ${currentUser.username.split(' ')[0]}`;
-            renderSpecificNotes(currentNotes);
+            renderRecentNotes();
             document.getElementById('new-task-btn').parentElement.style.display = 'flex';
             document.getElementById('dashboard-tasks').style.display = 'block';
         }
         else if (target === 'notes') {
             document.getElementById('greeting-msg').textContent = 'All Notes';
-            renderSpecificNotes(currentNotes);
+            renderRecentNotes();
             document.getElementById('new-task-btn').parentElement.style.display = 'none';
             document.getElementById('dashboard-tasks').style.display = 'none';
         }
@@ -819,11 +1045,52 @@ document.getElementById('new-folder-btn').addEventListener('click', async () =>
     if (name) {
         // Optionally pass parent_id for subfolders
         await apiCall('/folders', 'POST', { name, parent_id: null });
-        currentFolders = await apiCall('/folders') || [];
-        renderFolders();
+        await loadWorkspaceData();
     }
 });
 
+// Search (server-side full-text over notes and tasks)
+let searchTimeout = null;
+document.getElementById('global-search').addEventListener('input', (e) => {
+    const query = e.target.value.trim();
+    clearTimeout(searchTimeout);
+    searchTimeout = setTimeout(async () => {
+        if (!query) {
+            renderRecentNotes();
+            return;
+        }
+        const res = await apiCall(`/search?q=${encodeURIComponent(query)}&limit=30`);
+        renderSearchResults(res && res.results ? res.results : []);
+    }, 250);
+});
+
+function renderSearchResults(results) {
+    const grid = document.getElementById('recent-notes');
+    grid.innerHTML = '';
+    document.getElementById('recent-notes').parentElement.style.display = 'block';
+    if (results.length === 0) {
+        grid.innerHTML = '<div class="note-card-placeholder">No matches found.</div>';
+        return;
+    }
+
+    // Titles and snippets arrive HTML-escaped with <mark> around matched terms
+    results.forEach(r => {
+        const card = document.createElement('div');
+        card.className = 'note-card glass-panel';
+        card.innerHTML = `
+            <div class="note-title">
+                ${r.type === 'task' ? '<i class="ph ph-check-square" style="margin-right: 5px; color: var(--accent-secondary);"></i>' : '<i class="ph ph-file-text" style="margin-right: 5px; color: var(--accent-primary);"></i>'}
+                ${r.title || 'Untitled'}
+            </div>
+            <div class="note-excerpt">${r.snippet || ''}</div>
+        `;
+        if (r.type === 'note') {
+            card.addEventListener('click', () => openNote(r.note_id));
+        }
+        grid.appendChild(card);
+    });
+}
+
 // Note Opening stub (Implementation in editor.js)
 function openNote(id) {
     if (window.openEditorForNote) window.openEditorForNote(id);
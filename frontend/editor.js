@@ -4,6 +4,18 @@ let socket = null;
 let currentNoteId = null;
 let typingTimeout = null;
 
+// Collaborative editing state: the server version we are based on, the delta
+// awaiting acknowledgement and local edits made while waiting for it
+const Delta = Quill.import('delta');
+let docVersion = null;
+let pendingDelta = null;
+let bufferedDelta = null;
+
+// Acks and remote updates arrive in coalesced batches, possibly from different workers;
+// they are applied strictly in version order, keyed by the version they build on
+let queuedEvents = new Map();
+let gapTimer = null;
+
 const editorTitle = document.getElementById('editor-title');
 const syncStatus = document.getElementById('sync-status');
 const embedsContainer = document.getElementById('embeds-container');
@@ -13,6 +25,10 @@ const shareModal = document.getElementById('share-modal');
 const quill = new Quill('#note-editor', {
     theme: 'snow',
     placeholder: 'Start typing your premium note...',
+    // Live edits are saved as HTML rendered on the server (delta.py to_html), which knows
+    // only these formats; anything else pasted in would be dropped when the note is saved
+    formats: ['header', 'bold', 'italic', 'underline', 'strike', 'link', 'image',
+              'blockquote', 'code-block', 'list', 'indent', 'align'],
     modules: {
         toolbar: [
             [{ 'header': [1, 2, 3, false] }],
@@ -50,7 +66,8 @@ window.openEditorForNote = async function (id) {
 
     // Connect Socket
     if (!socket) {
-        socket = io('http://127.0.0.1:5000');
+        // Same origin, websocket first: no long-polling handshake, so any worker can take the connection
+        socket = io({ transports: ['websocket', 'polling'] });
 
         socket.on('connect', () => {
             console.log('Connected to socket server');
@@ -60,30 +77,128 @@ window.openEditorForNote = async function (id) {
             showNotification(`User ${data.user_id} joined the document.`);
         });
 
-        socket.on('document_updated', (data) => {
-            if (data.document_id == currentNoteId && data.user_id !== (currentUser ? currentUser.id : 'Anonymous')) {
-                // Save selection, replace content, restore selection
-                const selection = quill.getSelection();
-                quill.root.innerHTML = data.content;
-                if (selection) {
-                    quill.setSelection(selection.index, selection.length);
-                }
+        socket.on('document_snapshot', (data) => {
+            if (data.document_id != currentNoteId) return;
+            const selection = quill.getSelection();
+            quill.setContents(new Delta(data.delta), 'silent');
+            if (selection) {
+                quill.setSelection(selection.index, selection.length, 'silent');
             }
+            docVersion = data.version;
+            pendingDelta = null;
+            bufferedDelta = null;
+            queuedEvents.clear();
+            clearTimeout(gapTimer);
+        });
+
+        socket.on('edit_ack', (data) => receiveInOrder(applyAck, data));
+        socket.on('document_updated', (data) => receiveInOrder(applyRemote, data));
+
+        socket.on('edit_rejected', (data) => {
+            if (data.document_id != currentNoteId) return;
+            // Rate limited: resend the same pending delta once the server has room again
+            setTimeout(resendPending, data.retry_after_ms || 100);
+        });
+
+        socket.on('document_error', (data) => {
+            if (data.document_id != currentNoteId) return;
+            // Access was refused (e.g. the note was unshared); stop sending live edits
+            docVersion = null;
+            showNotification(data.error || 'Live editing unavailable');
+        });
+
+        socket.on('document_saved', (data) => {
+            if (data.document_id == currentNoteId) syncStatus.textContent = 'Saved';
+        });
+
+        // Rejoin the room after a dropped connection
+        socket.io.on('reconnect', () => {
+            if (currentNoteId) joinDocument(currentNoteId);
         });
     }
 
     // Join room
+    joinDocument(id);
+};
+
+function joinDocument(id) {
+    docVersion = null;
+    pendingDelta = null;
+    bufferedDelta = null;
+    queuedEvents.clear();
     socket.emit('join_document', {
         document_id: id,
+        user_id: currentUser ? currentUser.id : 'Anonymous',
+        contents: quill.getContents()
+    });
+}
+
+function sendDelta(delta) {
+    pendingDelta = delta;
+    socket.emit('edit_document', {
+        document_id: currentNoteId,
+        version: docVersion,
+        delta: delta,
         user_id: currentUser ? currentUser.id : 'Anonymous'
     });
-};
+}
+
+function receiveInOrder(apply, data) {
+    if (data.document_id != currentNoteId || docVersion === null) return;
+    // Already covered by a snapshot
+    if (data.base_version < docVersion) return;
+    queuedEvents.set(data.base_version, { apply, data });
+    while (queuedEvents.has(docVersion)) {
+        const next = queuedEvents.get(docVersion);
+        queuedEvents.delete(docVersion);
+        next.apply(next.data);
+    }
+    // A gap that does not fill shortly means something was lost; resync from the server
+    clearTimeout(gapTimer);
+    if (queuedEvents.size) gapTimer = setTimeout(requestSnapshot, 1000);
+}
+
+function applyAck(data) {
+    docVersion = data.version;
+    pendingDelta = null;
+    if (bufferedDelta) {
+        sendDelta(bufferedDelta);
+        bufferedDelta = null;
+    }
+}
+
+function applyRemote(data) {
+    docVersion = data.version;
+
+    // Rebase the remote delta over our unacknowledged edits (server ops win ties)
+    let remote = new Delta(data.delta);
+    if (pendingDelta) {
+        const rebased = remote.transform(pendingDelta, true);
+        remote = pendingDelta.transform(remote, false);
+        pendingDelta = rebased;
+    }
+    if (bufferedDelta) {
+        const rebased = remote.transform(bufferedDelta, true);
+        remote = bufferedDelta.transform(remote, false);
+        bufferedDelta = rebased;
+    }
+    quill.updateContents(remote, 'api');
+}
+
+function resendPending() {
+    if (socket && currentNoteId && docVersion !== null && pendingDelta) sendDelta(pendingDelta);
+}
+
+function requestSnapshot() {
+    socket.emit('request_snapshot', { document_id: currentNoteId });
+}
 
 document.getElementById('close-editor').addEventListener('click', () => {
     if (socket && currentNoteId) {
         socket.emit('leave_document', { document_id: currentNoteId });
     }
     currentNoteId = null;
+    docVersion = null;
 
     document.getElementById('editor-view').classList.add('hidden');
     document.getElementById('workspace-view').classList.remove('hidden');
@@ -96,15 +211,18 @@ quill.on('text-change', (delta, oldDelta, source) => {
         const content = quill.root.innerHTML;
         syncStatus.textContent = 'Saving...';
 
-        // Emit to other users
-        if (socket && currentNoteId) {
-            socket.emit('edit_document', {
-                document_id: currentNoteId,
-                content: content,
-                user_id: currentUser ? currentUser.id : 'Anonymous'
-            });
+        // Emit only the delta; edits made while one is in flight are composed and sent on ack
+        if (socket && currentNoteId && docVersion !== null) {
+            if (pendingDelta) {
+                bufferedDelta = bufferedDelta ? bufferedDelta.compose(delta) : delta;
+            } else {
+                sendDelta(delta);
+            }
         }
 
+        // While in a live session the server persists edits itself and reports document_saved
+        if (docVersion !== null) return;
+
         // Debounce save to database
         clearTimeout(typingTimeout);
         typingTimeout = setTimeout(async () => {
@@ -217,11 +335,82 @@ document.getElementById('add-embed-btn').addEventListener('click', async () => {
     }
 });
 
+// File attachments: sent in chunks so a dropped connection resumes instead of starting over
+const UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024;
+const attachFileInput = document.getElementById('attach-file-input');
+document.getElementById('attach-file-btn').addEventListener('click', () => attachFileInput.click());
+attachFileInput.addEventListener('change', async () => {
+    const file = attachFileInput.files[0];
+    attachFileInput.value = '';
+    if (!file || !currentNoteId) return;
+    const noteId = currentNoteId;
+    const upload = await apiCall(`/notes/${noteId}/uploads`, 'POST', { name: file.name, type: file.type, size: file.size });
+    if (!upload || !upload.id) {
+        showNotification((upload && upload.error) || 'Upload failed');
+        return;
+    }
+    let offset = 0;
+    let retries = 0;
+    while (true) {
+        const end = Math.min(offset + UPLOAD_CHUNK_SIZE, file.size);
+        let res;
+        try {
+            res = await fetch(`${API_BASE}/uploads/${upload.id}`, {
+                method: 'PUT',
+                credentials: 'include',
+                headers: { 'Content-Range': `bytes ${offset}-${Math.max(end - 1, 0)}/${file.size}` },
+                body: file.slice(offset, end)
+            });
+        } catch (error) {
+            res = null;
+        }
+        if (res && res.status === 201) break;
+        if (res && res.ok) {
+            offset = (await res.json()).offset;
+            retries = 0;
+            continue;
+        }
+        // Ask the server how far it got, then carry on from there
+        if (++retries > 5) {
+            showNotification('Upload failed');
+            return;
+        }
+        const status = await apiCall(`/uploads/${upload.id}`);
+        if (!status || status.offset === undefined) {
+            showNotification('Upload failed');
+            return;
+        }
+        offset = status.offset;
+    }
+    if (noteId === currentNoteId) {
+        const note = await apiCall(`/notes/${noteId}`);
+        renderEmbeds(note.attachments);
+    }
+});
+
 function renderEmbeds(attachments) {
     embedsContainer.innerHTML = '';
     if (!attachments || attachments.length === 0) return;
 
     attachments.forEach(att => {
+        if (att.size !== null && att.size !== undefined) {
+            const link = document.createElement('a');
+            link.className = 'embed-file';
+            link.href = att.url;
+            link.target = '_blank';
+            link.rel = 'noopener';
+            if (att.type && att.type.startsWith('image/')) {
+                const img = document.createElement('img');
+                img.src = att.url;
+                img.alt = att.name;
+                link.appendChild(img);
+            }
+            const label = document.createElement('span');
+            label.textContent = att.name;
+            link.appendChild(label);
+            embedsContainer.appendChild(link);
+            return;
+        }
         const frame = document.createElement('iframe');
         frame.className = 'embed-frame';
         frame.src = att.url;
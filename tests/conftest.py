@@ -0,0 +1,46 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+
+@pytest.fixture
+def make_app(tmp_path, monkeypatch):
+    """Build app instances over one fresh SQLite file; call again for a second instance."""
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setenv('ATTACHMENT_DIR', str(tmp_path / 'attachments'))
+    monkeypatch.setenv('SECRET_KEY', 'test')
+    monkeypatch.setenv('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
+    # Background passes stay off; tests drive everything explicitly
+    monkeypatch.setenv('REVISION_THIN_INTERVAL', '0')
+    monkeypatch.setenv('ATTACHMENT_GC_INTERVAL', '0')
+    monkeypatch.setenv('ASSET_PIPELINE', '0')
+    from app import create_app
+    from permissions import permissions
+
+    def make():
+        app = create_app()
+        app.config['TESTING'] = True
+        return app
+
+    permissions.clear()
+    yield make
+    permissions.clear()
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+@pytest.fixture
+def login(app):
+    """A logged-in test client for a new user called `name`."""
+    def login(name):
+        client = app.test_client()
+        client.post('/auth/register', json={'username': name, 'email': f'{name}@example.com', 'password': 'secret'})
+        client.post('/auth/login', json={'email': f'{name}@example.com', 'password': 'secret'})
+        return client
+    return login
@@ -0,0 +1,38 @@
+import json
+
+import pytest
+
+HEADER = {'type': 'bee-keeps-export', 'version': 1}
+END = {'type': 'end'}
+
+
+def ndjson(*records):
+    return ''.join(json.dumps(r) + '\n' for r in records).encode()
+
+
+def test_export_round_trips(login):
+    source, target = login('source'), login('target')
+    source.post('/api/notes', json={'title': 'kept', 'content': '<p>body</p>'})
+    archive = source.get('/api/export').data
+
+    response = target.post('/api/import', data=archive)
+    assert response.status_code == 201
+    assert response.get_json()['imported']['note'] == 1
+    assert [n['title'] for n in target.get('/api/notes').get_json()] == ['kept']
+
+
+@pytest.mark.parametrize('record', [
+    {'type': 'note', 'title': 'x', 'attachments': ['not an object']},
+    {'type': 'note', 'title': 'x', 'content': ['not', 'a', 'string']},
+    {'type': 'note', 'title': 'x', 'labels': [{'id': 1}]},
+    {'type': 'task', 'title': 'x', 'due_date': 20240101},
+    {'type': 'folder', 'name': {'nested': True}},
+])
+def test_malformed_record_is_reported_with_its_line(login, record):
+    client = login('owner')
+    good = {'type': 'note', 'id': 1, 'title': 'first'}
+    response = client.post('/api/import', data=ndjson(HEADER, good, record, END))
+    assert response.status_code == 400
+    body = response.get_json()
+    assert body['line'] == 3
+    assert body['imported']['note'] == 0
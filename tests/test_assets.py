@@ -0,0 +1,27 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from assets import minify_js
+
+FRONTEND = os.path.join(os.path.dirname(__file__), '..', 'frontend')
+
+
+def test_regex_literals_survive_minification():
+    source = 's.replace(/"/g, "&quot;"); const url = "http://example.com";\n'
+    assert minify_js(source) == source
+    assert minify_js('x = /a\\//g; var y = 1; // note\n') == 'x = /a\\//g; var y = 1;\n'
+    assert minify_js('z = [/[/]/, a / b / c]\n') == 'z = [/[/]/, a / b / c]\n'
+
+
+@pytest.mark.skipif(shutil.which('node') is None, reason='node is not installed')
+@pytest.mark.parametrize('name', sorted(n for n in os.listdir(FRONTEND) if n.endswith('.js')))
+def test_minified_frontend_scripts_parse(name, tmp_path):
+    with open(os.path.join(FRONTEND, name)) as f:
+        minified = minify_js(f.read())
+    path = tmp_path / name
+    path.write_text(minified)
+    result = subprocess.run(['node', '--check', str(path)], capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
@@ -0,0 +1,24 @@
+def test_batch_rejects_malformed_folder_id(login):
+    client = login('owner')
+    folder_id = client.post('/api/folders', json={'name': 'inbox'}).get_json()['id']
+
+    response = client.post('/api/batch', json={'operations': [
+        {'op': 'create', 'type': 'note', 'data': {'title': 'list', 'folder_id': [folder_id]}},
+        {'op': 'create', 'type': 'note', 'data': {'title': 'object', 'folder_id': {'id': folder_id}}},
+        {'op': 'create', 'type': 'note', 'data': {'title': 'filed', 'folder_id': folder_id}},
+    ]})
+
+    assert response.status_code == 200
+    results = response.get_json()['results']
+    assert [r['status'] for r in results] == [400, 400, 201]
+    assert response.get_json()['applied'] == 1
+
+
+def test_batch_rejects_foreign_folder(login):
+    owner, other = login('owner'), login('other')
+    folder_id = owner.post('/api/folders', json={'name': 'private'}).get_json()['id']
+
+    response = other.post('/api/batch', json={'operations': [
+        {'op': 'create', 'type': 'note', 'data': {'title': 'sneaky', 'folder_id': folder_id}},
+    ]})
+    assert response.get_json()['results'][0]['status'] == 404
@@ -0,0 +1,75 @@
+import os
+import re
+
+import pytest
+
+from delta import Delta, to_html
+
+EDITOR_JS = os.path.join(os.path.dirname(__file__), '..', 'frontend', 'editor.js')
+
+# One document per editor format, and the HTML Quill 1.3 itself produces for it
+RENDERED = {
+    'header': ([{'insert': 'Title'}, {'insert': '\n', 'attributes': {'header': 2}}], '<h2>Title</h2>'),
+    'bold': ([{'insert': 'b', 'attributes': {'bold': True}}, {'insert': '\n'}], '<p><strong>b</strong></p>'),
+    'italic': ([{'insert': 'i', 'attributes': {'italic': True}}, {'insert': '\n'}], '<p><em>i</em></p>'),
+    'underline': ([{'insert': 'u', 'attributes': {'underline': True}}, {'insert': '\n'}], '<p><u>u</u></p>'),
+    'strike': ([{'insert': 's', 'attributes': {'strike': True}}, {'insert': '\n'}], '<p><s>s</s></p>'),
+    'link': ([{'insert': 'x', 'attributes': {'link': 'https://example.com'}}, {'insert': '\n'}],
+             '<p><a href="https://example.com" target="_blank">x</a></p>'),
+    'image': ([{'insert': {'image': 'https://example.com/a.png'}}, {'insert': '\n'}],
+              '<p><img src="https://example.com/a.png"></p>'),
+    'blockquote': ([{'insert': 'q'}, {'insert': '\n', 'attributes': {'blockquote': True}}],
+                   '<blockquote>q</blockquote>'),
+    'code-block': ([{'insert': 'a < b'}, {'insert': '\n', 'attributes': {'code-block': True}}],
+                   '<pre class="ql-syntax" spellcheck="false">a &lt; b\n</pre>'),
+    'list': ([{'insert': 'one'}, {'insert': '\n', 'attributes': {'list': 'ordered'}},
+              {'insert': 'two'}, {'insert': '\n', 'attributes': {'list': 'bullet'}},
+              {'insert': 'todo'}, {'insert': '\n', 'attributes': {'list': 'checked'}}],
+             '<ol><li>one</li></ol><ul><li>two</li></ul><ul data-checked="true"><li>todo</li></ul>'),
+    'indent': ([{'insert': 'x'}, {'insert': '\n', 'attributes': {'list': 'bullet', 'indent': 2}}],
+               '<ul><li class="ql-indent-2">x</li></ul>'),
+    'align': ([{'insert': 'x'}, {'insert': '\n', 'attributes': {'align': 'center'}}],
+              '<p class="ql-align-center">x</p>'),
+}
+
+
+def editor_formats():
+    with open(EDITOR_JS) as f:
+        match = re.search(r'formats:\s*\[([^\]]*)\]', f.read())
+    return re.findall(r"'([\w-]+)'", match.group(1))
+
+
+def test_every_editor_format_is_rendered():
+    assert sorted(editor_formats()) == sorted(RENDERED)
+    for name in editor_formats():
+        ops, expected = RENDERED[name]
+        assert to_html(Delta.from_json({'ops': ops})) == expected, name
+
+
+@pytest.mark.parametrize('attributes', [
+    {'indent': 'abc'}, {'indent': 99}, {'header': [1]}, {'header': 9},
+    {'list': 'sideways'}, {'align': {'x': 1}}, {'bold': 'yes'}, {'link': 5},
+])
+def test_invalid_attribute_values_are_rejected(attributes):
+    with pytest.raises(ValueError):
+        Delta.from_json({'ops': [{'insert': 'x'}, {'insert': '\n', 'attributes': attributes}]})
+
+
+def test_attributes_can_be_cleared():
+    delta = Delta.from_json({'ops': [{'retain': 1, 'attributes': {'header': None, 'bold': None}}]})
+    assert delta.ops == [{'retain': 1, 'attributes': {'header': None, 'bold': None}}]
+
+
+def test_stored_bad_values_still_render():
+    delta = Delta([{'insert': 'x'}, {'insert': '\n', 'attributes': {'indent': 'abc', 'header': [1]}}])
+    assert to_html(delta) == '<p>x</p>'
+
+
+def test_delta_longer_than_the_document_is_rejected():
+    from documents import DocumentRegistry
+    registry = DocumentRegistry()
+    registry.join('1', 'sid', Delta().insert('hi\n'))
+    with pytest.raises(ValueError):
+        registry.apply('1', 0, Delta().retain(2).delete(5))
+    assert registry.apply('1', 0, Delta().retain(2).insert('!'))[0] == 1
+    assert registry.snapshot('1') == {'version': 1, 'delta': {'ops': [{'insert': 'hi!\n'}]}}
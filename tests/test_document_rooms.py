@@ -0,0 +1,128 @@
+"""Two app instances sharing document rooms through `RedisDocumentRegistry`.
+
+Both instances run in this process over one SQLite file, and each has its own
+Redis connection to one fakeredis server. That is the same shape as two workers
+behind a load balancer. Socket events for an instance run with that instance's
+registry installed, so every read of room state goes through Redis.
+"""
+from contextlib import contextmanager
+
+import pytest
+
+fakeredis = pytest.importorskip('fakeredis')
+
+import redis  # noqa: E402  (installed with fakeredis)
+
+import documents  # noqa: E402
+from app import socketio  # noqa: E402
+from delta import Delta  # noqa: E402
+
+
+class Instance:
+    def __init__(self, app, registry):
+        self.app = app
+        self.registry = registry
+
+    @contextmanager
+    def active(self):
+        previous = documents.documents.backend
+        documents.documents.backend = self.registry
+        try:
+            yield
+        finally:
+            documents.documents.backend = previous
+
+    def login(self, name):
+        client = self.app.test_client()
+        client.post('/auth/register', json={'username': name, 'email': f'{name}@example.com', 'password': 'secret'})
+        client.post('/auth/login', json={'email': f'{name}@example.com', 'password': 'secret'})
+        return client
+
+    def connect(self, client):
+        with self.active():
+            return socketio.test_client(self.app, flask_test_client=client)
+
+    def emit(self, socket, event, data):
+        with self.active():
+            socket.emit(event, data)
+            return socket.get_received()
+
+
+@pytest.fixture
+def instances(make_app, monkeypatch):
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(redis.Redis, 'from_url', classmethod(lambda cls, url, **kw: fakeredis.FakeRedis(server=server)))
+    monkeypatch.setenv('DOCUMENT_STORE_URL', 'redis://documents/0')
+    pair = []
+    for _ in range(2):
+        app = make_app()
+        assert isinstance(documents.documents.backend, documents.RedisDocumentRegistry)
+        pair.append(Instance(app, documents.documents.backend))
+    yield pair
+    documents.configure(None)
+
+
+def snapshots(received):
+    return [m['args'][0] for m in received if m['name'] == 'document_snapshot']
+
+
+def members(registry, room):
+    return {raw.decode() for raw in registry.redis.smembers(registry._key(room, 'members'))}
+
+
+def test_join_and_edit_converge_across_instances(instances):
+    first, second = instances
+    owner, editor = first.login('owner'), second.login('editor')
+    note_id = owner.post('/api/notes', json={'title': 'shared', 'content': '<p>hello</p>'}).get_json()['id']
+    owner.post(f'/api/notes/{note_id}/share', json={'email': 'editor@example.com', 'permission': 'write'})
+    room = str(note_id)
+
+    owner_socket = first.connect(owner)
+    editor_socket = second.connect(editor)
+    joined = first.emit(owner_socket, 'join_document', {'document_id': room, 'contents': {'ops': [{'insert': 'hello\n'}]}})
+    assert snapshots(joined)[0]['delta'] == {'ops': [{'insert': 'hello\n'}]}
+
+    # The second instance finds the room already seeded and serves the first instance's state
+    joined = second.emit(editor_socket, 'join_document', {'document_id': room, 'contents': {'ops': [{'insert': 'stale\n'}]}})
+    snapshot = snapshots(joined)[0]
+    assert snapshot == {'document_id': room, 'version': 0, 'delta': {'ops': [{'insert': 'hello\n'}]}}
+
+    second.emit(editor_socket, 'edit_document', {
+        'document_id': room, 'version': 0, 'delta': {'ops': [{'retain': 5}, {'insert': ' world'}]},
+    })
+    expected = Delta([{'insert': 'hello world\n'}])
+    assert first.registry.contents(room) == expected
+    assert second.registry.contents(room) == expected
+    assert first.registry.snapshot(room)['version'] == second.registry.snapshot(room)['version'] == 1
+
+    # An edit against the old version sent to the first instance is rebased over the second's
+    first.emit(owner_socket, 'edit_document', {
+        'document_id': room, 'version': 0, 'delta': {'ops': [{'insert': '> '}]},
+    })
+    expected = Delta([{'insert': '> hello world\n'}])
+    assert first.registry.contents(room) == second.registry.contents(room) == expected
+
+
+def test_membership_after_leave_is_shared(instances):
+    first, second = instances
+    owner, reader = first.login('owner'), second.login('reader')
+    note_id = owner.post('/api/notes', json={'title': 'shared', 'content': '<p>hi</p>'}).get_json()['id']
+    owner.post(f'/api/notes/{note_id}/share', json={'email': 'reader@example.com', 'permission': 'read'})
+    room = str(note_id)
+
+    owner_socket = first.connect(owner)
+    reader_socket = second.connect(reader)
+    first.emit(owner_socket, 'join_document', {'document_id': room, 'contents': {'ops': [{'insert': 'hi\n'}]}})
+    second.emit(reader_socket, 'join_document', {'document_id': room})
+    assert len(members(first.registry, room)) == 2
+    assert members(first.registry, room) == members(second.registry, room)
+
+    second.emit(reader_socket, 'leave_document', {'document_id': room})
+    assert len(members(first.registry, room)) == 1
+    assert members(first.registry, room) == members(second.registry, room)
+    (sid,) = members(second.registry, room)
+    assert first.registry.rooms_for(sid) == second.registry.rooms_for(sid) == [note_id]
+
+    # The last member leaving through the other instance empties the room for both
+    first.emit(owner_socket, 'leave_document', {'document_id': room})
+    assert members(first.registry, room) == members(second.registry, room) == set()
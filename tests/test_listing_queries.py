@@ -0,0 +1,63 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from models import db
+
+
+@contextmanager
+def count_statements(app):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def shared_notes(owner, count, collaborators):
+    for i in range(count):
+        note_id = owner.post('/api/notes', json={'title': f'note {i}', 'content': f'<p>{i}</p>'}).get_json()['id']
+        for email in collaborators:
+            owner.post(f'/api/notes/{note_id}/share', json={'email': email, 'permission': 'read'})
+
+
+def listing_statements(app, client):
+    with count_statements(app) as statements:
+        response = client.get('/api/notes')
+        assert response.status_code == 200
+        notes = response.get_json()
+    return len(statements), notes
+
+
+def test_note_listing_query_count_is_constant(app, login):
+    login('alice'), login('bob')
+    one, many = login('one'), login('many')
+    shared_notes(one, 1, ['alice@example.com', 'bob@example.com'])
+    shared_notes(many, 25, ['alice@example.com', 'bob@example.com'])
+
+    single, notes = listing_statements(app, one)
+    assert len(notes) == 1
+    several, notes = listing_statements(app, many)
+    assert len(notes) == 25
+    assert several == single, (single, several)
+
+
+def test_shared_with_me_listing_query_count_is_constant(app, login):
+    reader = login('reader')
+    owners = [login(f'owner{i}') for i in range(6)]
+    shared_notes(owners[0], 1, ['reader@example.com'])
+    baseline, notes = listing_statements(app, reader)
+    assert len(notes) == 1
+
+    for owner in owners:
+        shared_notes(owner, 4, ['reader@example.com'])
+    grown, notes = listing_statements(app, reader)
+    assert len(notes) == 25
+    assert grown == baseline
@@ -0,0 +1,69 @@
+import os
+
+import pytest
+
+from models import db, Collaborator, Note
+
+
+def share(owner, title, email):
+    note_id = owner.post('/api/notes', json={'title': title, 'content': '<p>x</p>'}).get_json()['id']
+    assert owner.post(f'/api/notes/{note_id}/share', json={'email': email, 'permission': 'write'}).status_code < 300
+    return note_id
+
+
+def assert_gone(app, note_id):
+    with app.app_context():
+        assert db.session.get(Note, note_id) is None
+        assert Collaborator.query.filter_by(note_id=note_id).count() == 0
+
+
+def test_delete_shared_note(app, login):
+    owner, guest = login('owner'), login('guest')
+    note_id = share(owner, 'shared', 'guest@example.com')
+
+    assert owner.delete(f'/api/notes/{note_id}').status_code == 200
+    assert_gone(app, note_id)
+    assert guest.get(f'/api/notes/{note_id}').status_code == 404
+
+
+def test_batch_delete_shared_note(app, login):
+    owner, guest = login('owner'), login('guest')
+    note_id = share(owner, 'shared', 'guest@example.com')
+
+    response = owner.post('/api/batch', json={'operations': [{'op': 'delete', 'type': 'note', 'id': note_id}]})
+    assert response.status_code == 200
+    assert response.get_json()['results'] == [{'status': 200, 'id': note_id}]
+    assert_gone(app, note_id)
+    assert guest.get(f'/api/notes/{note_id}').status_code == 404
+
+
+def start_upload(client, note_id):
+    upload_id = client.post(f'/api/notes/{note_id}/uploads', json={'name': 'a.txt', 'size': 10}).get_json()['id']
+    response = client.put(f'/api/uploads/{upload_id}', data=b'hello', headers={'Content-Range': 'bytes 0-4/10'})
+    assert response.get_json()['offset'] == 5
+    return upload_id
+
+
+def assert_upload_gone(app, upload_id):
+    from blobs import blobs
+    from models import AttachmentUpload
+    with app.app_context():
+        assert db.session.get(AttachmentUpload, upload_id) is None
+    assert not os.path.exists(blobs.part_path(upload_id))
+
+
+@pytest.mark.parametrize('how', ['note', 'batch', 'folder'])
+def test_delete_discards_uploads_in_progress(app, login, how):
+    owner = login('owner')
+    folder_id = owner.post('/api/folders', json={'name': 'f'}).get_json()['id']
+    note_id = owner.post('/api/notes', json={'title': 't', 'content': '', 'folder_id': folder_id}).get_json()['id']
+    upload_id = start_upload(owner, note_id)
+
+    if how == 'note':
+        assert owner.delete(f'/api/notes/{note_id}').status_code == 200
+    elif how == 'batch':
+        owner.post('/api/batch', json={'operations': [{'op': 'delete', 'type': 'note', 'id': note_id}]})
+    else:
+        assert owner.delete(f'/api/folders/{folder_id}').get_json()['notes'] == 1
+    assert_upload_gone(app, upload_id)
+    assert owner.get(f'/api/uploads/{upload_id}').status_code == 404
@@ -0,0 +1,30 @@
+from models import db, Collaborator
+from permissions import permissions, WRITE
+
+
+def test_grant_cached_between_flush_and_commit_is_dropped_on_commit(app, login):
+    owner, guest = login('owner'), login('guest')
+    note_id = owner.post('/api/notes', json={'title': 'shared', 'content': ''}).get_json()['id']
+    owner.post(f'/api/notes/{note_id}/share', json={'email': 'guest@example.com', 'permission': 'write'})
+
+    with app.app_context():
+        collab = Collaborator.query.filter_by(note_id=note_id).one()
+        guest_id = collab.user_id
+        db.session.delete(collab)
+        db.session.flush()
+        # Another request, not seeing the uncommitted delete, resolves and caches the old grant
+        permissions._store((guest_id, note_id), WRITE)
+        db.session.commit()
+    assert guest.get(f'/api/notes/{note_id}').status_code == 403
+
+
+def test_rollback_forgets_pending_invalidations(app, login):
+    owner = login('owner')
+    note_id = owner.post('/api/notes', json={'title': 'mine', 'content': ''}).get_json()['id']
+
+    with app.app_context():
+        db.session.add(Collaborator(note_id=note_id, user_id=99, permission='read'))
+        db.session.flush()
+        assert note_id in db.session.info['permission_invalidations']
+        db.session.rollback()
+        assert 'permission_invalidations' not in db.session.info
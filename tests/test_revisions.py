@@ -0,0 +1,37 @@
+import pytest
+
+import revisions
+
+
+@pytest.mark.parametrize('base, content', [
+    ('x < y', 'x < y z'),
+    ('<p>a <b</p>', '<p>a <b c</p>'),
+    ('1 < 2 and 3 > 2', '1 < 2 and 4 > 2 <'),
+])
+def test_diff_rebuilds_text_with_bare_angle_brackets(base, content):
+    assert revisions.apply_diff(base, revisions.make_diff(base, content)) == content
+
+
+def test_revision_history_keeps_bare_angle_brackets(login):
+    client = login('owner')
+    base = '<p>x < y</p>' + '<p>words and more words</p>' * 50
+    note_id = client.post('/api/notes', json={'title': 'maths', 'content': base}).get_json()['id']
+    client.put(f'/api/notes/{note_id}', json={'content': base + '<p>z</p>'})
+
+    history = client.get(f'/api/notes/{note_id}/revisions').get_json()['revisions']
+    assert [r['kind'] for r in history] == ['diff', 'snapshot']
+    contents = [client.get(f'/api/notes/{note_id}/revisions/{r["id"]}').get_json()['content'] for r in history]
+    assert contents == [base + '<p>z</p>', base]
+
+
+def test_revision_failing_its_checksum_is_not_served(app, login):
+    from models import db, NoteRevision
+    client = login('owner')
+    note_id = client.post('/api/notes', json={'title': 't', 'content': '<p>one</p>'}).get_json()['id']
+    client.put(f'/api/notes/{note_id}', json={'content': '<p>two</p>'})
+    revision_id = client.get(f'/api/notes/{note_id}/revisions').get_json()['revisions'][0]['id']
+    with app.app_context():
+        db.session.get(NoteRevision, revision_id).checksum = '0' * 40
+        db.session.commit()
+    response = client.get(f'/api/notes/{note_id}/revisions/{revision_id}')
+    assert response.status_code == 500
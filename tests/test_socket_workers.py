@@ -0,0 +1,144 @@
+"""Two worker processes sharing rooms through `SOCKETIO_MESSAGE_QUEUE`.
+
+Each worker is a separate Python process running the app under eventlet, as
+gunicorn's eventlet worker does (started with the load-test harness's server
+mode). Both point their message queue and document store at one Redis server,
+here a fakeredis TCP server in the test process. An edit sent to worker A must
+reach a client connected only to worker B, which it can do only through the queue.
+"""
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+fakeredis = pytest.importorskip('fakeredis')
+socketio_client = pytest.importorskip('socketio')
+requests = pytest.importorskip('requests')
+pytest.importorskip('websocket')
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+from benchmarks.load import free_port, start_server  # noqa: E402
+
+
+@pytest.fixture
+def redis_url():
+    server = fakeredis.TcpFakeServer(('127.0.0.1', 0), server_type='redis')
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    # The TCP front end sometimes drops a connection midway through a multi-line command such as
+    # SCRIPT LOAD, so the lock scripts the registry runs are loaded in-process beforehand
+    from redis.lock import Lock
+    direct = fakeredis.FakeRedis(server=server.fake_server)
+    for script in (Lock.LUA_RELEASE_SCRIPT, Lock.LUA_EXTEND_SCRIPT, Lock.LUA_REACQUIRE_SCRIPT):
+        direct.script_load(script)
+    host, port = server.server_address
+    yield f'redis://{host}:{port}/0'
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def workers(tmp_path, monkeypatch, redis_url):
+    monkeypatch.setenv('SOCKETIO_MESSAGE_QUEUE', redis_url)
+    monkeypatch.setenv('SECRET_KEY', 'test')
+    monkeypatch.setenv('ATTACHMENT_DIR', str(tmp_path / 'attachments'))
+    monkeypatch.setenv('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
+    monkeypatch.setenv('ATTACHMENT_GC_INTERVAL', '0')
+    monkeypatch.setenv('ASSET_PIPELINE', '0')
+    db_path = str(tmp_path / 'test.db')
+    processes, urls = [], []
+    try:
+        # One at a time, so only the first creates the schema
+        for _ in range(2):
+            port = free_port()
+            processes.append(start_server(db_path, port))
+            urls.append(f'http://127.0.0.1:{port}')
+        yield urls
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait(10)
+
+
+def login(base, name):
+    session = requests.Session()
+    session.post(f'{base}/auth/register', json={'username': name, 'email': f'{name}@example.com', 'password': 'secret'})
+    session.post(f'{base}/auth/login', json={'email': f'{name}@example.com', 'password': 'secret'}).raise_for_status()
+    return session
+
+
+def wait_for_subscribers(url, count, timeout=10):
+    """Workers subscribe to the queue on their first connection; emits before that are lost."""
+    import redis
+    connection = redis.Redis.from_url(url)
+    deadline = time.monotonic() + timeout
+    while dict(connection.pubsub_numsub('bee-keeps')).get(b'bee-keeps', 0) < count:
+        assert time.monotonic() < deadline, f'fewer than {count} workers subscribed to the queue'
+        time.sleep(0.05)
+
+
+class Client:
+    """A websocket connection to one worker, collecting the room events it receives."""
+
+    def __init__(self, base, session):
+        self.events = []
+        self.arrived = threading.Condition()
+        self.sio = socketio_client.Client(reconnection=False)
+        for name in ('document_snapshot', 'document_updated', 'edit_ack', 'document_error'):
+            self.sio.on(name, self._collector(name))
+        cookies = '; '.join(f'{k}={v}' for k, v in session.cookies.items())
+        self.sio.connect(base, headers={'Cookie': cookies}, transports=['websocket'])
+
+    def _collector(self, name):
+        def collect(data):
+            with self.arrived:
+                self.events.append((name, data))
+                self.arrived.notify_all()
+        return collect
+
+    def wait_for(self, name, timeout=10):
+        with self.arrived:
+            self.arrived.wait_for(lambda: any(n == name for n, _ in self.events), timeout)
+            for index, (n, data) in enumerate(self.events):
+                if n == name:
+                    del self.events[index]
+                    return data
+        raise AssertionError(f'no {name} within {timeout}s; received {self.events}')
+
+    def close(self):
+        self.sio.disconnect()
+
+
+def test_edit_on_one_worker_reaches_a_client_on_the_other(workers, redis_url):
+    first, second = workers
+    owner, editor = login(first, 'owner'), login(second, 'editor')
+    note_id = owner.post(f'{first}/api/notes', json={'title': 'shared', 'content': '<p>hello</p>'}).json()['id']
+    owner.post(f'{first}/api/notes/{note_id}/share',
+               json={'email': 'editor@example.com', 'permission': 'write'}).raise_for_status()
+
+    on_first, on_second = Client(first, owner), Client(second, editor)
+    try:
+        wait_for_subscribers(redis_url, 2)
+        on_first.sio.emit('join_document', {'document_id': note_id, 'contents': {'ops': [{'insert': 'hello\n'}]}})
+        assert on_first.wait_for('document_snapshot')['version'] == 0
+        on_second.sio.emit('join_document', {'document_id': note_id})
+        snapshot = on_second.wait_for('document_snapshot')
+        assert snapshot['delta'] == {'ops': [{'insert': 'hello\n'}]}
+
+        on_first.sio.emit('edit_document', {'document_id': note_id, 'version': 0,
+                                            'delta': {'ops': [{'retain': 5}, {'insert': ' world'}]}})
+        assert on_first.wait_for('edit_ack')['version'] == 1
+        update = on_second.wait_for('document_updated')
+        assert (update['base_version'], update['version']) == (0, 1)
+        assert update['delta'] == {'ops': [{'retain': 5}, {'insert': ' world'}]}
+
+        # And back the other way
+        on_second.sio.emit('edit_document', {'document_id': note_id, 'version': 1, 'delta': {'ops': [{'insert': '> '}]}})
+        assert on_second.wait_for('edit_ack')['version'] == 2
+        assert on_first.wait_for('document_updated')['delta'] == {'ops': [{'insert': '> '}]}
+    finally:
+        on_first.close()
+        on_second.close()
@@ -0,0 +1,23 @@
+from writebehind import write_behind
+
+
+def test_flush_reaches_workspace_etag_and_change_feed(login):
+    owner, guest = login('owner'), login('guest')
+    note_id = owner.post('/api/notes', json={'title': 'shared', 'content': '<p>old</p>'}).get_json()['id']
+    owner.post(f'/api/notes/{note_id}/share', json={'email': 'guest@example.com', 'permission': 'write'})
+
+    before = {}
+    for name, client in (('owner', owner), ('guest', guest)):
+        workspace = client.get('/api/workspace?notes_limit=10')
+        before[name] = (workspace.headers['ETag'], workspace.get_json()['cursor'])
+
+    write_behind.put(str(note_id), '<p>new</p>', user_id=None)
+    assert write_behind.flush(notify=False) == 1
+
+    for name, client in (('owner', owner), ('guest', guest)):
+        etag, cursor = before[name]
+        workspace = client.get('/api/workspace?notes_limit=10', headers={'If-None-Match': etag})
+        assert workspace.status_code == 200, name
+        assert workspace.get_json()['notes'][0]['id'] == note_id
+        feed = client.get(f'/api/changes?since={cursor}').get_json()
+        assert [(c['entity'], c['id'], c['op']) for c in feed['changes']] == [('note', note_id, 'upsert')], name